@@ -47,6 +47,23 @@ import { v4 as uuidv4 } from "uuid";
 //   // "waiting",
 // ];
 
+// Clips packed into audio sprites (invoke pack-audio-sprites) are referred to as a
+// segment of the sprite, "sprites/<hash>.mp3#t=start,end" with times in seconds
+interface AudioSegment {
+  filename: string;
+  start: number;
+  end: number | undefined;
+}
+
+export function parseAudioSegment(audioFilename: string): AudioSegment {
+  const [filename, fragment] = audioFilename.split("#");
+  const match = /^t=([\d.]+),([\d.]+)$/.exec(fragment || "");
+  if (!match) {
+    return { filename, start: 0, end: undefined };
+  }
+  return { filename, start: parseFloat(match[1]), end: parseFloat(match[2]) };
+}
+
 class AudioPoolElement {
   audio: HTMLAudioElement;
   free: boolean;
@@ -107,6 +124,10 @@ export class AudioEngine {
 
   private backgroundAudioPool: AudioPool = new AudioPool(5);
 
+  // Warms the clips we are likely to need next, see invoke prefetch-manifest
+  private prefetchAudioPool: AudioPool = new AudioPool(3);
+  private prefetchManifest: { [stationId: string]: string[] } = {};
+
   private backgroundTimeouts: {
     stationId: StationID;
     event: IEventPlayBackgroundAudio;
@@ -202,6 +223,41 @@ export class AudioEngine {
     return AudioEngine.instance;
   }
 
+  public async loadPrefetchManifest(manifestUrl: URL): Promise<void> {
+    // The manifest is optional, without it we just don't prefetch
+    try {
+      const response = await fetch(manifestUrl.toString());
+      if (response.ok) {
+        const manifest = await response.json();
+        this.prefetchManifest = manifest.stations;
+      }
+    } catch (error) {
+      console.log("no prefetch manifest", manifestUrl.toString(), error);
+    }
+  }
+
+  public prefetchForStation(stationId: StationID): void {
+    // Point the prefetch pool at the first clips the manifest lists for this station,
+    // the browser loads them while the current clip plays
+    const filenames = this.prefetchManifest[stationId] || [];
+    this.prefetchAudioPool.elements.forEach((element, index) => {
+      const filename = filenames[index];
+      if (filename) {
+        const path = this.getAudioPath(filename);
+        // src reads back resolved and percent encoded, resolve path the same way
+        // so files with spaces or non ascii names are not loaded again
+        if (element.audio.src !== new URL(path, document.baseURI).href) {
+          element.audio.preload = "auto";
+          element.audio.src = path;
+          element.audio.load();
+        }
+        element.free = false;
+      } else if (!element.free) {
+        this.prefetchAudioPool.returnElement(element);
+      }
+    });
+  }
+
   public resume(): void {
     // Run this when returning to the game after being paused by external forces
     this.foregroundSound.play();
@@ -260,6 +316,12 @@ export class AudioEngine {
         reject(false);
       }
 
+      let audioFilenameToActuallyPlay = audioFilename;
+      if (store.state.debugQuickAudio) {
+        audioFilenameToActuallyPlay = "/audio/beep.mp3";
+      }
+      const segment = parseAudioSegment(audioFilenameToActuallyPlay);
+
       // playintent
       const playintent$ = new Subject<boolean>();
 
@@ -277,6 +339,8 @@ export class AudioEngine {
         .subscribe(() => {
           if (position !== 0) {
             this.foregroundSound.currentTime = position;
+          } else if (this.foregroundSound.currentTime < segment.start) {
+            this.foregroundSound.currentTime = segment.start;
           }
           console.log("canplay: ", audioFilename);
           this.foregroundSound.play();
@@ -287,14 +351,22 @@ export class AudioEngine {
       // timeupdate
       const timeupdate$ = fromEvent(this.foregroundSound, "timeupdate");
 
-      // ended
-      const ended$ = fromEvent(this.foregroundSound, "ended");
-
       // currenttime - how far in the file we've come - filter out anything that is not progress
       const currentTime$: Observable<number> = timeupdate$
         .pipe(map((event) => (event as any).target.currentTime))
         .pipe(distinctUntilChanged());
 
+      // ended, or for a segment of a sprite, played up to the end of the segment
+      const segmentEnd = segment.end;
+      const ended$ =
+        segmentEnd === undefined
+          ? fromEvent(this.foregroundSound, "ended")
+          : fromEvent(this.foregroundSound, "ended").pipe(
+              mergeWith(
+                currentTime$.pipe(first((time: number) => time >= segmentEnd))
+              )
+            );
+
       // currentTimeOrZero is needed when we get a network timeout
 
       subscriptions.push(
@@ -318,6 +390,11 @@ export class AudioEngine {
         // The audio ending fires
         store.commit(Mutations.setIgnorePauseEventMarker, new Date());
 
+        // The rest of a sprite is other clips
+        if (segmentEnd !== undefined) {
+          this.foregroundSound.pause();
+        }
+
         this.unsetStationIsExecutingWithDelay(2500);
         console.log("resolve: ", audioFilename);
 
@@ -356,12 +433,7 @@ export class AudioEngine {
           )
       );
 
-      let audioFilenameToActuallyPlay = audioFilename;
-      if (store.state.debugQuickAudio) {
-        audioFilenameToActuallyPlay = "/audio/beep.mp3";
-      }
-
-      const fullAudioPath = this.getAudioPath(audioFilenameToActuallyPlay);
+      const fullAudioPath = this.getAudioPath(segment.filename);
       this.foregroundSound.autoplay = true; // For iOS
       this.foregroundSound.src = fullAudioPath;
 
@@ -390,9 +462,10 @@ export class AudioEngine {
 
     if (audioFilenames.length > 0) {
       const audioFilename = audioFilenames[0];
+      const segment = parseAudioSegment(audioFilename);
       // setup the sound
 
-      this.foregroundSound.src = this.getAudioPath(audioFilename);
+      this.foregroundSound.src = this.getAudioPath(segment.filename);
       this.foregroundSound.autoplay = true;
 
       const foregroundSound = this.foregroundSound;
@@ -400,13 +473,16 @@ export class AudioEngine {
       if (foregroundSound) {
         // Listen for the 'canplay' event
         foregroundSound.oncanplay = () => {
+          if (foregroundSound.currentTime < segment.start) {
+            foregroundSound.currentTime = segment.start;
+          }
           foregroundSound.play();
           store.commit(Mutations.setForegroundAudioIsPlaying, true);
           store.commit(Mutations.setCurrentAudioFilename, audioFilename);
         };
 
         // Listen for the 'ended' event
-        foregroundSound.onended = () => {
+        const onEnded = () => {
           store.commit(Mutations.setForegroundAudioIsPlaying, false);
           store.commit(Mutations.setCurrentAudioFilename, null);
           store.commit(Mutations.pushToPlayedForegroundAudio, audioFilename);
@@ -422,6 +498,20 @@ export class AudioEngine {
             this.unsetStationIsExecutingWithDelay(2500);
           }
         };
+        foregroundSound.onended = onEnded;
+
+        // A segment of a sprite ends before the file does
+        const segmentEnd = segment.end;
+        foregroundSound.ontimeupdate =
+          segmentEnd === undefined
+            ? null
+            : () => {
+                if (foregroundSound.currentTime >= segmentEnd) {
+                  foregroundSound.ontimeupdate = null;
+                  foregroundSound.pause();
+                  onEnded();
+                }
+              };
       }
     }
   }
@@ -137,6 +137,14 @@ export async function loadGameConfigAndStations(
   return fetch(configUrl.toString())
     .then((response) => response.json())
     .then(async (gameConfig: IGameConfig) => {
+      // A game bundle (invoke bundle-game) already has all the stations
+      if (Object.keys(gameConfig.stations).length > 0) {
+        Object.values(gameConfig.stations).forEach((obj) => {
+          gameConfig.stations[obj.id] = Station.initiateFromDTF(obj);
+        });
+        return gameConfig;
+      }
+
       // extract baseURL from our configUrl
       const baseUrl = getParentUrl(configUrl);
       // Make a set of promises for fetching all stations
@@ -158,6 +166,15 @@ export async function loadGameConfigAndStations(
     });
 }
 
+// The prefetch manifest (invoke prefetch-manifest) sits next to the gameconfig
+export function loadPrefetchManifest(configUrl: URL): Promise<void> {
+  const manifestUrl = getChildUrl(
+    getParentUrl(configUrl),
+    "prefetch-manifest.json"
+  );
+  return AudioEngine.getInstance().loadPrefetchManifest(manifestUrl);
+}
+
 function interpretEvent(state: IState, inEvent: IEvent) {
   const event = inEvent as IEvent;
   eventHandlers[event.action](state, event);
@@ -409,6 +426,9 @@ export function runStation(station: Station): void {
     // And we cancel ALL background sounds that are still waiting to start
     audioEngine.cancelAllBackgroundTimeouts();
 
+    // Start warming what this station is likely to lead to
+    audioEngine.prefetchForStation(station.id);
+
     switch (station.type) {
       case "help":
         handleHelpOpen(station, counts);
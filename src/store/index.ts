@@ -13,7 +13,7 @@ import createPersistedState from "vuex-persistedstate";
 
 import { Store, createStore } from "vuex";
 import { IGameConfig, StationID, Station } from "../station";
-import { loadGameConfigAndStations } from "../station";
+import { loadGameConfigAndStations, loadPrefetchManifest } from "../station";
 
 interface IUserState {
   QRScannerIsDisplayed: boolean;
@@ -232,6 +232,8 @@ export const store = createStore({
           );
           state.gameConfigLoaded = true;
         }
+        // Not persisted, so fetched on every start
+        loadPrefetchManifest(new URL(configUrl));
       }
     },
 
@@ -2,26 +2,17 @@ import os
 import sys
 import shutil
 
-from json import load
 from json import dumps
 import datetime as dt
-from urllib.parse import urljoin
-import graphviz
 
 from invoke import task
-from jsonschema import Draft7Validator, RefResolver
-import qrcode
-from PIL import ImageDraw
 from pathlib import Path
 
-from validation.validation import validate_gameconfig_helper
-from validation.validation import validate_station_file
-from validation.validation import validate_station_file_and_output_errors
-from validation.validation import output_validation_errors
-from validation.validation import validate_schema_helper
-from validation.validation import validate_stations_in_folder_helper
-from validation.validation import validate_game_helper
-from validation.validation import load_complete_game
+# Only what `invoke --list` needs is imported here. Validation pulls in
+# jsonschema, the qr codes qrcode and PIL, the graph graphviz and so on, so
+# each task imports what it uses when it runs. tests/test_startup.py checks
+# that, and startup-benchmark what it costs.
+from tooling.profiling import phase, profiling
 
 
 TYPESCRIPT_FILES_FINDER = f"find .|grep '\.ts$'|grep -v '#'"
@@ -29,6 +20,18 @@ TYPESCRIPT_FILES_FINDER = f"find .|grep '\.ts$'|grep -v '#'"
 
 BUILD_DIR = "./build"
 
+# Left out of deploys with --no-include-data
+DATA_EXCLUDES = ["data/", "img/", "video/", "animation/", "Default.hyperesources/"]
+
+
+def build_dir_for_game(filename):
+    """Where the files of the game at filename end up in the build"""
+    game_dir = Path(filename).parent.resolve()
+    try:
+        return Path(BUILD_DIR) / game_dir.relative_to(Path("public").resolve())
+    except ValueError:
+        return Path(BUILD_DIR) / "data" / game_dir.name
+
 
 def preflight_checklist():
     """Stuff we want to check before running our tasks"""
@@ -40,35 +43,132 @@ def preflight_checklist():
 
 
 @task
-def rsync_build_to_dist(ctx):
+def rsync_build_to_dist(ctx, profile=False, cprofile=False):
     """
     Sync build dir to dist
 
     Using rsync which will only update newer files. This will make lftp go faster.
 
     """
-    preflight_checklist()
+    with profiling("rsync-build-to-dist", profile, cprofile):
+        preflight_checklist()
 
-    # archive mode; equals -rlptgoD
+        # archive mode; equals -rlptgoD
 
-    cmd = f"rsync --recursive --links --progress --checksum {BUILD_DIR}/ ./dist"
+        cmd = f"rsync --recursive --links --progress --checksum {BUILD_DIR}/ ./dist"
 
-    # -av --progress --checksum
+        # -av --progress --checksum
 
-    print(cmd)
-    ctx.run(cmd)
+        print(cmd)
+        ctx.run(cmd)
+
+
+def run_validation(helper, format, output, max_errors):
+    """
+    Run a validation helper with a reporter for the given format. A game that
+    can not be loaded is reported like any other error. Stop after max_errors
+    errors and exit with a nonzero status if there were any.
+    """
+    from validation.loading import GameLoadError
+    from validation.reporting import TooManyErrors, make_reporter
+
+    try:
+        reporter = make_reporter(format, output, max_errors or None)
+    except ValueError as err:
+        print(err, file=sys.stderr)
+        exit(1)
+
+    try:
+        try:
+            helper(reporter)
+        except GameLoadError as err:
+            # Nothing else can be checked without the whole game
+            reporter.report(str(err), err.filename)
+    except TooManyErrors:
+        print(f"Stopped after {reporter.error_count} errors.", file=sys.stderr)
+    finally:
+        reporter.close()
+
+    if reporter.error_count:
+        exit(1)
 
 
 @task
-def validate_game(ctx, filename):
-    """Validate a complete game consisting of a gameconfig, multiple station files and multiple audio files"""
+def validate_game(
+    ctx,
+    filename,
+    jobs=1,
+    cache=True,
+    audio=True,
+    format="text",
+    output=None,
+    max_errors=0,
+    profile=False,
+    cprofile=False,
+):
+    """
+    Validate a complete game consisting of a gameconfig, multiple station files and multiple audio files
+
+    Use --jobs N to validate the stations in N worker processes.
+
+    Results for unchanged stations are reused from the last run. Use --no-cache to validate everything.
+
+    The headers of all referenced audio files are checked too, skip that with --no-audio.
+
+    --format can be text, jsonl or sarif, written to stdout or --output.
+    --max-errors N stops validation at the Nth error.
+
+    --profile prints how long each phase took and writes a report to
+    .cache/profiles, --cprofile adds the functions where the time went.
+    """
+    from validation.assets import asset_index_for
+    from validation.model import get_game_model
+    from validation.validation import validate_game_helper
+
+    def validate(reporter):
+        # Validation would do these first anyway, timing them on their own
+        # shows how much is json loading and how much is file system
+        with phase("load game"):
+            get_game_model(filename)
+        with phase("scan assets"):
+            asset_index_for(filename)
+
+        with phase("validate"):
+            validate_game_helper(
+                filename,
+                jobs=jobs,
+                use_cache=cache,
+                reporter=reporter,
+                check_audio=audio,
+            )
+
+    with profiling("validate-game", profile, cprofile):
+        preflight_checklist()
+        run_validation(validate, format, output, max_errors)
+
+
+@task
+def validate_watch(ctx, filename, interval=0.2):
+    """
+    Validate a game, then watch its folder and validate again whatever a change affects
+
+    Prints the messages that went away with a - and the new ones with a +.
+    Stop with ctrl-c.
+    """
+    from validation.watch import watch
+
     preflight_checklist()
-    validate_game_helper(filename)
+    try:
+        watch(filename, interval=float(interval))
+    except KeyboardInterrupt:
+        pass
 
 
 @task
 def validate_station(ctx, filename):
     """Validate a single station file"""
+    from validation.validation import validate_station_file_and_output_errors
+
     preflight_checklist()
     validate_station_file_and_output_errors(filename)
 
@@ -76,6 +176,8 @@ def validate_station(ctx, filename):
 @task
 def validate_gameconfig(ctx, filename):
     """Validate a given game config file. Not the enire game"""
+    from validation.validation import validate_gameconfig_helper
+
     preflight_checklist()
     for error in validate_gameconfig_helper(filename):
         print(error)
@@ -84,6 +186,8 @@ def validate_gameconfig(ctx, filename):
 @task
 def validate_schema(ctx, filename):
     """Validate a json schema itself."""
+    from validation.validation import validate_schema_helper
+
     preflight_checklist()
     validate_schema_helper(filename)
 
@@ -91,6 +195,8 @@ def validate_schema(ctx, filename):
 @task
 def validate_test_file(ctx):
     """Test the schema validation against a test file"""
+    from validation.validation import output_validation_errors, validate_station_file
+
     preflight_checklist()
     jsonfile = "./src/data/stations/schema-test.json"
 
@@ -99,14 +205,25 @@ def validate_test_file(ctx):
 
 
 @task
-def validate_stations_in_folder(ctx, folder, exit_on_errors=False):
+def validate_stations_in_folder(
+    ctx, folder, exit_on_errors=False, format="text", output=None, max_errors=0
+):
     """
     Validate all json files in given folder
 
     If exit_on_error only print errors of first file that does not validate, then exit
     """
+    from validation.validation import validate_stations_in_folder_helper
+
     preflight_checklist()
-    validate_stations_in_folder_helper(folder, exit_on_errors)
+    run_validation(
+        lambda reporter: validate_stations_in_folder_helper(
+            folder, exit_on_errors, reporter=reporter
+        ),
+        format,
+        output,
+        max_errors,
+    )
 
 
 @task
@@ -165,101 +282,667 @@ def typescript_vue_typecheck(ctx):
 #     print(full_url)
 
 
+def build_stages(ctx, filename, fingerprint=True, sprites=True, qr_dir=None):
+    """
+    The stages of building the game at filename into the build dir, for
+    run_stages. QR codes are only made if qr_dir is given.
+    """
+    from tooling.buildgraph import Stage
+    from tooling.bundle import write_minified_json
+    from tooling.precache import PRECACHE_FILENAME
+    from tooling.prefetch import PREFETCH_FILENAME, compile_prefetch_manifest
+    from validation.audio_metadata import (
+        AUDIO_INDEX_FILENAME,
+        compile_audio_index,
+        game_audio_metadata,
+    )
+    from validation.loading import load_complete_game
+    from validation.model import get_game_model
+
+    game_dir = Path(filename).parent
+    built_dir = build_dir_for_game(filename)
+    built_gameconfig = built_dir / Path(filename).name
+    game = get_game_model(filename)
+
+    def build_app():
+        cmd = "./node_modules/.bin/vite build --mode production"
+        print(cmd)
+        ctx.run(cmd)
+
+    def copy_game_data():
+        # Vite copied the game too, but the stages after this change it in place
+        shutil.rmtree(built_dir, ignore_errors=True)
+        shutil.copytree(game_dir, built_dir)
+
+    def write_audio_index():
+        data = load_complete_game(built_gameconfig)
+        metadata = game_audio_metadata(data, built_gameconfig)
+        index = compile_audio_index(metadata)
+        write_minified_json(index, built_dir / AUDIO_INDEX_FILENAME)
+
+    def write_prefetch_manifest():
+        manifest = compile_prefetch_manifest(get_game_model(built_gameconfig))
+        write_minified_json(manifest, built_dir / PREFETCH_FILENAME)
+
+    # Stages that change the game in the build in place run one after the other
+    in_place = []
+    if fingerprint:
+        in_place.append(
+            ("fingerprint-assets", lambda: fingerprint_assets(ctx, filename))
+        )
+    if sprites:
+        in_place.append(("audio-sprites", lambda: pack_audio_sprites(ctx, filename)))
+    assets_stage = in_place[-1][0] if in_place else "game-data"
+    stages = [
+        Stage(
+            "vue-build",
+            build_app,
+            inputs=["src", "index.html", "playground", "locales", "public"]
+            + ["package.json", "pnpm-lock.yaml", "vite.config.ts", "windi.config.ts"],
+            excludes=("public/data",),
+            outputs=[f"{BUILD_DIR}/index.html"],
+        ),
+        Stage(
+            "game-data",
+            copy_game_data,
+            inputs=[game_dir],
+            deps=("vue-build",),
+            outputs=[built_gameconfig],
+        ),
+        Stage(
+            "html-files",
+            lambda: generate_html_files(ctx, filename),
+            inputs=[game_dir],
+            deps=("vue-build",),
+            outputs=[
+                Path(BUILD_DIR) / station_id / "index.html"
+                for station_id in game.entry_station_ids()
+            ],
+        ),
+        Stage(
+            "audio-index",
+            write_audio_index,
+            deps=(assets_stage,),
+            outputs=[built_dir / AUDIO_INDEX_FILENAME],
+        ),
+        Stage(
+            "prefetch-manifest",
+            write_prefetch_manifest,
+            deps=(assets_stage,),
+            outputs=[built_dir / PREFETCH_FILENAME],
+        ),
+    ]
+    stages.append(
+        Stage(
+            "precache-manifest",
+            lambda: precache_manifest(ctx, built_gameconfig, output_dir=built_dir),
+            deps=(assets_stage,),
+            outputs=[built_dir / PRECACHE_FILENAME],
+        )
+    )
+    stages.append(
+        Stage(
+            "precompress",
+            lambda: precompress_build(ctx),
+            deps=tuple(stage.name for stage in stages) + (assets_stage,),
+        )
+    )
+    previous = "game-data"
+    for name, run in in_place:
+        stages.append(Stage(name, run, deps=(previous,)))
+        previous = name
+    if qr_dir:
+        stages.append(
+            Stage(
+                "qr-codes",
+                lambda: generate_qr_codes(ctx, filename, output_dir=qr_dir),
+                inputs=[game_dir],
+                outputs=[qr_dir],
+                settings={"output_dir": str(qr_dir)},
+            )
+        )
+    return stages
+
+
 @task
-def deploy_to_khst(ctx, username, password, include_data=True, fresh_build=True):
-    """Build and deploy to khst via sftp"""
+def build_game(
+    ctx,
+    filename,
+    fingerprint=True,
+    sprites=True,
+    qr_dir=None,
+    jobs=4,
+    force=False,
+    dry_run=False,
+    profile=False,
+    cprofile=False,
+):
+    """
+    Build the app and the game at filename into the build dir
+
+    Only the stages whose inputs changed since they last ran are run, up to
+    --jobs of them at the same time. --dry-run shows what would run and why,
+    --force runs everything. With --qr-dir the qr codes are made there too.
+    """
+    from tooling.buildgraph import run_stages
+
+    with profiling("build-game", profile, cprofile):
+        preflight_checklist()
+        stages = build_stages(
+            ctx, filename, fingerprint=fingerprint, sprites=sprites, qr_dir=qr_dir
+        )
+        run_stages(stages, jobs=jobs, force=force, dry_run=dry_run)
 
-    preflight_checklist()
 
-    # Update Version
-    # update_version(ctx)
+@task
+def deploy_to_khst(
+    ctx,
+    username,
+    password,
+    include_data=True,
+    force=False,
+    fingerprint=True,
+    sprites=True,
+    jobs=10,
+    build_jobs=4,
+    remote_root="/",
+    manifest_path=None,
+    dry_run=False,
+    profile=False,
+    cprofile=False,
+):
+    """
+    Build and deploy to khst via sftp
 
-    # Build
-    if fresh_build:
-        vue_build(ctx)
+    Build stages whose inputs did not change since they last ran are skipped,
+    --force runs them all. Only files that changed since the last deploy are
+    uploaded to --remote-root, over --jobs connections. Use --dry-run to see
+    what would be built, and what would be uploaded and deleted from the build
+    as it is now.
 
-    if include_data:
-        data_exclude = ""
+    What was deployed last is kept in a manifest in .cache/deploy-manifests,
+    one per host and --remote-root, or in --manifest-path.
+
+    --profile prints how long each phase took and writes a report to
+    .cache/profiles, --cprofile adds the functions where the time went.
+    """
+    from tooling.buildgraph import run_stages
+    from tooling.deploy import SftpUnavailable, manifest_path_for, sftp_backend
+
+    host = "sprickan.kulturhusetstadsteatern.se"
+    with profiling("deploy-to-khst", profile, cprofile):
+        preflight_checklist()
+
+        # Before building, so a missing paramiko does not wait for the build
+        try:
+            backend = sftp_backend(host, username, password, port=22, root=remote_root)
+        except SftpUnavailable as error:
+            print(error)
+            exit(1)
+        manifest_path = manifest_path or manifest_path_for(host, remote_root)
+
+        # Update Version
+        # update_version(ctx)
+
+        # Build what changed
+        stages = build_stages(
+            ctx,
+            "./public/data/sprickan/gameconfig.json",
+            fingerprint=fingerprint,
+            sprites=sprites,
+        )
+        run_stages(stages, jobs=build_jobs, force=force, dry_run=dry_run)
+
+        if include_data:
+            excludes = []
+        else:
+            excludes = DATA_EXCLUDES
+
+        # Now push it to the server
+        with phase("deploy"):
+            run_deploy(BUILD_DIR, backend, manifest_path, jobs, excludes, dry_run)
+
+
+@task
+def deploy_to_directory(
+    ctx,
+    target,
+    include_data=True,
+    jobs=10,
+    manifest_path=None,
+    dry_run=False,
+    profile=False,
+    cprofile=False,
+):
+    """
+    Deploy what is in the build dir to a local directory, the same way deploy_to_khst deploys to the server
+
+    The deploy manifest goes to .cache/deploy-manifests, or to --manifest-path.
+    """
+    from tooling.deploy import local_backend, manifest_path_for
+
+    with profiling("deploy-to-directory", profile, cprofile):
+        preflight_checklist()
+        excludes = [] if include_data else DATA_EXCLUDES
+        target_path = Path(target).resolve().as_posix()
+        manifest_path = manifest_path or manifest_path_for("localhost", target_path)
+        backend = local_backend(target)
+        run_deploy(BUILD_DIR, backend, manifest_path, jobs, excludes, dry_run)
+
+
+def run_deploy(source_dir, backend, manifest_path, jobs, excludes, dry_run):
+    """Deploy and report what was done"""
+    from tooling.deploy import deploy
+
+    upload, delete = deploy(
+        source_dir,
+        backend,
+        manifest_path,
+        workers=jobs,
+        excludes=excludes,
+        dry_run=dry_run,
+    )
+    for path in upload:
+        print(f"upload {path}")
+    for path in delete:
+        print(f"delete {path}")
+
+    if dry_run:
+        print(f"Would upload {len(upload)} and delete {len(delete)} files.")
     else:
-        data_exclude = " --exclude data/ --exclude img/ --exclude video/ --exclude animation/ --exclude Default.hyperesources/ "
+        print(f"Uploaded {len(upload)} and deleted {len(delete)} files.")
+
 
-    # Generate html files
-    generate_html_files(ctx, "./public/data/sprickan/gameconfig.json")
+@task
+def generate_qr_codes(
+    ctx,
+    filename,
+    output_dir="/tmp",
+    jobs=0,
+    svg=False,
+    sheet=False,
+    force=False,
+    profile=False,
+    cprofile=False,
+):
+    """
+    Generate qr codes for the game defined in the supplied game config
+
+    Codes are written to --output-dir, /tmp by default, together with the
+    .qr-manifest.json that records what was rendered. They are rendered in
+    --jobs worker processes (default one per cpu). Codes whose url and label
+    have not changed since the last run are skipped unless --force is given.
+    Use --svg to also write svg codes and --sheet to write a printable pdf
+    with all codes.
+    """
+    from tooling.qr import qr_code_jobs, render_qr_codes, render_sheet
+    from validation.model import get_game_model
 
-    # Sync build to dist
-    rsync_build_to_dist(ctx)
+    with profiling("generate-qr-codes", profile, cprofile):
+        preflight_checklist()
+        game = get_game_model(filename)
 
-    # Now push it to the server
-    lftpcmd = f"open -u {username},{password} sftp://sprickan.kulturhusetstadsteatern.se:22;mirror --verbose --parallel=10 -R dist/ / {data_exclude} ;exit"
-    cmd = f"lftp -e '{lftpcmd}'"
-    print(cmd)
-    ctx.run(cmd, pty=True)
+        qr_jobs = qr_code_jobs(game, output_dir, svg=svg)
+        with phase("render"):
+            written = render_qr_codes(
+                qr_jobs, output_dir, workers=jobs or None, force=force
+            )
+
+        for job in qr_jobs:
+            print(job["url"])
+            print(job["filename"])
+        print(f"Rendered {len(written)} of {len(qr_jobs)} qr codes in {output_dir}")
+
+        if sheet:
+            sheet_filename = Path(output_dir) / f"{game.name}-qr-codes.pdf"
+            with phase("sheet"):
+                print(render_sheet(qr_jobs, sheet_filename))
 
 
 @task
-def generate_qr_codes(ctx, filename):
-    """Generate qr codes for the game defined in the supplied game config. Outputs to /tmp"""
-    preflight_checklist()
-    game_data = load_complete_game(filename)
-    choice_infix = game_data["choiceInfix"]
+def transcode_audio(
+    ctx,
+    filename,
+    output_dir=None,
+    profiles="mobile,low",
+    encoder="ffmpeg",
+    jobs=0,
+    profile=False,
+    cprofile=False,
+):
+    """
+    Transcode all audio referenced from a game to the given delivery profiles
 
-    station_ids = [s for s in game_data["stations"].keys() if choice_infix not in s]
+    Writes the transcoded files and a copy of the game that refers to the
+    first profile to the build dir of the game, or --output-dir. Use
+    --encoder copy to run the pipeline without a real encoder.
+    """
+    from tooling.audio import EncoderMissing, transcode_game
+    from validation.model import get_game_model
 
-    # Add global choice stations
-    for choice in game_data["choiceNames"]:
-        station_ids.append(f"{choice_infix}{choice}")
+    with profiling("transcode-audio", profile, cprofile):
+        preflight_checklist()
+        game = get_game_model(filename)
+        output_dir = output_dir or build_dir_for_game(filename)
+
+        try:
+            results = transcode_game(
+                game,
+                output_dir,
+                profile_names=profiles.split(","),
+                encoder_name=encoder,
+                workers=jobs or None,
+            )
+        except (EncoderMissing, ValueError) as error:
+            print(error)
+            exit(1)
+
+        for reference, profile_name, output_path, transcoded_now in results:
+            if transcoded_now:
+                print(f"{reference} -> {output_path}")
+
+        transcoded_count = sum(1 for r in results if r[3])
+        print(
+            f"Transcoded {transcoded_count} of {len(results)} files, "
+            "the rest came from the cache."
+        )
+
+
+@task
+def fingerprint_assets(ctx, filename, profile=False, cprofile=False):
+    """
+    Give the audio of a game in the build dir content hashed names
+
+    filename is the gameconfig of the game in ./public. Byte identical files
+    are collapsed to one copy and the built gameconfig and station files are
+    rewritten to point at the new names.
+    """
+    from tooling.fingerprint import fingerprint_game
 
-    for station_id in station_ids:
+    with profiling("fingerprint-assets", profile, cprofile):
+        preflight_checklist()
+        build_gameconfig = build_dir_for_game(filename) / Path(filename).name
 
-        full_url = urljoin(
-            game_data["baseUrl"] + "/", station_id, allow_fragments=False
+        renames, saved = fingerprint_game(build_gameconfig)
+        print(
+            f"Fingerprinted {len(renames)} files in {build_gameconfig.parent}, "
+            f"removing duplicates saved {saved / 1e6:.1f} MB"
         )
-        qr_img = qrcode.make(full_url)
-        filename = f"/tmp/{game_data['name']}-{station_id}.png"
 
-        ImageDraw.Draw(qr_img).text((0, 0), station_id, 0)
-        print(full_url)
-        print(filename)
-        qr_img.save(filename)
+
+@task
+def pack_audio_sprites(
+    ctx, filename, group="level", max_seconds=10.0, profile=False, cprofile=False
+):
+    """
+    Pack the short clips of a game in the build dir into audio sprites
+
+    filename is the gameconfig of the game in ./public. Clips up to
+    --max-seconds long are put together per level, or per station with
+    --group station, and the built station files are rewritten to play
+    segments of the sprites. The offsets go in audio-sprites.json.
+    """
+    from tooling.sprites import pack_game_sprites
+
+    with profiling("pack-audio-sprites", profile, cprofile):
+        preflight_checklist()
+        build_gameconfig = build_dir_for_game(filename) / Path(filename).name
+
+        table = pack_game_sprites(
+            build_gameconfig, group=group, max_seconds=max_seconds
+        )
+        clips = sum(len(sprite["clips"]) for sprite in table["sprites"].values())
+        size = sum(sprite["bytes"] for sprite in table["sprites"].values())
+        print(
+            f"Packed {clips} clips into {len(table['sprites'])} sprites "
+            f"of {size / 1e6:.1f} MB in {build_gameconfig.parent}"
+        )
 
 
 @task
-def generate_html_files(ctx, filename):
-    """Generate index.html files for the game defined in the supplied game config. Outputs to /tmp"""
-    preflight_checklist()
+def audio_index(ctx, filename, output=None, jobs=0, profile=False, cprofile=False):
+    """
+    Write an index with the duration, bitrate, size and hash of the audio of a game
 
-    # We pick up index.html from the same folder where filename of gameconfig is located
-    html_template = Path(filename).parent / "index.html"
+    Written as audio-index.json next to the gameconfig of the game in the
+    build dir, or to --output. Files are scanned in --jobs worker processes
+    (default one per cpu) and problems with them are reported.
+    """
+    from tooling.bundle import write_minified_json
+    from validation.audio_metadata import (
+        AUDIO_INDEX_FILENAME,
+        audio_file_messages,
+        compile_audio_index,
+        game_audio_metadata,
+    )
+    from validation.model import get_game_model
+
+    with profiling("audio-index", profile, cprofile):
+        preflight_checklist()
+        game = get_game_model(filename)
+
+        metadata = game_audio_metadata(game.data, filename, workers=jobs or None)
+        for reference, scanned in metadata.items():
+            for message in audio_file_messages(reference, scanned, filename):
+                print(message)
+
+        output = output or build_dir_for_game(filename) / AUDIO_INDEX_FILENAME
+        print(write_minified_json(compile_audio_index(metadata), output))
+
+
+@task
+def prefetch_manifest(
+    ctx, filename, output=None, depth=2, max_mb=10.0, profile=False, cprofile=False
+):
+    """
+    List the audio every station of a game is likely to need next
+
+    For each station the audio of the stations at most --depth transitions
+    away, nearest and smallest first, up to --max-mb per station. Written as
+    prefetch-manifest.json next to the gameconfig of the game in the build
+    dir, or to --output. The client warms these files while a clip plays.
+    """
+    from tooling.bundle import write_minified_json
+    from tooling.prefetch import PREFETCH_FILENAME, compile_prefetch_manifest
+    from validation.model import get_game_model
+
+    with profiling("prefetch-manifest", profile, cprofile):
+        preflight_checklist()
+        game = get_game_model(filename)
+
+        manifest = compile_prefetch_manifest(
+            game, depth=depth, max_bytes=int(max_mb * 1e6)
+        )
+        output = output or build_dir_for_game(filename) / PREFETCH_FILENAME
+        print(write_minified_json(manifest, output))
+
+
+@task
+def precache_manifest(ctx, filename, output_dir=None, profile=False, cprofile=False):
+    """
+    List the files of a game per level, with revisions, for offline caching
+
+    Written as precache-manifest.json and a precache folder with a manifest
+    per level next to the gameconfig of the game in the build dir, or in
+    --output-dir. Level manifests that did not change are left alone.
+    """
+    from tooling.precache import PRECACHE_FILENAME, compile_precache, write_precache
+    from validation.model import get_game_model
+
+    with profiling("precache-manifest", profile, cprofile):
+        preflight_checklist()
+        game = get_game_model(filename)
+        output_dir = output_dir or build_dir_for_game(filename)
+
+        index, manifests = compile_precache(game)
+        written = write_precache(index, manifests, output_dir)
+        for level, entry in index["levels"].items():
+            status = "written" if level in written else "unchanged"
+            size = entry["bytes"] / 1e6
+            print(f"{level:>8}: {entry['files']:4} files {size:7.1f} MB  {status}")
+        print(Path(output_dir) / PRECACHE_FILENAME)
+
+
+@task
+def bundle_game(
+    ctx, filename, output=None, strict=False, profile=False, cprofile=False
+):
+    """
+    Compile a game into a single minified json file the client can boot from
+
+    Written as game-bundle.json next to the gameconfig of the game in the
+    build dir, or to --output. With --strict nothing is written if the game
+    does not validate against our schemas.
+    """
+    from tooling.bundle import (
+        BUNDLE_FILENAME,
+        compile_bundle,
+        validate_game_data,
+        write_minified_json,
+    )
+    from validation.model import get_game_model
+
+    with profiling("bundle-game", profile, cprofile):
+        preflight_checklist()
+        game = get_game_model(filename)
+
+        errors = validate_game_data(game.data, filename)
+        for line in errors:
+            print(line)
+        if errors and strict:
+            print("Not writing a bundle for a game that does not validate.")
+            exit(1)
+
+        output = output or build_dir_for_game(filename) / BUNDLE_FILENAME
+        print(write_minified_json(compile_bundle(game), output))
+
+
+@task
+def compile_events(ctx, filename, output=None, profile=False, cprofile=False):
+    """
+    Compile the events of every station of a game into flat programs
+
+    Written minified as game-program.json next to the gameconfig of the game
+    in the build dir, or to --output. Jumps and station references that go
+    nowhere are reported.
+    """
+    from tooling.bundle import write_minified_json
+    from validation.model import get_game_model
+    from validation.program import PROGRAM_FILENAME, check_compiled_game, compile_game
+
+    with profiling("compile-events", profile, cprofile):
+        preflight_checklist()
+        game = get_game_model(filename)
+
+        compiled = compile_game(game.data)
+        problems = list(check_compiled_game(compiled))
+        for problem in problems:
+            print(problem)
+
+        output = output or build_dir_for_game(filename) / PROGRAM_FILENAME
+        print(write_minified_json(compiled, output))
+
+        if any(p.startswith("[014]") for p in problems):
+            exit(1)
+
+
+@task
+def explore_playthroughs(
+    ctx,
+    filename,
+    endings="",
+    closed_scans=False,
+    max_states=None,
+    max_seconds=None,
+    format="text",
+    output=None,
+    max_errors=0,
+    profile=False,
+    cprofile=False,
+):
+    """
+    Play every way through a game and report where it goes wrong
+
+    Events are run like the client runs them, for every station a player can
+    scan and every timer that can fire. Reports stations no playthrough
+    reaches, events that fail and places where a player gets stuck or loops
+    without reaching an ending.
+
+    Stations that lead nowhere are endings, add others with --endings a,b.
+    --closed-scans also explores scanning closed stations for their tags.
+    Exploring stops after --max-states states (100000) or --max-seconds
+    seconds (10), and reports that what it found is partial. 0 is no limit.
+    --format, --output and --max-errors work like for validate-game.
+    """
+    from validation.explore import (
+        MAX_SECONDS,
+        MAX_STATES,
+        check_exploration,
+        default_endings,
+        explore_game,
+    )
+    from validation.model import get_game_model
+
+    max_states = MAX_STATES if max_states is None else int(max_states)
+    max_seconds = MAX_SECONDS if max_seconds is None else float(max_seconds)
+
+    def explore(reporter):
+        with phase("load game"):
+            game = get_game_model(filename)
 
-    game_data = load_complete_game(filename)
-    choice_infix = game_data["choiceInfix"]
+        with phase("explore"):
+            exploration = explore_game(game, closed_scans, max_states, max_seconds)
+        print(
+            f"{len(exploration.states)} game states, "
+            f"{sum(map(len, exploration.edges))} moves between them",
+            file=sys.stderr,
+        )
+
+        all_endings = default_endings(game) | {e for e in endings.split(",") if e}
+        with phase("check"):
+            reporter.report_all(
+                check_exploration(game, exploration, all_endings), filename
+            )
+
+    with profiling("explore-playthroughs", profile, cprofile):
+        preflight_checklist()
+        run_validation(explore, format, output, max_errors)
+
+
+@task
+def generate_html_files(ctx, filename, profile=False, cprofile=False):
+    """Generate index.html files for the game defined in the supplied game config. Outputs to /tmp"""
+    from validation.model import get_game_model
 
-    station_ids = [s for s in game_data["stations"].keys() if choice_infix not in s]
+    with profiling("generate-html-files", profile, cprofile):
+        preflight_checklist()
 
-    # Add global choice stations
-    for choice in game_data["choiceNames"]:
-        station_ids.append(f"{choice_infix}{choice}")
+        # We pick up index.html from the same folder where filename of gameconfig is located
+        html_template = Path(filename).parent / "index.html"
 
-    for station_id in station_ids:
-        print("STATION: ", station_id)
-        output_dir = Path(BUILD_DIR) / station_id
-        if not output_dir.exists():
-            output_dir.mkdir(parents=True)
+        game = get_game_model(filename)
 
-        output_file = output_dir / "index.html"
-        print(output_file)
+        for station_id in game.entry_station_ids():
+            print("STATION: ", station_id)
+            output_dir = Path(BUILD_DIR) / station_id
+            if not output_dir.exists():
+                output_dir.mkdir(parents=True)
 
-        shutil.copy(html_template, output_file)
+            output_file = output_dir / "index.html"
+            print(output_file)
+
+            shutil.copy(html_template, output_file)
 
 
 @task
-def vue_build(ctx, mode="production"):
+def vue_build(ctx, mode="production", profile=False, cprofile=False):
     """Build the project for deployment"""
-    preflight_checklist()
+    with profiling("vue-build", profile, cprofile):
+        preflight_checklist()
 
-    cmd = f"./node_modules/.bin/vite build --mode {mode} "
-    print(cmd)
-    ctx.run(cmd, pty=True)
+        cmd = f"./node_modules/.bin/vite build --mode {mode} "
+        print(cmd)
+        ctx.run(cmd, pty=True)
 
 
 @task
@@ -273,99 +956,224 @@ def vue_devserver(ctx, port=8080, host="0.0.0.0"):
 
 
 @task
-def serve_distdir(ctx, port=8081, host="0.0.0.0"):
-    """Serve what is currently in the dist dir"""
-    cmd = f"./node_modules/.bin/http-server dist -S -C cert.pem -p {port}"
+def precompress_build(ctx, directory=BUILD_DIR, jobs=0, profile=False, cprofile=False):
+    """
+    Write .br and .gz copies of the text files in the build dir
+
+    Only copies that are clearly smaller than the original are kept. .br
+    copies need the brotli package. Files are compressed in --jobs worker
+    processes (default one per cpu) and the results are cached by content.
+    """
+    from tooling.compress import precompress
+
+    with profiling("precompress-build", profile, cprofile):
+        preflight_checklist()
+        results = precompress(directory, workers=jobs or None)
+
+        original = sum(size for _, size, _ in results)
+        for suffix in (".br", ".gz"):
+            compressed = [sizes[suffix] for _, _, sizes in results if suffix in sizes]
+            if compressed:
+                print(
+                    f"{len(compressed)} {suffix} files, "
+                    f"{sum(compressed) / 1e6:.1f} MB from {original / 1e6:.1f} MB"
+                )
+        print(f"Looked at {len(results)} files in {directory}")
+
+
+@task
+def serve_distdir(
+    ctx, port=8081, host="0.0.0.0", precompressed=True, directory=BUILD_DIR
+):
+    """
+    Serve what is currently in the build dir, or in --directory
+
+    The .br and .gz copies from precompress-build are sent to clients that
+    accept them, unless --no-precompressed is given.
+    """
+    cmd = f"./node_modules/.bin/http-server {directory} -S -C cert.pem -p {port}"
+    if precompressed:
+        cmd += " --brotli --gzip"
     print(cmd)
     ctx.run(cmd, pty=True)
 
 
 @task
-def graph(ctx, filename, output="Desktop/gamegraph.gv", format="png"):
-    """Create a graphviz png graph from a gameconfig"""
+def load_test(
+    ctx,
+    filename,
+    url=None,
+    directory=BUILD_DIR,
+    visitors=50,
+    steps=10,
+    think=0.0,
+    seed=0,
+    output=None,
+):
+    """
+    Simulate visitors playing a game against a served build
+
+    Each of --visitors concurrent visitors opens the app, loads the game and
+    walks --steps stations of the station graph, fetching the audio each
+    station plays. With --think they pause for about that many seconds after
+    each clip. Against --url, for example a running serve-distdir, or else
+    --directory, the build dir by default, served by a built in server.
+    --output writes every request and the summary as json.
+    """
+    import asyncio
+    import random
+
+    from tooling.loadtest import (
+        format_summary,
+        game_url,
+        insecure_ssl_context,
+        run_visitors,
+        static_server,
+        summarize,
+        visitor_requests,
+    )
+    from validation.model import get_game_model
+
     preflight_checklist()
-    game_data = load_complete_game(filename)
+    game = get_game_model(filename)
+    game_path = game_url(game, directory)
+
+    rng = random.Random(seed)
+    visits = [visitor_requests(game, game_path, steps, rng) for _ in range(visitors)]
+
+    def simulate(base_url):
+        print(f"{visitors} visitors playing {game.name} at {base_url}")
+        return asyncio.run(
+            run_visitors(
+                base_url, visits, think, seed, ssl_context=insecure_ssl_context()
+            )
+        )
 
-    dot = graphviz.Digraph(comment=game_data["name"], format=format)
+    if url:
+        results, seconds = simulate(url)
+    else:
+        with static_server(directory) as base_url:
+            results, seconds = simulate(base_url)
 
-    stations = game_data["stations"]
+    summary = summarize(results, seconds)
+    print(format_summary(summary))
+    if output:
+        Path(output).write_text(dumps({"summary": summary, "requests": results}))
 
-    # add a node for each station
-    def add_edge(src_station, dst_station):
-        dot.edge(src_station, dst_station)
 
-    def handle_event(station, event):
+@task
+def graph(
+    ctx,
+    filename,
+    output="Desktop/gamegraph.gv",
+    format="png",
+    profile=False,
+    cprofile=False,
+):
+    """Create a graphviz png graph from a gameconfig"""
+    from tooling.graph import game_graph
+    from validation.model import get_game_model
 
-        station_id = station["id"]
+    with profiling("graph", profile, cprofile):
+        preflight_checklist()
+        dot = game_graph(get_game_model(filename), format=format)
 
-        if event["action"] in ["goToStation", "openStation"]:
-            to_station = event["toStation"]
-            add_edge(station_id, to_station)
+        output = Path(Path.home(), output)
+        print(f"Your graph file is at {output}.{format}")
+        with phase("render"):
+            dot.render(output)
 
-        if event["action"] == "openStations":
-            for to_station in event["toStations"]:
-                add_edge(station_id, to_station)
 
-        if event["action"] == "switchGotoStation":
-            for switch in event["switch"]:
-                to_station = switch["parameters"]["toStation"]
-                add_edge(station_id, to_station)
+@task
+def generate_synthetic_game(
+    ctx, output_dir, stations=1000, depth=10, map_size=20, audio_files=500, seed=0
+):
+    """
+    Write a schema valid synthetic game with about --stations stations to output_dir
 
-        if event["action"] == "choiceBasedOnTags":
-            handle_event(station, event["eventIfPresent"])
-            handle_event(station, event["eventIfNotPresent"])
+    Story stations get `then` chains of --depth events and audioFilenameMaps
+    with --map-size entries, picking from --audio-files dummy audio files.
+    """
+    from tooling.synthetic import generate_game
 
-        if event["action"] == "powerNameChoice":
-            for to_station in event["onSuccessOpen"]:
-                add_edge(station_id, to_station)
-            for to_station in event["ghostOnSuccessOpen"]:
-                add_edge(station_id, to_station)
+    print(generate_game(output_dir, stations, depth, map_size, audio_files, seed))
 
-            add_edge(station_id, event["onSecondFailureGoTo"])
-            add_edge(station_id, event["ghostOnSecondFailureGoTo"])
-            for to_station in event["ghostOnSuccessOpen"]:
-                add_edge(station_id, to_station)
 
-        if "condition" in event and event["condition"] in [
-            "adHocKeysAreEqual",
-            "adHocKeysAreNotEqual",
-        ]:
+@task
+def benchmark(
+    ctx, filename=None, stations=2000, depth=10, map_size=20, repeat=3, stages=None
+):
+    """
+    Time the tooling stages against a game and record the results
 
-            for switch in event["switch"]:
-                to_station = switch["parameters"]["toStation"]
-                add_edge(station_id, to_station)
+    Without a filename a synthetic game with --stations stations is generated
+    first. --stages takes a comma separated list of stages, or all. By default
+    explore and qr-codes are left out, they take long on big games.
+    Results are appended to .cache/benchmarks.jsonl and compared with the last
+    run against the same game.
+    """
+    from tooling.bench import (
+        DEFAULT_STAGES,
+        STAGES,
+        format_result,
+        load_results,
+        previous_result,
+        run_benchmarks,
+        save_result,
+    )
+    from tooling.synthetic import generate_game
 
-        if "then" in event:
-            handle_event(station, event["then"])
+    if stages == "all":
+        stages = list(STAGES)
+    else:
+        stages = stages.split(",") if stages else DEFAULT_STAGES
+    unknown = [s for s in stages if s not in STAGES]
+    if unknown:
+        print(f"Unknown stages {', '.join(unknown)}. Choose from {', '.join(STAGES)}")
+        exit(1)
 
-    def handle_station(station):
-        station_id = station["id"]
+    if filename is None:
+        # Synthetic games are generated the same way every time, so reuse them
+        output_dir = Path(f"./.cache/synthetic/{stations}-{depth}-{map_size}")
+        filename = output_dir / "gameconfig.json"
+        if not filename.exists():
+            generate_game(output_dir, stations=stations, depth=depth, map_size=map_size)
 
-        # nodes for open
-        try:
-            for sub_station_id in station["opens"]:
-                add_edge(station_id, sub_station_id)
-        except KeyError:
-            pass
+    result = run_benchmarks(filename, stages, repeat)
+    print(format_result(result, previous_result(result, load_results())))
+    save_result(result)
 
-        if station["type"] == "help":
-            add_edge(station_id, station["startStationId"])
 
-        try:
-            for event in station["events"]:
-                handle_event(station, event)
-        except KeyError:
-            pass
+@task
+def startup_benchmark(ctx, budget=0.0, repeat=5):
+    """
+    Check what tasks.py adds to a cold `invoke --list`, within --budget seconds
 
-    for station in stations.values():
-        dot.node(station["id"], station["id"])
+    Runs `invoke --list` and `invoke --version`, which does not load
+    tasks.py, --repeat times each in fresh processes. Fails if the difference
+    of the medians is over the budget, which means a task imports something
+    heavy up front. The budget is relative so it holds on slow machines too.
+    """
+    import statistics
 
-    for station_id, station in game_data["stations"].items():
-        handle_station(station)
+    from tooling.bench import (
+        STARTUP_BASELINE_COMMAND,
+        STARTUP_BUDGET,
+        STARTUP_COMMAND,
+        time_startup,
+    )
 
-    output = Path(Path.home(), output)
-    print(f"Your graph file is at {output}.{format}")
-    dot.render(output)
+    budget = budget or STARTUP_BUDGET
+    baseline = statistics.median(time_startup(STARTUP_BASELINE_COMMAND, repeat))
+    median = statistics.median(time_startup(STARTUP_COMMAND, repeat))
+    added = median - baseline
+    print(
+        f"Cold invoke --list: median {median * 1000:.0f} ms, "
+        f"{added * 1000:.0f} ms over invoke itself, budget {budget * 1000:.0f} ms"
+    )
+    if added > budget:
+        print("Over budget, check `python -X importtime -c 'import tasks'`")
+        exit(1)
 
 
 @task
@@ -376,6 +1184,14 @@ def test_unit(ctx, watch=True, regexp=".*unit.*js$"):
     ctx.run(cmd, pty=True)
 
 
+@task
+def test_python(ctx, keyword=None):
+    """Run the tests of the python tooling, only those matching --keyword if given"""
+    keyword = f" -k '{keyword}'" if keyword else ""
+    cmd = f"{sys.executable} -m pytest{keyword}"
+    ctx.run(cmd, pty=True)
+
+
 @task
 def test_e2e(ctx, headless=False, mode="production"):
     """Run end 2 end tests"""
@@ -0,0 +1,63 @@
+import subprocess
+from json import loads
+
+import pytest
+
+from tooling import audio
+from tooling.audio import PROFILES, check_settings, transcode, transcode_game
+from tooling.synthetic import generate_game
+from validation.audio_metadata import ALLOWED_SAMPLE_RATES
+from validation.loading import load_complete_game
+from validation.model import build_game_model
+
+
+def test_profiles_encode_at_sample_rates_validation_allows():
+    for profile in PROFILES.values():
+        assert profile["sample_rate"] in ALLOWED_SAMPLE_RATES
+    check_settings("ffmpeg", list(PROFILES))
+
+
+def test_unknown_settings():
+    with pytest.raises(ValueError, match="Unknown encoder 'lame'"):
+        check_settings("lame", ["mobile"])
+    with pytest.raises(ValueError, match="Unknown profile 'hifi'"):
+        check_settings("copy", ["hifi"])
+
+
+def test_transcoded_names_do_not_collide():
+    names = {audio.transcoded_name(r, "mobile") for r in ["a.mp3", "a.wav", "a.ogg"]}
+    assert len(names) == 3
+    assert audio.transcoded_name("level/a.mp3", "low") == "level/a.mp3.low.mp3"
+
+
+def test_failed_encodes_leave_nothing_behind(tmp_path, monkeypatch):
+    def failing_encoder(source, destination, profile):
+        with open(destination, "wb") as handle:
+            handle.write(b"half an mp3")
+        raise subprocess.CalledProcessError(1, "ffmpeg")
+
+    monkeypatch.setitem(audio.ENCODERS, "failing", failing_encoder)
+    source = tmp_path / "a.wav"
+    source.write_bytes(b"audio")
+    cache_dir = tmp_path / "cache"
+
+    with pytest.raises(subprocess.CalledProcessError):
+        transcode(source, "mobile", PROFILES["mobile"], "failing", cache_dir)
+    assert [p for p in cache_dir.rglob("*") if p.is_file()] == []
+
+
+def test_transcode_game_with_non_ascii_text(tmp_path):
+    filename = generate_game(tmp_path / "game", stations=10, audio_files=5)
+    data = load_complete_game(filename)
+    data["name"] = "Sprickan på svenska"
+    game = build_game_model(filename, data)
+    output_dir = tmp_path / "out"
+
+    results = transcode_game(
+        game, output_dir, encoder_name="copy", cache_dir=tmp_path / "cache"
+    )
+
+    assert {name for _, name, _, _ in results} == set(PROFILES)
+    assert all(path.is_file() for _, _, path, _ in results)
+    written = loads((output_dir / "gameconfig.json").read_text(encoding="utf-8"))
+    assert written["name"] == "Sprickan på svenska"
@@ -0,0 +1,111 @@
+import threading
+
+import pytest
+
+from tooling.buildgraph import Stage, ordered, run_stages
+
+
+@pytest.fixture
+def project(tmp_path):
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "game.json").write_text("{}")
+    return tmp_path
+
+
+class Build:
+    """Stages that copy src to out and then to dist, recording what ran"""
+
+    def __init__(self, root):
+        self.root = root
+        self.ran = []
+        self.lock = threading.Lock()
+        self.stamps_file = root / "stamps.json"
+
+    def stage(self, name, source, target, deps=(), inputs=None):
+        def run():
+            with self.lock:
+                self.ran.append(name)
+            (self.root / target).mkdir(exist_ok=True)
+            data = (self.root / source / "game.json").read_text()
+            (self.root / target / "game.json").write_text(data)
+
+        return Stage(
+            name,
+            run,
+            inputs=[str(self.root / source)] if inputs is None else inputs,
+            deps=deps,
+            outputs=[str(self.root / target / "game.json")],
+        )
+
+    def stages(self):
+        return [
+            # Listed before what it depends on
+            self.stage("dist", "out", "dist", deps=("out",), inputs=[]),
+            self.stage("out", "src", "out"),
+        ]
+
+    def run(self, **kwargs):
+        self.ran = []
+        run_stages(self.stages(), stamps_file=self.stamps_file, **kwargs)
+        return self.ran
+
+
+def test_stages_run_after_what_they_depend_on(project):
+    build = Build(project)
+    assert [s.name for s in ordered(build.stages())] == ["out", "dist"]
+    assert build.run(jobs=4) == ["out", "dist"]
+    assert (project / "dist" / "game.json").read_text() == "{}"
+
+
+def test_unchanged_stages_are_skipped(project):
+    build = Build(project)
+    build.run()
+    assert build.run() == []
+    assert build.run(force=True) == ["out", "dist"]
+
+
+def test_changed_inputs_rebuild_downstream(project):
+    build = Build(project)
+    build.run()
+
+    (project / "src" / "game.json").write_text('{"changed": true}')
+    assert build.run() == ["out", "dist"]
+    assert (project / "dist" / "game.json").read_text() == '{"changed": true}'
+
+
+def test_missing_outputs_rebuild(project):
+    build = Build(project)
+    build.run()
+
+    (project / "dist" / "game.json").unlink()
+    assert build.run() == ["dist"]
+
+
+def test_dry_run_runs_and_records_nothing(project):
+    build = Build(project)
+    steps = run_stages(build.stages(), dry_run=True, stamps_file=build.stamps_file)
+
+    assert [(s.name, reason) for s, _, reason in steps] == [
+        ("out", "inputs changed"),
+        ("dist", "out will run"),
+    ]
+    assert build.ran == [] and not build.stamps_file.exists()
+
+
+def test_failed_stages_run_again(project):
+    build = Build(project)
+    (project / "src" / "game.json").unlink()
+    with pytest.raises(FileNotFoundError):
+        build.run()
+
+    (project / "src" / "game.json").write_text("{}")
+    assert build.run() == ["out", "dist"]
+
+
+def test_dependency_cycles_are_errors():
+    stages = [
+        Stage("a", lambda: None, deps=("b",)),
+        Stage("b", lambda: None, deps=("a",)),
+    ]
+    with pytest.raises(ValueError, match="depend on each other"):
+        ordered(stages)
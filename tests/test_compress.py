@@ -0,0 +1,61 @@
+import pytest
+
+from tooling.compress import MIN_SIZE, precompress
+
+COMPRESSIBLE = "{}" * MIN_SIZE
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    return tmp_path / "cache"
+
+
+@pytest.fixture
+def build(tmp_path):
+    build = tmp_path / "build"
+    (build / "data").mkdir(parents=True)
+    (build / "index.html").write_text("<p>" * MIN_SIZE)
+    (build / "data" / "game.json").write_text(COMPRESSIBLE)
+    (build / "data" / "archive.tar.gz").write_bytes(b"not ours")
+    return build
+
+
+def siblings(build):
+    return sorted(
+        p.relative_to(build).as_posix()
+        for p in build.rglob("*")
+        if p.suffix in (".br", ".gz") and p.name != "archive.tar.gz"
+    )
+
+
+def cached(cache_dir):
+    return sorted(p.name.split(".", 1)[0] for p in cache_dir.rglob("*.gz"))
+
+
+def test_siblings_of_files_that_no_longer_qualify_are_removed(build, cache_dir):
+    precompress(build, workers=1, cache_dir=cache_dir)
+    assert "data/game.json.gz" in siblings(build)
+    assert "index.html.gz" in siblings(build)
+
+    # Gone, and too small to be worth it
+    (build / "data" / "game.json").unlink()
+    (build / "index.html").write_text("<p>")
+    precompress(build, workers=1, cache_dir=cache_dir)
+
+    assert siblings(build) == []
+    assert (build / "data" / "archive.tar.gz").read_bytes() == b"not ours"
+
+
+def test_cache_only_keeps_what_the_last_run_used(build, cache_dir):
+    precompress(build, workers=1, cache_dir=cache_dir)
+    assert len(cached(cache_dir)) == 2
+
+    (build / "data" / "game.json").write_text(COMPRESSIBLE + " ")
+    precompress(build, workers=1, cache_dir=cache_dir)
+    assert len(cached(cache_dir)) == 2
+
+    (build / "data" / "game.json").unlink()
+    (build / "index.html").unlink()
+    precompress(build, workers=1, cache_dir=cache_dir)
+    assert cached(cache_dir) == []
+    assert list(cache_dir.iterdir()) == []
@@ -0,0 +1,178 @@
+from pathlib import PurePosixPath
+
+import pytest
+
+from tooling import deploy as deploy_module
+from tooling.deploy import (
+    LocalConnection,
+    SftpUnavailable,
+    deploy,
+    emptied_dirs,
+    local_backend,
+    manifest_path_for,
+    plan_deploy,
+    sftp_backend,
+)
+
+HOST = "sprickan.kulturhusetstadsteatern.se"
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(deploy_module, "HASH_CACHE_FILE", tmp_path / "hashes.json")
+    monkeypatch.setattr(deploy_module, "MANIFEST_DIR", tmp_path / "manifests")
+
+
+def deploy_to(build, target, **kwargs):
+    manifest_path = manifest_path_for("localhost", target.as_posix())
+    return deploy(build, local_backend(target), manifest_path, **kwargs)
+
+
+@pytest.fixture
+def build(tmp_path):
+    build = tmp_path / "build"
+    write(build / "index.html", "<html>")
+    write(build / "data" / "game.json", "{}")
+    write(build / "data" / "audio" / "a.mp3", "a")
+    return build
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+def test_plan_deploy():
+    local = {"same": {"hash": "1"}, "changed": {"hash": "2"}, "new": {"hash": "3"}}
+    remote = {
+        "same": {"hash": "1"},
+        "changed": {"hash": "old"},
+        "gone": {"hash": "4"},
+        "data/kept": {"hash": "5"},
+    }
+    upload, delete = plan_deploy(local, remote, excludes=["data/"])
+    assert upload == ["changed", "new"]
+    assert delete == ["gone"]
+
+
+def test_first_deploy_uploads_everything(tmp_path, build):
+    target = tmp_path / "www"
+    upload, delete = deploy_to(build, target)
+
+    assert upload == ["data/audio/a.mp3", "data/game.json", "index.html"]
+    assert delete == []
+    assert (target / "data" / "audio" / "a.mp3").read_text() == "a"
+
+
+def test_manifest_is_kept_out_of_the_target(tmp_path, build):
+    target = tmp_path / "www"
+    deploy_to(build, target)
+
+    assert manifest_path_for("localhost", target.as_posix()).is_file()
+    assert sorted(p.name for p in target.iterdir()) == ["data", "index.html"]
+
+
+def test_manifest_paths_differ_per_host_and_root():
+    paths = {
+        manifest_path_for(HOST, "/"),
+        manifest_path_for(HOST, "/www"),
+        manifest_path_for("localhost", "/"),
+    }
+    assert len(paths) == 3
+
+
+def test_default_deploy_to_the_top_of_the_server(tmp_path, build):
+    # What deploy-to-khst does without --remote-root or --manifest-path
+    target = tmp_path / "chroot"
+    manifest_path = manifest_path_for(HOST, "/")
+    deploy(build, local_backend(target), manifest_path)
+
+    assert manifest_path.is_file()
+    assert sorted(p.name for p in target.iterdir()) == ["data", "index.html"]
+    assert deploy(build, local_backend(target), manifest_path) == ([], [])
+
+
+def test_sftp_needs_paramiko(monkeypatch):
+    monkeypatch.setattr(deploy_module, "paramiko", None)
+    with pytest.raises(SftpUnavailable):
+        sftp_backend(HOST, "user", "password")
+
+
+def test_only_changes_are_deployed(tmp_path, build):
+    target = tmp_path / "www"
+    deploy_to(build, target)
+    assert deploy_to(build, target) == ([], [])
+
+    write(build / "index.html", "<html>changed")
+    (build / "data" / "audio" / "a.mp3").unlink()
+    upload, delete = deploy_to(build, target)
+
+    assert upload == ["index.html"]
+    assert delete == ["data/audio/a.mp3"]
+    assert (target / "index.html").read_text() == "<html>changed"
+    assert not (target / "data" / "audio" / "a.mp3").exists()
+
+
+def test_dry_run_changes_nothing(tmp_path, build):
+    target = tmp_path / "www"
+    upload, _ = deploy_to(build, target, dry_run=True)
+
+    assert len(upload) == 3
+    assert not target.exists()
+    assert not manifest_path_for("localhost", target.as_posix()).exists()
+
+
+def test_emptied_folders_are_removed(tmp_path, build):
+    target = tmp_path / "www"
+    write(build / "data" / "audio" / "level" / "b.mp3", "b")
+    deploy_to(build, target)
+
+    for path in ["audio/a.mp3", "audio/level/b.mp3", "game.json"]:
+        (build / "data" / path).unlink()
+    # Not ours, so its folder stays
+    write(target / "data" / "notes.txt", "keep")
+    _, delete = deploy_to(build, target)
+
+    assert len(delete) == 3
+    assert not (target / "data" / "audio").exists()
+    assert sorted(p.name for p in (target / "data").iterdir()) == ["notes.txt"]
+
+
+def test_emptied_dirs():
+    assert emptied_dirs(["a/b/c.mp3", "a/d.mp3", "e.html"], ["a/f.json"]) == [
+        PurePosixPath("a/b")
+    ]
+    assert emptied_dirs(["a/b/c.mp3"], []) == [
+        PurePosixPath("a/b"),
+        PurePosixPath("a"),
+    ]
+
+
+def test_excluded_files_are_neither_uploaded_nor_deleted(tmp_path, build):
+    target = tmp_path / "www"
+    deploy_to(build, target)
+
+    (build / "data" / "game.json").unlink()
+    upload, delete = deploy_to(build, target, excludes=["data/"])
+
+    assert upload == []
+    assert delete == []
+    assert (target / "data" / "game.json").exists()
+
+
+class FailingConnection(LocalConnection):
+    def upload(self, local_path, path):
+        if path == "index.html":
+            raise OSError("connection lost")
+        super().upload(local_path, path)
+
+
+def test_failed_deploy_resumes_where_it_stopped(tmp_path, build):
+    target = tmp_path / "www"
+    manifest_path = manifest_path_for("localhost", target.as_posix())
+    with pytest.raises(OSError):
+        deploy(build, lambda: FailingConnection(target), manifest_path, workers=1)
+
+    upload, delete = deploy_to(build, target)
+    assert upload == ["index.html"]
+    assert delete == []
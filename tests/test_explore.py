@@ -0,0 +1,93 @@
+from validation.explore import check_exploration, explore_game
+from validation.model import build_game_model
+
+
+def story(station_id, opens=(), events=()):
+    return {
+        "id": station_id,
+        "type": "story",
+        "filePath": f"{station_id}.json",
+        "events": list(events),
+        "opens": list(opens),
+    }
+
+
+def game(*stations, start=("start",)):
+    data = {
+        "name": "test",
+        "choiceInfix": "-option-",
+        "choiceNames": ["a", "b"],
+        "openStationsAtStart": list(start),
+        "stations": {s["id"]: s for s in stations},
+    }
+    return build_game_model("gameconfig.json", data)
+
+
+def messages(game):
+    return list(check_exploration(game, explore_game(game)))
+
+
+def test_game_that_always_ends():
+    example = game(story("start", ["middle"]), story("middle", ["end"]), story("end"))
+    assert messages(example) == []
+
+
+def test_unreachable_station():
+    found = messages(
+        game(story("start", ["end"]), story("end"), story("lost", ["end"]))
+    )
+    assert found == ["[021] The station 'lost' is not reached in any playthrough."]
+
+
+def test_dead_end():
+    found = messages(
+        game(story("start", ["trap", "end"]), story("trap", ["trap"]), story("end"))
+    )
+    assert found == [
+        "[022] A player can get stuck at 'trap' with nothing to scan that changes anything. Playthrough: scan start > scan trap"
+    ]
+
+
+def test_loop_without_an_ending():
+    found = messages(
+        game(
+            story("start", ["ping", "end"]),
+            story("ping", ["pong"]),
+            story("pong", ["ping"]),
+            story("end"),
+        )
+    )
+    assert found == [
+        "[023] A player can get caught going between 'ping', 'pong' without reaching an ending. Playthrough: scan start > scan ping"
+    ]
+
+
+def test_events_take_the_player_along():
+    # goToStation runs end right away, so trap never gets to open itself
+    found = messages(
+        game(
+            story("start", ["trap"]),
+            story("trap", ["trap"], [{"action": "goToStation", "toStation": "end"}]),
+            story("end"),
+        )
+    )
+    assert found == []
+
+
+def test_given_endings_are_fine():
+    example = game(story("start", ["loop"]), story("loop", ["loop"]))
+    exploration = explore_game(example)
+    assert list(check_exploration(example, exploration, endings={"loop"})) == []
+
+
+def test_partial_exploration_says_so():
+    example = game(
+        story("start", ["middle"]), story("middle", ["end"]), story("end"), story("lost")
+    )
+    exploration = explore_game(example, max_states=1)
+    found = list(check_exploration(example, exploration))
+    assert exploration.truncated == "--max-states 1"
+    # Unreached stations are only reported once every state has been visited
+    assert len(found) == 1 and found[0].startswith(
+        "[025] Stopped exploring at --max-states 1, after 1 of at least 2 game states."
+    )
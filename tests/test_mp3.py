@@ -0,0 +1,141 @@
+import pytest
+
+from validation.mp3 import (
+    find_frame,
+    id3v2_end,
+    parse_frame_header,
+    read_mp3,
+    scan_audio_file,
+)
+
+# MPEG-1 layer 3, no CRC, 44100 Hz, stereo. The bitrate index goes in the
+# high nibble of the third byte, 9 is 128 kbit/s.
+HEADER = (0xFF, 0xFB, 0x90, 0x00)
+
+
+def frame(bitrate_index=9, padding=0, body=b""):
+    header = bytes([0xFF, 0xFB, (bitrate_index << 4) | (padding << 1), 0x00])
+    length = parse_frame_header(header, 0)["length"]
+    return header + body + bytes(length - 4 - len(body))
+
+
+def xing_frame(frames):
+    # After the header and 32 bytes of stereo side info
+    flags = (1).to_bytes(4, "big")
+    return frame(body=bytes(32) + b"Xing" + flags + frames.to_bytes(4, "big"))
+
+
+def id3v2_tag(body):
+    size = len(body)
+    syncsafe = bytes((size >> shift) & 0x7F for shift in (21, 14, 7, 0))
+    return b"ID3\x04\x00\x00" + syncsafe + body
+
+
+def test_frame_header():
+    header = parse_frame_header(bytes(HEADER), 0)
+    assert header["version"] == "1" and header["layer"] == 3
+    assert (header["bitrate"], header["sample_rate"]) == (128000, 44100)
+    assert header["length"] == 417
+    assert parse_frame_header(frame(padding=1), 0)["length"] == 418
+
+
+@pytest.mark.parametrize(
+    "header",
+    [
+        b"\xff\xfb\x90",  # Too short
+        b"\xfe\xfb\x90\x00",  # No sync
+        b"\xff\xeb\x90\x00",  # Reserved version
+        b"\xff\xf9\x90\x00",  # Reserved layer
+        b"\xff\xfb\x00\x00",  # Free format
+        b"\xff\xfb\xf0\x00",  # Bad bitrate
+        b"\xff\xfb\x9c\x00",  # Reserved sample rate
+    ],
+)
+def test_bad_frame_headers(header):
+    assert parse_frame_header(header, 0) is None
+
+
+def test_sync_search_skips_junk_and_false_syncs():
+    # A lone header is not a frame unless another frame follows it
+    data = b"junk" + bytes(HEADER) + b"more junk" + frame() + frame()
+    assert find_frame(data, 0, len(data)) == len(data) - 2 * len(frame())
+
+
+def test_id3v2_tags_are_skipped():
+    # The tag holds what looks like a frame, which must not be read as one
+    tag = id3v2_tag(frame() + frame())
+    data = tag + frame() * 3
+    assert id3v2_end(data) == len(tag)
+
+    info, problems = read_mp3(data)
+    assert problems == []
+    assert info["frames"] == 3
+
+
+def test_constant_bitrate():
+    # Padded now and then, like encoders do to keep to 128 kbit/s at 44100 Hz
+    data = b"".join(frame(padding=int(i % 49 != 0)) for i in range(98))
+    info, problems = read_mp3(data)
+    assert problems == []
+    assert info["frames"] == 98 and info["duration"] == round(98 * 1152 / 44100, 3)
+    assert (info["bitrate"], info["vbr"]) == (128000, False)
+
+
+def test_constant_bitrate_without_padding():
+    info, _ = read_mp3(frame() * 10)
+    assert info["bitrate"] == 128000
+
+
+def test_variable_bitrate():
+    # 11 is 192 kbit/s
+    data = xing_frame(4) + frame(9) + frame(11) + frame(9) + frame(11)
+    info, problems = read_mp3(data)
+    assert problems == []
+    assert info["frames"] == 4 and info["vbr"]
+    assert 128000 < info["bitrate"] < 192000
+
+
+def test_xing_frame_count_must_match():
+    info, problems = read_mp3(xing_frame(5) + frame() * 3)
+    assert info["frames"] == 3
+    assert problems == ["has 3 frames but its header says 5"]
+
+
+def test_truncated_file():
+    info, problems = read_mp3(frame() * 3 + frame()[:100])
+    assert info["frames"] == 3
+    assert problems == ["is cut off, the last frame is missing 317 bytes"]
+
+
+def test_junk_between_frames():
+    _, problems = read_mp3(frame() * 2 + b"\x00" * 10 + frame() * 2)
+    assert problems == ["has 10 bytes between frames that are not audio"]
+
+
+def test_format_change():
+    mono = bytearray(frame())
+    mono[3] = 0xC0
+    _, problems = read_mp3(frame() * 2 + bytes(mono) * 2)
+    assert problems == [
+        "changes format at byte 834, from MPEG-1 layer 3 44100 Hz stereo "
+        "to MPEG-1 layer 3 44100 Hz mono"
+    ]
+
+
+def test_not_an_mp3():
+    assert read_mp3(b"RIFF" + bytes(1000)) == (
+        None,
+        ["is not an MP3 file, it has no MPEG audio frames"],
+    )
+
+
+def test_scan_audio_file(tmp_path):
+    path = tmp_path / "a.mp3"
+    path.write_bytes(frame() * 3)
+    metadata, problems = scan_audio_file(path)
+    assert problems == []
+    assert metadata["bytes"] == 3 * 417 and len(metadata["hash"]) == 64
+    assert metadata["sampleRate"] == 44100
+
+    (tmp_path / "empty.mp3").write_bytes(b"")
+    assert scan_audio_file(tmp_path / "empty.mp3")[1] == ["is empty"]
@@ -0,0 +1,76 @@
+from validation.program import END, check_compiled_game, compile_game
+
+
+def story(station_id, events=(), opens=()):
+    return {
+        "id": station_id,
+        "type": "story",
+        "filePath": f"{station_id}.json",
+        "events": list(events),
+        "opens": list(opens),
+    }
+
+
+def play(*audio, then=None):
+    event = {"action": "playAudio", "audioFilenames": list(audio)}
+    if then:
+        event["then"] = then
+    return event
+
+
+def game(*stations):
+    return {"stations": {s["id"]: s for s in stations}}
+
+
+def test_compiled_game_flattens_events():
+    compiled = compile_game(
+        game(
+            story(
+                "start",
+                [play("a.mp3", then={"action": "goToStation", "toStation": "end"})],
+                opens=["end"],
+            ),
+            story("end"),
+        )
+    )
+    program = compiled["programs"]["start"]
+
+    assert compiled["definedStations"] == 2
+    assert program["entry"] == [0]
+    assert [op["action"] for op in program["ops"]] == ["playAudio", "goToStation"]
+    assert program["ops"][0]["next"] == 1
+    assert program["ops"][1]["next"] == END
+    assert compiled["stations"][program["ops"][1]["toStation"]] == "end"
+    assert compiled["audio"][program["ops"][0]["audioFilenames"][0]] == "a.mp3"
+    assert list(check_compiled_game(compiled)) == []
+
+
+def test_jumps_that_go_nowhere():
+    compiled = compile_game(game(story("start", [play("a.mp3", then=play("b.mp3"))])))
+    program = compiled["programs"]["start"]
+    program["ops"][0]["next"] = 7
+    program["entry"].append(-3)
+
+    messages = list(check_compiled_game(compiled))
+    assert messages == [
+        "[014] Entry -3 of the program of station 'start' is not an op.",
+        "[014] Op 0 of the program of station 'start' jumps to 7, which is not an op.",
+    ]
+
+
+def test_stations_that_do_not_exist():
+    compiled = compile_game(
+        game(
+            story(
+                "start",
+                [{"action": "goToStation", "toStation": "nowhere"}],
+                opens=["missing"],
+            )
+        )
+    )
+
+    messages = list(check_compiled_game(compiled))
+    assert messages == [
+        "[015] Op 0 of the program of station 'start' refers to the station 'nowhere', which does not exist.",
+        "[015] The station 'start' opens the station 'missing', which does not exist.",
+    ]
@@ -0,0 +1,179 @@
+import subprocess
+import sys
+from io import StringIO
+from json import loads
+from pathlib import Path
+
+import pytest
+
+from tooling.synthetic import generate_game
+from validation.loading import GameLoadError, load_complete_game
+from validation.reporting import (
+    CODE_DESCRIPTIONS,
+    JsonLinesReporter,
+    SarifReporter,
+    TextReporter,
+    TooManyErrors,
+    make_reporter,
+    split_code,
+)
+from validation.validation import validate_game_helper
+
+MESSAGES = [
+    ("[005] The audiofile 'a.mp3' referenced from station 'x' does not exist.", "x.json"),
+    ("[013] The audiofile 'b.mp3' in game is not referenced from the game.", "b.mp3"),
+    ("A message without a code", None),
+]
+
+
+class KeepOpen(StringIO):
+    """A stream we can still read after the reporter closed it"""
+
+    def close(self):
+        pass
+
+
+def report(reporter_class, messages=MESSAGES, max_errors=None):
+    stream = KeepOpen()
+    reporter = reporter_class(stream=stream, max_errors=max_errors)
+    for message, filename in messages:
+        reporter.report(message, filename)
+    reporter.close()
+    return reporter, stream.getvalue()
+
+
+def test_split_code():
+    assert split_code("[005] Missing") == ("005", "Missing")
+    assert split_code("No code") == (None, "No code")
+
+
+def test_text_reporter_writes_messages_as_they_are():
+    reporter, output = report(TextReporter)
+    assert output.splitlines() == [message for message, _ in MESSAGES]
+    assert (reporter.error_count, reporter.warning_count) == (2, 1)
+
+
+def test_jsonl_records():
+    _, output = report(JsonLinesReporter)
+    records = [loads(line) for line in output.splitlines()]
+
+    assert [set(r) for r in records] == [{"code", "level", "file", "message"}] * 3
+    assert records[0] == {
+        "code": "005",
+        "level": "error",
+        "file": "x.json",
+        "message": "The audiofile 'a.mp3' referenced from station 'x' does not exist.",
+    }
+    assert records[1]["level"] == "warning"
+    assert records[2]["code"] is None and records[2]["file"] is None
+
+
+def test_sarif_log_is_well_formed():
+    _, output = report(SarifReporter)
+    log = loads(output)
+
+    assert log["version"] == "2.1.0"
+    assert log["$schema"].endswith("sarif-2.1.0.json")
+    (run,) = log["runs"]
+    rules = {rule["id"]: rule for rule in run["tool"]["driver"]["rules"]}
+    assert run["tool"]["driver"]["name"]
+    assert rules["005"]["shortDescription"]["text"] == CODE_DESCRIPTIONS["005"]
+
+    results = run["results"]
+    assert len(results) == 3
+    for result in results:
+        assert result["ruleId"] in rules
+        assert result["level"] in ("error", "warning")
+        assert result["message"]["text"]
+    assert results[0]["locations"] == [
+        {"physicalLocation": {"artifactLocation": {"uri": "x.json"}}}
+    ]
+    assert "locations" not in results[2]
+
+
+def test_sarif_log_without_results():
+    _, output = report(SarifReporter, messages=[])
+    (run,) = loads(output)["runs"]
+    assert run["results"] == [] and run["tool"]["driver"]["rules"] == []
+
+
+def test_max_errors_stops_at_the_nth_error_and_not_at_warnings():
+    messages = [MESSAGES[1], MESSAGES[0], MESSAGES[1], MESSAGES[0], MESSAGES[0]]
+    with pytest.raises(TooManyErrors):
+        report(TextReporter, messages, max_errors=2)
+
+    reporter = TextReporter(stream=KeepOpen(), max_errors=2)
+    with pytest.raises(TooManyErrors):
+        reporter.report_all(message for message, _ in messages)
+    assert (reporter.error_count, reporter.warning_count) == (2, 2)
+
+
+def test_make_reporter_writes_to_output(tmp_path):
+    output = tmp_path / "report.jsonl"
+    reporter = make_reporter("jsonl", output)
+    reporter.report(*MESSAGES[0])
+    reporter.close()
+    assert loads(output.read_text())["code"] == "005"
+
+
+def test_make_reporter_rejects_unknown_formats():
+    with pytest.raises(ValueError, match="use one of text, jsonl, sarif"):
+        make_reporter("xml")
+
+
+@pytest.fixture
+def broken_game(tmp_path):
+    """A synthetic game with its audio files missing"""
+    filename = generate_game(tmp_path / "game", stations=30, audio_files=20)
+    for audiofile in Path(filename).parent.rglob("*.mp3"):
+        audiofile.unlink()
+    return filename
+
+
+def validate(filename, reporter):
+    validate_game_helper(
+        filename, use_cache=False, reporter=reporter, check_audio=False
+    )
+
+
+def test_max_errors_stops_validation(broken_game):
+    all_errors = TextReporter(stream=KeepOpen())
+    validate(broken_game, all_errors)
+    assert all_errors.error_count > 3
+
+    stream = KeepOpen()
+    reporter = TextReporter(stream=stream, max_errors=3)
+    with pytest.raises(TooManyErrors):
+        validate(broken_game, reporter)
+    assert reporter.error_count == 3
+    assert len(stream.getvalue().splitlines()) == 3
+
+
+def first_station_path(filename):
+    station_path = loads(Path(filename).read_text())["stationPaths"][0]
+    return Path(filename).parent / station_path
+
+
+def test_broken_station_files_are_load_errors(broken_game):
+    station_path = first_station_path(broken_game)
+    station_path.write_text("{")
+    with pytest.raises(GameLoadError, match=r"^\[006\]") as err:
+        load_complete_game(broken_game)
+    assert Path(err.value.filename) == station_path
+
+    station_path.unlink()
+    with pytest.raises(GameLoadError, match=r"^\[028\]"):
+        load_complete_game(broken_game)
+
+
+def test_validate_game_reports_load_errors_as_sarif(broken_game):
+    first_station_path(broken_game).write_text("{")
+    result = subprocess.run(
+        [sys.executable, "-m", "invoke", "validate-game", str(broken_game)]
+        + ["--format", "sarif", "--no-cache", "--no-audio"],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 1
+    (run,) = loads(result.stdout)["runs"]
+    assert [r["ruleId"] for r in run["results"]] == ["006"]
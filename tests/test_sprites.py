@@ -0,0 +1,81 @@
+from json import dumps, loads
+
+import pytest
+
+from tooling.sprites import AUDIO_SPRITES_FILENAME, pack_game_sprites
+from tooling.synthetic import MP3_FRAME
+from validation import audio_metadata
+
+
+def write_json(path, data):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(dumps(data))
+
+
+def play(*audio):
+    return {"action": "playAudio", "audioFilenames": list(audio)}
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        audio_metadata, "METADATA_CACHE_FILE", tmp_path / "audio-metadata.json"
+    )
+    root = tmp_path / "game"
+    stations = {
+        "one": [
+            play("a.mp3", "b.mp3"),
+            # The same file as c.mp3 at two, spelled another way
+            {"action": "playBackgroundAudio", "audioFilename": "./c.mp3"},
+        ],
+        "two": [play("./b.mp3", "c.mp3")],
+    }
+    for station_id, events in stations.items():
+        write_json(
+            root / "stations" / f"{station_id}.json",
+            {"id": station_id, "type": "story", "events": events},
+        )
+    for name in ["a.mp3", "b.mp3", "c.mp3"]:
+        (root / name).write_bytes(MP3_FRAME * 4)
+
+    filename = root / "gameconfig.json"
+    write_json(
+        filename,
+        {
+            "stationPaths": [f"stations/{s}.json" for s in stations],
+            "stations": {},
+        },
+    )
+    return filename
+
+
+def station_audio(game, station_id):
+    station = loads((game.parent / "stations" / f"{station_id}.json").read_text())
+    return [
+        event.get("audioFilenames") or [event["audioFilename"]]
+        for event in station["events"]
+    ]
+
+
+def test_clips_are_packed_and_rewritten_however_they_are_spelled(game):
+    table = pack_game_sprites(game, workers=1)
+
+    ((sprite, entry),) = table["sprites"].items()
+    assert sorted(entry["clips"]) == ["a.mp3", "b.mp3"]
+    start, end = entry["clips"]["b.mp3"]
+    segment = f"./{sprite}#t={start:.3f},{end:.3f}"
+
+    ((a, b), background) = station_audio(game, "one")
+    assert a.startswith(f"./{sprite}#t=") and b == segment
+    assert background == ["./c.mp3"]
+    assert station_audio(game, "two") == [[segment, "c.mp3"]]
+    assert loads((game.parent / AUDIO_SPRITES_FILENAME).read_text()) == table
+
+
+def test_only_clips_nothing_plays_any_more_are_removed(game):
+    pack_game_sprites(game, workers=1)
+
+    root = game.parent
+    assert not (root / "a.mp3").exists() and not (root / "b.mp3").exists()
+    # Background audio as ./c.mp3 is never in a sprite, so c.mp3 stays too
+    assert (root / "c.mp3").exists()
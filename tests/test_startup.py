@@ -0,0 +1,24 @@
+import subprocess
+import sys
+
+# Imported by the tasks that use them when they run, never by `invoke --list`
+HEAVY_MODULES = {"validation", "jsonschema", "qrcode", "PIL", "graphviz", "paramiko"}
+
+
+def modules_after_import_tasks():
+    """The modules a fresh python has loaded after importing tasks.py"""
+    result = subprocess.run(
+        [sys.executable, "-c", "import sys, tasks; print('\\n'.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_tasks_import_nothing_heavy():
+    modules = modules_after_import_tasks()
+    assert {name.split(".")[0] for name in modules} & HEAVY_MODULES == set()
+    assert {name for name in modules if name.startswith("tooling.")} == {
+        "tooling.profiling"
+    }
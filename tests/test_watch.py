@@ -0,0 +1,72 @@
+from io import StringIO
+from pathlib import Path
+
+import pytest
+
+from tooling.synthetic import generate_game
+from validation import audio_metadata
+from validation.assets import asset_index_for
+from validation.model import forget_game_models
+from validation.reporting import TextReporter
+from validation.validation import validate_game_helper
+from validation.watch import GameWatcher
+
+
+@pytest.fixture
+def game(tmp_path, monkeypatch):
+    monkeypatch.setattr(
+        audio_metadata, "METADATA_CACHE_FILE", tmp_path / "audio-metadata.json"
+    )
+    return Path(generate_game(tmp_path / "game", stations=30, audio_files=20))
+
+
+def validate_game_messages(filename):
+    forget_game_models()
+    asset_index_for.cache_clear()
+    stream = StringIO()
+    validate_game_helper(filename, use_cache=False, reporter=TextReporter(stream))
+    return stream.getvalue().splitlines()
+
+
+def audio_files(game):
+    return sorted(game.parent.rglob("audio-*.mp3"))
+
+
+def test_watcher_checks_audio_headers_like_validate_game(game):
+    first, second, good = audio_files(game)[:3]
+    first.write_bytes(b"not an mp3")
+
+    watcher = GameWatcher(game)
+    messages = watcher.messages()
+    assert any(m.startswith("[018]") and first.name in m for m in messages)
+    assert sorted(messages) == sorted(validate_game_messages(game))
+
+    second.write_bytes(b"not an mp3 either")
+    assert watcher.update()
+    messages = watcher.messages()
+    assert any(m.startswith("[018]") and second.name in m for m in messages)
+    assert sorted(messages) == sorted(validate_game_messages(game))
+
+    # Fixed, and removed
+    second.write_bytes(good.read_bytes())
+    first.unlink()
+    assert watcher.update()
+    messages = watcher.messages()
+    assert not any(m.startswith("[018]") for m in messages)
+    assert any(m.startswith("[005]") and first.name in m for m in messages)
+    assert sorted(messages) == sorted(validate_game_messages(game))
+
+
+def test_watcher_load_messages_match_the_loader(game):
+    station_path = game.parent / "level-0000" / "story-00000.json"
+    station_path.write_text("{")
+    watcher = GameWatcher(game)
+    assert f"[006] Station file at path '{station_path}' is not valid JSON." in (
+        watcher.messages()
+    )
+
+    station_path.unlink()
+    assert watcher.update()
+    assert f"[028] Station file at path '{station_path}' does not exist." in (
+        watcher.messages()
+    )
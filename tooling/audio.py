@@ -0,0 +1,219 @@
+"""
+Transcode the audio of a game to delivery profiles.
+
+Every audio file the game refers to is transcoded to each profile in a pool of
+worker threads, the work itself is done by an encoder such as ffmpeg. Results
+are cached on the hash of the source file and the profile, so a file is only
+ever transcoded once per profile.
+"""
+import os
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+from json import dumps
+from pathlib import Path, PurePosixPath
+
+from validation.audio_metadata import ALLOWED_SAMPLE_RATES
+from validation.loading import write_complete_game
+from validation.references import rewrite_audio_references
+
+from .files import file_hash
+from .profiling import phase
+
+AUDIO_CACHE_DIR = "./.cache/audio"
+
+# What we send to phones. The first profile is the one the game build points at.
+# Sample rates have to be ones validation allows, see ALLOWED_SAMPLE_RATES.
+PROFILES = {
+    "mobile": {"bitrate": "96k", "channels": 2, "sample_rate": 44100},
+    "low": {"bitrate": "48k", "channels": 1, "sample_rate": 44100},
+}
+
+
+def encode_ffmpeg(source, destination, profile):
+    """Transcode to mp3 with a locally installed ffmpeg"""
+    cmd = [
+        "ffmpeg",
+        "-nostdin",
+        "-loglevel",
+        "error",
+        "-y",
+        "-i",
+        str(source),
+        "-map_metadata",
+        "-1",
+        "-codec:a",
+        "libmp3lame",
+        "-b:a",
+        profile["bitrate"],
+        "-ac",
+        str(profile["channels"]),
+        "-ar",
+        str(profile["sample_rate"]),
+        str(destination),
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def encode_copy(source, destination, profile):
+    """Stub encoder that copies the source as is. For testing the pipeline."""
+    shutil.copyfile(source, destination)
+
+
+ENCODERS = {
+    "ffmpeg": encode_ffmpeg,
+    "copy": encode_copy,
+}
+
+# Executables an encoder needs
+ENCODER_REQUIREMENTS = {
+    "ffmpeg": "ffmpeg",
+}
+
+
+class EncoderMissing(Exception):
+    """The executable an encoder needs is not installed"""
+
+
+def check_settings(encoder_name, profile_names):
+    """Raise ValueError for an encoder or profile we do not know"""
+    if encoder_name not in ENCODERS:
+        raise ValueError(
+            f"Unknown encoder '{encoder_name}', use one of {', '.join(ENCODERS)}."
+        )
+    for profile_name in profile_names:
+        if profile_name not in PROFILES:
+            raise ValueError(
+                f"Unknown profile '{profile_name}', use one of {', '.join(PROFILES)}."
+            )
+        sample_rate = PROFILES[profile_name]["sample_rate"]
+        if sample_rate not in ALLOWED_SAMPLE_RATES:
+            raise ValueError(
+                f"The profile '{profile_name}' encodes at {sample_rate} Hz, "
+                "which validation does not allow."
+            )
+
+
+def profile_hash(encoder_name, profile):
+    return sha256(
+        dumps({"encoder": encoder_name, "profile": profile}, sort_keys=True).encode()
+    ).hexdigest()
+
+
+def transcoded_name(audiofile_base, profile_name):
+    """
+    Where the transcoded version of a reference ends up, relative to the game.
+    The whole name is kept, so a.mp3 and a.wav do not end up as the same file.
+    """
+    path = PurePosixPath(audiofile_base)
+    return path.with_name(f"{path.name}.{profile_name}.mp3").as_posix()
+
+
+def transcode(
+    source,
+    profile_name,
+    profile,
+    encoder_name,
+    cache_dir=AUDIO_CACHE_DIR,
+    source_hash=None,
+):
+    """
+    Transcode a single file to a profile unless it is already in the cache.
+    Returns the path of the cached file and whether it was transcoded now.
+    Pass source_hash if the file was already hashed.
+    """
+    source_hash = source_hash or file_hash(source)
+    key = f"{source_hash}-{profile_hash(encoder_name, profile)[:16]}"
+    cached = Path(cache_dir) / profile_name / f"{key}.mp3"
+    if cached.exists():
+        return cached, False
+
+    cached.parent.mkdir(parents=True, exist_ok=True)
+
+    # Encode to a temporary file so an interrupted run, or another worker
+    # transcoding an identical file, never leaves a broken cache entry
+    handle, tmp_path = tempfile.mkstemp(suffix=".mp3", dir=cached.parent)
+    os.close(handle)
+    try:
+        ENCODERS[encoder_name](source, tmp_path, profile)
+        os.replace(tmp_path, cached)
+    finally:
+        # Only still there when the encoder failed
+        Path(tmp_path).unlink(missing_ok=True)
+    return cached, True
+
+
+def transcode_game(
+    game,
+    output_dir,
+    profile_names=None,
+    encoder_name="ffmpeg",
+    workers=None,
+    cache_dir=AUDIO_CACHE_DIR,
+):
+    """
+    Transcode all audio referenced from a GameModel to each profile, copy the
+    results to output_dir and write a copy of the game there that refers to
+    the transcoded files of the first profile.
+
+    Returns a list of (reference, profile name, output path, transcoded now).
+    Raises ValueError for an unknown encoder or profile and EncoderMissing if
+    the encoder can not run here.
+    """
+    profile_names = profile_names or list(PROFILES)
+    output_dir = Path(output_dir)
+    check_settings(encoder_name, profile_names)
+
+    requirement = ENCODER_REQUIREMENTS.get(encoder_name)
+    if requirement and shutil.which(requirement) is None:
+        raise EncoderMissing(
+            f"The {encoder_name} encoder needs '{requirement}' to be installed."
+        )
+
+    references = [
+        r for r in game.audio_references() if game.root.joinpath(r).is_file()
+    ]
+    jobs = [(r, p) for r in references for p in profile_names]
+
+    # Each source is hashed once, whatever the number of profiles
+    sources = [game.root / r for r in references]
+    with phase("hash"), ThreadPoolExecutor(max_workers=workers) as executor:
+        hashes = dict(zip(references, executor.map(file_hash, sources)))
+
+    def run(job):
+        reference, profile_name = job
+        cached, transcoded_now = transcode(
+            game.root / reference,
+            profile_name,
+            PROFILES[profile_name],
+            encoder_name,
+            cache_dir,
+            source_hash=hashes[reference],
+        )
+        output_path = output_dir / transcoded_name(reference, profile_name)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cached, output_path)
+        return reference, profile_name, output_path, transcoded_now
+
+    with phase("transcode"), ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(run, jobs))
+
+    # Point the build copy of the game at the first profile
+    transcoded = set(references)
+    delivery_profile = profile_names[0]
+    data = rewrite_audio_references(
+        game.data,
+        lambda r: transcoded_name(r, delivery_profile) if r in transcoded else r,
+    )
+    write_complete_game(data, game.filename, output_dir)
+
+    # Let anyone who wants another profile find it
+    profiles = {
+        reference: {p: transcoded_name(reference, p) for p in profile_names}
+        for reference in references
+    }
+    (output_dir / "audio-profiles.json").write_text(dumps(profiles, indent=2))
+
+    return results
@@ -0,0 +1,205 @@
+"""
+Time the stages of the tooling against a game.
+
+Each stage runs `repeat` times from cold in-process caches, and with the on
+disk caches it uses pointed at an empty folder, and we keep the fastest and
+the median run. Results are appended as json lines to a results
+file together with the commit and the size of the game, so runs from
+different commits can be compared.
+"""
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from io import StringIO
+from json import dumps, loads
+from pathlib import Path
+
+from validation import audio_metadata
+from validation.assets import asset_index_for
+from validation.explore import explore_game
+from validation.loading import load_complete_game
+from validation.model import forget_game_models, get_game_model
+from validation.reporting import TextReporter
+from validation.validation import deep_validation_of_events, validate_game_helper
+
+from .graph import game_graph
+from .qr import qr_code_jobs, render_qr_codes
+
+RESULTS_FILE = "./.cache/benchmarks.jsonl"
+
+# What authors wait for every time they run a task
+STARTUP_COMMAND = [sys.executable, "-m", "invoke", "--list"]
+
+# Starts invoke without loading tasks.py, what tasks.py adds is the difference
+STARTUP_BASELINE_COMMAND = [sys.executable, "-m", "invoke", "--version"]
+
+# Seconds tasks.py may add to a cold start of invoke. It added about 0.25 s
+# when it imported jsonschema, qrcode, PIL and graphviz up front, and about
+# 0.04 s without.
+STARTUP_BUDGET = 0.1
+
+
+def forget_caches():
+    """Drop what earlier stages left in memory"""
+    forget_game_models()
+    asset_index_for.cache_clear()
+
+
+@contextmanager
+def cold_disk_caches():
+    """Point the on disk caches of the stages at an empty folder while in use"""
+    saved = audio_metadata.METADATA_CACHE_FILE
+    with tempfile.TemporaryDirectory() as cache_dir:
+        audio_metadata.METADATA_CACHE_FILE = Path(cache_dir) / "audio-metadata.json"
+        try:
+            yield
+        finally:
+            audio_metadata.METADATA_CACHE_FILE = saved
+
+
+def bench_load(filename):
+    load_complete_game(filename)
+
+
+def bench_validate(filename):
+    validate_game_helper(
+        filename, use_cache=False, reporter=TextReporter(stream=StringIO())
+    )
+
+
+def bench_deep_validation(filename):
+    game = get_game_model(filename)
+    assets = asset_index_for(filename)
+    for station in game.stations.values():
+        for _ in deep_validation_of_events(
+            station.data, station.events, filename, assets
+        ):
+            pass
+
+
+def bench_graph(filename):
+    game_graph(get_game_model(filename)).source
+
+
+def bench_explore(filename):
+    # Only the state budget, a time budget would time itself
+    explore_game(get_game_model(filename), max_seconds=0)
+
+
+def bench_qr_codes(filename):
+    game = get_game_model(filename)
+    with tempfile.TemporaryDirectory() as output_dir:
+        jobs = qr_code_jobs(game, output_dir)
+        render_qr_codes(jobs, output_dir, force=True)
+
+
+STAGES = {
+    "load": bench_load,
+    "validate": bench_validate,
+    "deep-validation": bench_deep_validation,
+    "graph": bench_graph,
+    "explore": bench_explore,
+    "qr-codes": bench_qr_codes,
+}
+
+# Explore and qr-codes take long on big games, they only run when asked for
+DEFAULT_STAGES = ["load", "validate", "deep-validation", "graph"]
+
+
+def time_stage(stage, filename, repeat=3):
+    """Seconds for each run of a stage"""
+    timings = []
+    for _ in range(repeat):
+        forget_caches()
+        with cold_disk_caches():
+            start = time.perf_counter()
+            STAGES[stage](filename)
+            timings.append(time.perf_counter() - start)
+    return timings
+
+
+def time_startup(command=STARTUP_COMMAND, repeat=5):
+    """Seconds for each run of command, each in a fresh python process"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run(command, capture_output=True, check=True)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(filename, stages=None, repeat=3):
+    """Time the given stages, DEFAULT_STAGES by default. Returns a result record."""
+    game = get_game_model(filename)
+    results = {}
+    for stage in stages or DEFAULT_STAGES:
+        timings = time_stage(stage, filename, repeat)
+        results[stage] = {
+            "min": min(timings),
+            "median": statistics.median(timings),
+        }
+
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "commit": current_commit(),
+        "python": platform.python_version(),
+        "game": game.name,
+        "stations": len(game.stations),
+        "events": sum(len(s.events) for s in game.stations.values()),
+        "repeat": repeat,
+        "stages": results,
+    }
+
+
+def load_results(results_file=RESULTS_FILE):
+    try:
+        lines = Path(results_file).read_text().splitlines()
+    except FileNotFoundError:
+        return []
+    return [loads(line) for line in lines if line.strip()]
+
+
+def save_result(result, results_file=RESULTS_FILE):
+    Path(results_file).parent.mkdir(parents=True, exist_ok=True)
+    with open(results_file, "a") as handle:
+        handle.write(dumps(result) + "\n")
+
+
+def previous_result(result, results):
+    """The latest earlier result for the same game"""
+    for earlier in reversed(results):
+        if earlier["game"] == result["game"] and earlier["stations"] == result["stations"]:
+            return earlier
+    return None
+
+
+def format_result(result, previous=None):
+    """A table of median timings, compared with a previous result if given"""
+    lines = [
+        f"{result['game']}: {result['stations']} stations, {result['events']} events, commit {result['commit']}"
+    ]
+    for stage, timing in result["stages"].items():
+        line = f"  {stage:<16} {timing['median'] * 1000:10.1f} ms"
+        earlier = previous["stages"].get(stage) if previous else None
+        if earlier:
+            change = timing["median"] / earlier["median"] - 1
+            line += f"  {change:+7.1%} vs {previous['commit']}"
+        lines.append(line)
+    return "\n".join(lines)
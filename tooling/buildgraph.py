@@ -0,0 +1,199 @@
+"""
+Run the stages of a build as a dependency graph, skipping what is up to date.
+
+Every stage lists the files and settings it depends on and the stages it comes
+after. Its stamp is a hash of those inputs and of the stamps of the stages it
+depends on, so a change anywhere upstream reaches everything downstream. A
+stage whose stamp matches the one recorded after its last successful run, and
+whose outputs are still there, is skipped.
+
+Stages whose dependencies are done run concurrently in a thread pool. Most of
+the work happens in subprocesses or process pools, so threads are enough.
+"""
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from hashlib import sha256
+from json import dumps, load
+from json.decoder import JSONDecodeError
+from pathlib import Path
+from typing import Callable, List, Tuple
+
+from .profiling import phase
+
+STAMPS_FILE = "./.cache/build-stamps.json"
+
+
+@dataclass
+class Stage:
+    name: str
+    run: Callable[[], None]
+    inputs: List[str] = field(default_factory=list)
+    excludes: Tuple[str, ...] = ()
+    deps: Tuple[str, ...] = ()
+    outputs: List[str] = field(default_factory=list)
+    settings: dict = field(default_factory=dict)
+    # Stages like a deploy depend on state we can't see, they always run
+    always: bool = False
+
+
+def input_files(paths, excludes=()):
+    """Every file below paths and not below excludes, in a stable order"""
+    excludes = [Path(e) for e in excludes]
+    files = []
+    for path in map(Path, paths):
+        if path.is_file():
+            files.append(path)
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirpath = Path(dirpath)
+            dirnames[:] = sorted(d for d in dirnames if dirpath / d not in excludes)
+            files += [dirpath / name for name in sorted(filenames)]
+    return files
+
+
+def stage_stamp(stage, dep_stamps):
+    """
+    Hash of what a stage depends on. Files count by path, size and modification
+    time, which is what we can get without reading every byte.
+    """
+    digest = sha256()
+    key = dumps([stage.name, stage.settings, dep_stamps], sort_keys=True)
+    digest.update(key.encode())
+    for path in input_files(stage.inputs, stage.excludes):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        line = f"{path.as_posix()}:{stat.st_size}:{stat.st_mtime_ns}\n"
+        digest.update(line.encode())
+    return digest.hexdigest()
+
+
+def load_stamps(stamps_file=STAMPS_FILE):
+    try:
+        with open(stamps_file) as handle:
+            return load(handle)
+    except (FileNotFoundError, JSONDecodeError):
+        return {}
+
+
+def save_stamps(stamps, stamps_file=STAMPS_FILE):
+    Path(stamps_file).parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = Path(stamps_file).with_suffix(".tmp")
+    tmp_path.write_text(dumps(stamps, indent=2, sort_keys=True))
+    tmp_path.replace(stamps_file)
+
+
+def ordered(stages):
+    """The stages with every stage after the stages it depends on"""
+    by_name = {stage.name: stage for stage in stages}
+    result = []
+    visiting = set()
+    done = set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Build stages depend on each other through {name}")
+        if name not in by_name:
+            raise ValueError(f"Build stage depends on unknown stage {name}")
+        visiting.add(name)
+        for dep in by_name[name].deps:
+            visit(dep)
+        visiting.discard(name)
+        done.add(name)
+        result.append(by_name[name])
+
+    for stage in stages:
+        visit(stage.name)
+    return result
+
+
+def plan(stages, stamps, force=False):
+    """
+    The stamp of every stage and whether it has to run, as a list of
+    (stage, stamp, reason) in dependency order. reason is None for stages that
+    are up to date.
+    """
+    current = {}
+    result = []
+    rebuilt = set()
+    for stage in ordered(stages):
+        stamp = stage_stamp(stage, [current[dep] for dep in stage.deps])
+        current[stage.name] = stamp
+
+        if force:
+            reason = "forced"
+        elif stage.always:
+            reason = "always runs"
+        elif rebuilt & set(stage.deps):
+            reason = f"{', '.join(sorted(rebuilt & set(stage.deps)))} will run"
+        elif stamps.get(stage.name) != stamp:
+            reason = "inputs changed"
+        elif not all(Path(output).exists() for output in stage.outputs):
+            reason = "outputs missing"
+        else:
+            reason = None
+
+        if reason:
+            rebuilt.add(stage.name)
+        result.append((stage, stamp, reason))
+    return result
+
+
+def format_plan(steps):
+    lines = []
+    for stage, _, reason in steps:
+        status = f"run, {reason}" if reason else "up to date"
+        lines.append(f"  {stage.name:<24} {status}")
+    return "\n".join(lines)
+
+
+def run_stages(stages, jobs=4, force=False, dry_run=False, stamps_file=STAMPS_FILE):
+    """
+    Run what is out of date, each stage as soon as the stages it depends on
+    are done. Returns the plan. Raises the first error a stage raises, after
+    the stages already running have finished.
+    """
+    stamps = load_stamps(stamps_file)
+    steps = plan(stages, stamps, force)
+    print(format_plan(steps))
+    if dry_run:
+        return steps
+
+    pending = {s.name: (s, stamp) for s, stamp, reason in steps if reason}
+    done = {stage.name for stage, _, reason in steps if not reason}
+    running = {}
+    error = None
+
+    def run(stage):
+        with phase(stage.name):
+            stage.run()
+
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            if error is None:
+                for name, (stage, stamp) in list(pending.items()):
+                    if all(dep in done for dep in stage.deps):
+                        running[executor.submit(run, stage)] = (stage, stamp)
+                        del pending[name]
+
+            if not running:
+                break
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, stamp = running.pop(future)
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    stamps.pop(stage.name, None)
+                else:
+                    done.add(stage.name)
+                    if not stage.always:
+                        stamps[stage.name] = stamp
+                save_stamps(stamps, stamps_file)
+
+    if error is not None:
+        raise error
+    return steps
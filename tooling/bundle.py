@@ -0,0 +1,48 @@
+"""
+Compile a complete game into a single file.
+
+The bundle is the gameconfig with the stations filled in, the same shape the
+client builds after fetching every station file, so the client can boot from
+one request instead of one per station.
+"""
+from json import dumps
+from pathlib import Path
+
+from validation.validation import format_validation_errors, validate_station
+from validation.registry import iter_errors
+
+BUNDLE_FILENAME = "game-bundle.json"
+
+BUNDLE_VERSION = 1
+
+
+def validate_game_data(data, filename):
+    """Schema validate the gameconfig and every station. Returns output lines."""
+    gameconfig = {k: v for k, v in data.items() if k != "stations"}
+    gameconfig["stations"] = {}
+
+    lines = format_validation_errors(list(iter_errors("game.json", gameconfig)), filename)
+    for station in data["stations"].values():
+        lines += format_validation_errors(validate_station(station), station["filePath"])
+    return lines
+
+
+def compile_bundle(game):
+    """The bundle for a GameModel, as a dict"""
+    stations = {}
+    for station_id, station in game.stations.items():
+        stations[station_id] = {k: v for k, v in station.data.items() if k != "filePath"}
+
+    bundle = dict(game.data)
+    bundle["stations"] = stations
+    bundle["bundleVersion"] = BUNDLE_VERSION
+    return bundle
+
+
+def write_minified_json(data, output):
+    """Write data as json with no unneeded whitespace"""
+    Path(output).parent.mkdir(parents=True, exist_ok=True)
+    Path(output).write_text(
+        dumps(data, separators=(",", ":"), ensure_ascii=False), encoding="utf-8"
+    )
+    return output
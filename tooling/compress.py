@@ -0,0 +1,177 @@
+"""
+Write precompressed copies of the text files in a build.
+
+For every file worth compressing we write a .gz sibling, and a .br sibling if
+brotli is installed, so the server can send them as they are to clients that
+accept them instead of compressing on every request. A sibling is only kept
+when it is clearly smaller than the file itself.
+
+Compressing at the highest levels is slow, so compressed data is cached in
+.cache/compressed keyed on the hash of the content. After a fresh build only
+files that really changed are compressed again. Only what the files of the
+last run compressed to is kept.
+"""
+import gzip
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .files import file_hash
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_DIR = "./.cache/compressed"
+
+# Audio, images and fonts are compressed already
+COMPRESSIBLE_SUFFIXES = {
+    ".css",
+    ".html",
+    ".ico",
+    ".js",
+    ".json",
+    ".map",
+    ".mjs",
+    ".svg",
+    ".txt",
+    ".webmanifest",
+    ".xml",
+}
+
+# Every sibling we may have written, also those of encodings we can't write now
+SUFFIXES = (".br", ".gz")
+
+# Smaller than this fits in a packet or two anyway
+MIN_SIZE = 1024
+
+# A sibling has to be at most this share of the original to be worth it
+MAX_RATIO = 0.9
+
+
+def encodings():
+    """The encodings we can write, as (name, suffix)"""
+    if brotli is None:
+        return [("gzip", ".gz")]
+    return [("br", ".br"), ("gzip", ".gz")]
+
+
+def compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=11)
+    # mtime=0 so the same content always gives the same bytes
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def compressible_files(root):
+    """Files below root that are worth compressing"""
+    files = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            path = Path(dirpath) / name
+            if path.suffix.lower() not in COMPRESSIBLE_SUFFIXES:
+                continue
+            if path.stat().st_size < MIN_SIZE:
+                continue
+            files.append(path)
+    return files
+
+
+def cache_path(digest, suffix, cache_dir=CACHE_DIR):
+    return Path(cache_dir) / digest[:2] / f"{digest}{suffix}"
+
+
+def _compress_file(job):
+    """Compress a file into the cache. Returns the suffixes that paid off."""
+    path, digest, cache_dir = job
+    data = Path(path).read_bytes()
+    kept = []
+    for encoding, suffix in encodings():
+        cached = cache_path(digest, suffix, cache_dir)
+        skipped = cached.with_name(cached.name + ".skip")
+        if cached.exists():
+            kept.append(suffix)
+            continue
+        if skipped.exists():
+            continue
+
+        compressed = compress(data, encoding)
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        if len(compressed) <= len(data) * MAX_RATIO:
+            tmp_path = cached.with_name(cached.name + ".tmp")
+            tmp_path.write_bytes(compressed)
+            tmp_path.replace(cached)
+            kept.append(suffix)
+        else:
+            # Remember that this one does not pay off
+            skipped.touch()
+    return path, digest, kept
+
+
+def orphaned_siblings(root, files):
+    """
+    Siblings below root of files that are gone or no longer worth compressing.
+    Only those of compressible file types, a .tar.gz is not ours.
+    """
+    files = set(files)
+    orphans = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            path = Path(dirpath) / name
+            original = path.with_suffix("")
+            if (
+                path.suffix in SUFFIXES
+                and original.suffix.lower() in COMPRESSIBLE_SUFFIXES
+                and original not in files
+            ):
+                orphans.append(path)
+    return orphans
+
+
+def prune_cache(digests, cache_dir=CACHE_DIR):
+    """Remove what the cache holds for content other than digests"""
+    for dirpath, _, filenames in os.walk(cache_dir, topdown=False):
+        for name in filenames:
+            if name.split(".", 1)[0] not in digests:
+                (Path(dirpath) / name).unlink()
+        if Path(dirpath) != Path(cache_dir) and not os.listdir(dirpath):
+            os.rmdir(dirpath)
+
+
+def precompress(root, workers=None, cache_dir=CACHE_DIR):
+    """
+    Write compressed siblings for the compressible files below root, and remove
+    stale ones, also of files that are gone or no longer worth compressing.
+    Returns a list of (path, original size, {suffix: size}).
+    """
+    files = compressible_files(root)
+    for orphan in orphaned_siblings(root, files):
+        orphan.unlink()
+
+    jobs = [(path, file_hash(path), cache_dir) for path in files]
+
+    if len(jobs) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            compressed = list(executor.map(_compress_file, jobs, chunksize=4))
+    else:
+        compressed = [_compress_file(job) for job in jobs]
+
+    results = []
+    for path, digest, kept in compressed:
+        stat = path.stat()
+        sizes = {}
+        for suffix in SUFFIXES:
+            sibling = path.with_name(path.name + suffix)
+            if suffix not in kept:
+                sibling.unlink(missing_ok=True)
+                continue
+            shutil.copyfile(cache_path(digest, suffix, cache_dir), sibling)
+            # Same time as the original, so servers see them as the same version
+            os.utime(sibling, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+            sizes[suffix] = sibling.stat().st_size
+        results.append((path, stat.st_size, sizes))
+
+    prune_cache({digest for _, digest, _ in compressed}, cache_dir)
+    return results
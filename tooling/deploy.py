@@ -0,0 +1,264 @@
+"""
+Deploy a build by uploading only what changed.
+
+The server keeps a manifest with the hash of every file we uploaded in the last
+deploy. We compare that with the build to decide what to upload and what to
+delete, so the remote tree never has to be listed, and then upload over a pool
+of connections that stay open for the whole deploy.
+
+The manifest lists every file we deployed, so it is not kept in the folder we
+deploy to, where the web server would hand it out, and a chrooted sftp account
+may have nowhere else to put it. It is kept on this machine in .cache, one per
+host and remote root. A deploy from a machine without it uploads everything.
+
+A backend is a function that opens a new connection. Connections have
+upload, delete, remove_dir and close methods taking paths relative to the
+remote root.
+"""
+import os
+import re
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from json import dumps, load, loads
+from json.decoder import JSONDecodeError
+from pathlib import Path, PurePosixPath
+
+from .files import file_hash
+from .profiling import phase
+
+try:
+    import paramiko
+except ImportError:
+    paramiko = None
+
+# Hashes of local files, keyed on size and modification time
+HASH_CACHE_FILE = "./.cache/deploy-hashes.json"
+
+# The manifests of the last deploy to each host and remote root
+MANIFEST_DIR = "./.cache/deploy-manifests"
+
+
+class SftpUnavailable(Exception):
+    """Raised when deploying over sftp without paramiko installed"""
+
+
+def manifest_path_for(host, root):
+    """Where the manifest of deploys to root on host is kept"""
+    name = re.sub(r"[^\w.-]+", "-", f"{host}/{root}").strip("-")
+    return Path(MANIFEST_DIR) / f"{name}.json"
+
+
+class LocalConnection:
+    """Deploy to a folder on this machine. Mostly for testing."""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def upload(self, local_path, path):
+        (self.root / path).parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(local_path, self.root / path)
+
+    def delete(self, path):
+        try:
+            (self.root / path).unlink()
+        except FileNotFoundError:
+            pass
+
+    def remove_dir(self, path):
+        try:
+            (self.root / path).rmdir()
+        except OSError:
+            # Not empty, or already gone
+            pass
+
+    def close(self):
+        pass
+
+
+class SftpConnection:
+    """Deploy over sftp"""
+
+    def __init__(self, host, port, username, password, root):
+        self.transport = paramiko.Transport((host, port))
+        self.transport.connect(username=username, password=password)
+        self.sftp = paramiko.SFTPClient.from_transport(self.transport)
+        self.root = PurePosixPath(root)
+        self.known_dirs = set()
+
+    def _makedirs(self, path):
+        missing = []
+        for parent in PurePosixPath(path).parents:
+            if parent.as_posix() in self.known_dirs or parent == PurePosixPath("/"):
+                break
+            missing.append(parent)
+
+        for parent in reversed(missing):
+            try:
+                self.sftp.mkdir(parent.as_posix())
+            except IOError:
+                # Already exists
+                pass
+            self.known_dirs.add(parent.as_posix())
+
+    def upload(self, local_path, path):
+        self._makedirs(self.root / path)
+        self.sftp.put(str(local_path), (self.root / path).as_posix())
+
+    def delete(self, path):
+        try:
+            self.sftp.remove((self.root / path).as_posix())
+        except IOError:
+            pass
+
+    def remove_dir(self, path):
+        try:
+            self.sftp.rmdir((self.root / path).as_posix())
+        except IOError:
+            # Not empty, or already gone
+            pass
+        self.known_dirs.discard((self.root / path).as_posix())
+
+    def close(self):
+        self.sftp.close()
+        self.transport.close()
+
+
+def local_backend(root):
+    return lambda: LocalConnection(root)
+
+
+def sftp_backend(host, username, password, port=22, root="/"):
+    """Deploy to root on an sftp server. Raises SftpUnavailable without paramiko."""
+    if paramiko is None:
+        raise SftpUnavailable(
+            "Deploying over sftp needs paramiko. pip install paramiko"
+        )
+    return lambda: SftpConnection(host, port, username, password, root)
+
+
+def is_excluded(path, excludes):
+    """Is a relative path inside one of the excluded folders"""
+    return any(path == e or path.startswith(e.rstrip("/") + "/") for e in excludes)
+
+
+def local_manifest(source_dir, excludes=()):
+    """Hash and size of every file in source_dir, keyed on relative path"""
+    source_dir = Path(source_dir)
+
+    try:
+        with open(HASH_CACHE_FILE) as handle:
+            hash_cache = load(handle)
+    except (FileNotFoundError, JSONDecodeError):
+        hash_cache = {}
+
+    # Only keep the hashes of files that are still around
+    used_hashes = {}
+    manifest = {}
+    for dirpath, dirnames, filenames in os.walk(source_dir):
+        for name in filenames:
+            full_path = Path(dirpath) / name
+            path = full_path.relative_to(source_dir).as_posix()
+            if is_excluded(path, excludes):
+                continue
+
+            stat = full_path.stat()
+            cache_key = f"{full_path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+            digest = hash_cache.get(cache_key) or file_hash(full_path)
+            used_hashes[cache_key] = digest
+            manifest[path] = {"hash": digest, "size": stat.st_size}
+
+    Path(HASH_CACHE_FILE).parent.mkdir(parents=True, exist_ok=True)
+    Path(HASH_CACHE_FILE).write_text(dumps(used_hashes))
+    return manifest
+
+
+def plan_deploy(local, remote, excludes=()):
+    """The paths to upload and to delete to make remote look like local"""
+    upload = sorted(
+        path
+        for path, entry in local.items()
+        if remote.get(path, {}).get("hash") != entry["hash"]
+    )
+    delete = sorted(
+        path for path in remote if path not in local and not is_excluded(path, excludes)
+    )
+    return upload, delete
+
+
+def emptied_dirs(deleted, remaining):
+    """Folders of the deleted paths without any remaining path, deepest first"""
+    dirs = {p for path in deleted for p in PurePosixPath(path).parents}
+    dirs -= {p for path in remaining for p in PurePosixPath(path).parents}
+    dirs.discard(PurePosixPath("."))
+    return sorted(dirs, key=lambda p: (-len(p.parts), p.as_posix()))
+
+
+def deploy(
+    source_dir, backend, manifest_path, workers=10, excludes=(), dry_run=False
+):
+    """
+    Upload what changed in source_dir since the last deploy, as recorded in
+    the manifest at manifest_path, delete what is gone and remove the folders
+    that left empty. Returns the lists of uploaded and deleted paths.
+    """
+    manifest_path = Path(manifest_path)
+    with phase("hash local files"):
+        local = local_manifest(source_dir, excludes)
+
+    try:
+        remote = loads(manifest_path.read_text())
+    except (FileNotFoundError, JSONDecodeError):
+        remote = {}
+
+    upload, delete = plan_deploy(local, remote, excludes)
+    if dry_run:
+        return upload, delete
+
+    # One persistent connection per worker thread
+    thread_data = threading.local()
+    connections = []
+    connections_lock = threading.Lock()
+
+    def get_connection():
+        if not hasattr(thread_data, "connection"):
+            thread_data.connection = backend()
+            with connections_lock:
+                connections.append(thread_data.connection)
+        return thread_data.connection
+
+    def do_upload(path):
+        get_connection().upload(Path(source_dir) / path, path)
+        return path
+
+    def do_delete(path):
+        get_connection().delete(path)
+        return path
+
+    # What is on the server, updated as we go so that a failed deploy can be resumed
+    state = dict(remote)
+    try:
+        with phase("upload"), ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(do_upload, p): ("upload", p) for p in upload}
+            futures.update({executor.submit(do_delete, p): ("delete", p) for p in delete})
+
+            for future in as_completed(futures):
+                action, path = futures[future]
+                future.result()
+                if action == "upload":
+                    state[path] = local[path]
+                else:
+                    state.pop(path, None)
+        # Files we never deployed keep a folder, removing it then fails
+        if delete:
+            with phase("remove empty folders"):
+                connection = get_connection()
+                for path in emptied_dirs(delete, state):
+                    connection.remove_dir(path.as_posix())
+    finally:
+        manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        manifest_path.write_text(dumps(state, sort_keys=True))
+        for connection in connections:
+            connection.close()
+
+    return upload, delete
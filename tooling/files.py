@@ -0,0 +1,41 @@
+"""
+Helpers for working with the files of a build.
+"""
+from hashlib import sha256
+from json import dumps, load
+from json.decoder import JSONDecodeError
+from pathlib import Path
+
+
+def file_hash(path):
+    """sha256 of the content of a file"""
+    digest = sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cached_file_hashes(paths, cache_file):
+    """
+    sha256 of each file in paths, as a dict keyed on path. Hashes are cached in
+    cache_file on path, size and modification time, so unchanged files are not
+    read again. Only the entries for paths are kept in the cache.
+    """
+    try:
+        with open(cache_file) as handle:
+            cache = load(handle)
+    except (FileNotFoundError, JSONDecodeError):
+        cache = {}
+
+    used = {}
+    hashes = {}
+    for path in paths:
+        stat = Path(path).stat()
+        key = f"{Path(path).resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+        used[key] = cache.get(key) or file_hash(path)
+        hashes[path] = used[key]
+
+    Path(cache_file).parent.mkdir(parents=True, exist_ok=True)
+    Path(cache_file).write_text(dumps(used))
+    return hashes
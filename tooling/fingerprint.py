@@ -0,0 +1,82 @@
+"""
+Give the audio files of a built game content hashed names.
+
+Every referenced file is moved to assets/<hash><extension> in the game folder of
+the build, byte identical files end up as a single copy, and the gameconfig and
+station files are rewritten to point at the new names. A name never changes
+unless the content does, so the files can be cached forever.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path, PurePosixPath
+
+from validation.loading import load_complete_game, write_complete_game
+from validation.references import game_audio_references, rewrite_audio_references
+
+from .files import file_hash
+from .profiling import phase
+
+FINGERPRINT_DIR = "assets"
+
+# Length of the hash in the file names
+HASH_LENGTH = 16
+
+
+def fingerprinted_name(reference, digest):
+    suffix = PurePosixPath(reference).suffix.lower()
+    return f"./{FINGERPRINT_DIR}/{digest[:HASH_LENGTH]}{suffix}"
+
+
+def fingerprint_game(filename, workers=None):
+    """
+    Fingerprint the audio of the game with the gameconfig at filename, in place.
+
+    Returns a dict from old to new reference and the number of bytes saved by
+    removing duplicates.
+    """
+    root = Path(filename).parent
+    with phase("load game"):
+        data = load_complete_game(filename)
+
+    references = [
+        r for r in dict.fromkeys(game_audio_references(data)) if (root / r).is_file()
+    ]
+    with phase("hash audio"), ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = list(executor.map(lambda r: file_hash(root / r), references))
+
+    renames = {}
+    sources = {}
+    for reference, digest in zip(references, digests):
+        new_reference = fingerprinted_name(reference, digest)
+        renames[reference] = new_reference
+        sources.setdefault(new_reference, set()).add((root / reference).resolve())
+
+    with phase("move audio"):
+        saved = move_to_fingerprinted_names(root, sources)
+
+    with phase("rewrite game"):
+        data = rewrite_audio_references(data, lambda r: renames.get(r, r))
+        write_complete_game(data, filename, root)
+
+    return renames, saved
+
+
+def move_to_fingerprinted_names(root, sources):
+    """
+    Move files to their fingerprinted names, removing duplicates. Returns the
+    number of bytes saved.
+    """
+    saved = 0
+    for new_reference, paths in sources.items():
+        target = (root / new_reference).resolve()
+        target.parent.mkdir(parents=True, exist_ok=True)
+
+        for path in sorted(paths):
+            if path == target:
+                continue
+            if target.exists():
+                saved += path.stat().st_size
+                path.unlink()
+            else:
+                os.replace(path, target)
+    return saved
@@ -0,0 +1,18 @@
+"""
+Graph of the stations of a game and the stations they open.
+"""
+import graphviz
+
+
+def game_graph(game, format="png"):
+    """A graphviz Digraph with a node per station and an edge per opened station"""
+    dot = graphviz.Digraph(comment=game.name, format=format)
+
+    # add a node for each station
+    for station_id in game.stations:
+        dot.node(station_id, station_id)
+
+    for src_station, dst_station in game.edges:
+        dot.edge(src_station, dst_station)
+
+    return dot
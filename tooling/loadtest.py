@@ -0,0 +1,353 @@
+"""
+Simulate an audience playing a game against a served build.
+
+Every visitor opens the app, which loads the page, the scripts and styles it
+links to, the gameconfig and every station file. Then the visitor walks the
+station graph from the stations that are open at the start, and at each
+station fetches the audio it plays, picking one file where a station
+chooses between several.
+
+Visitors run concurrently as asyncio tasks, each with its own keep-alive
+connection, the way a phone would. We record the time to the last byte of
+every request and report throughput, latency percentiles per kind of asset
+and bytes transferred.
+
+The client only needs the standard library. It speaks just enough HTTP/1.1
+for static file servers.
+"""
+import asyncio
+import functools
+import random
+import re
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path, PurePosixPath
+from urllib.parse import quote, urljoin, urlsplit
+
+from validation.events import event_audio, walk_events
+from validation.references import audio_file
+
+ASSET_KINDS = {
+    ".html": "html",
+    ".js": "script",
+    ".mjs": "script",
+    ".css": "style",
+    ".json": "json",
+    ".mp3": "audio",
+    ".m4a": "audio",
+    ".ogg": "audio",
+    ".opus": "audio",
+    ".png": "image",
+    ".jpg": "image",
+    ".svg": "image",
+    ".webp": "image",
+}
+
+PERCENTILES = (50, 90, 99)
+
+# Scripts, styles and icons the page links to
+LINKED_ASSET = re.compile(r'(?:src|href)="([^"#?]+)')
+
+
+def asset_kind(url):
+    suffix = PurePosixPath(urlsplit(url).path).suffix.lower()
+    if not suffix or urlsplit(url).path.endswith("/"):
+        return "html"
+    return ASSET_KINDS.get(suffix, "other")
+
+
+def station_plays(station, rng):
+    """The audio a visit to a station fetches, one file per event that plays any"""
+    files = []
+    for event in walk_events(station.events):
+        choices = list(dict.fromkeys(audio_file(a) for a in event_audio(event)))
+        if choices:
+            files.append(rng.choice(choices))
+    return list(dict.fromkeys(files))
+
+
+def visitor_path(game, steps, rng):
+    """The stations a visitor goes through, a random walk over the station graph"""
+    starts = [s for s in game.data.get("openStationsAtStart", []) if s in game.stations]
+    current = rng.choice(starts or list(game.stations))
+    path = [current]
+    for _ in range(steps - 1):
+        next_ids = [s for s in game.outgoing.get(current, ()) if s in game.stations]
+        if not next_ids:
+            break
+        current = rng.choice(next_ids)
+        path.append(current)
+    return path
+
+
+def game_url(game, served_dir):
+    """Url path of the game folder, relative to the root of what is served"""
+    root = game.root.resolve()
+    for base in (Path(served_dir), Path("public"), Path("build")):
+        try:
+            return root.relative_to(base.resolve()).as_posix() + "/"
+        except ValueError:
+            continue
+    return f"data/{root.name}/"
+
+
+def visitor_requests(game, game_path, steps, rng):
+    """
+    The game requests of one visitor, after the page itself, as url paths
+    relative to the root
+    """
+    requests = [game_path + Path(game.filename).name]
+    requests += [
+        game_path + str(PurePosixPath(p)) for p in game.data.get("stationPaths", [])
+    ]
+    for station_id in visitor_path(game, steps, rng):
+        requests += [
+            game_path + str(PurePosixPath(a))
+            for a in station_plays(game.stations[station_id], rng)
+        ]
+    return requests
+
+
+class Connection:
+    """A keep-alive HTTP/1.1 connection to one server"""
+
+    def __init__(self, base_url, ssl_context=None):
+        parts = urlsplit(base_url)
+        self.host = parts.hostname
+        self.secure = parts.scheme == "https"
+        self.port = parts.port or (443 if self.secure else 80)
+        self.ssl_context = ssl_context if self.secure else None
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port, ssl=self.ssl_context
+        )
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, ssl.SSLError):
+                pass
+            self.writer = None
+
+    async def get(self, path):
+        """GET a path. Returns the status and the number of body bytes."""
+        if self.writer is None:
+            await self.open()
+        request = (
+            f"GET {quote(path)} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+            "Accept-Encoding: br, gzip\r\nConnection: keep-alive\r\n\r\n"
+        )
+        self.writer.write(request.encode())
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            size = await self.read_chunked()
+        elif "content-length" in headers:
+            size = int(headers["content-length"])
+            await self.reader.readexactly(size)
+        else:
+            size = len(await self.reader.read())
+
+        if headers.get("connection", "").lower() == "close" or not (
+            "content-length" in headers or "transfer-encoding" in headers
+        ):
+            await self.close()
+        return status, size
+
+    async def read_chunked(self):
+        size = 0
+        while True:
+            chunk_size = int((await self.reader.readline()).split(b";")[0], 16)
+            if chunk_size == 0:
+                await self.reader.readline()
+                return size
+            await self.reader.readexactly(chunk_size + 2)
+            size += chunk_size
+
+
+async def fetch(connection, path, results):
+    started = time.perf_counter()
+    try:
+        status, size = await connection.get(path)
+        error = status >= 400
+    except (OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+        await connection.close()
+        status, size, error = None, 0, True
+    results.append(
+        {
+            "kind": asset_kind(path),
+            "path": path,
+            "status": status,
+            "bytes": size,
+            "seconds": time.perf_counter() - started,
+            "error": error,
+        }
+    )
+
+
+async def page_links(base_url, ssl_context=None):
+    """The paths of the scripts, styles and icons the app page links to"""
+    page = await read_page(Connection(base_url, ssl_context))
+    links = []
+    for link in LINKED_ASSET.findall(page):
+        if "://" in link or link.startswith("//"):
+            continue
+        links.append(urljoin("/", link))
+    return list(dict.fromkeys(links))
+
+
+async def read_page(connection):
+    """The body of the page at the root, as text"""
+    if connection.writer is None:
+        await connection.open()
+    request = (
+        f"GET / HTTP/1.1\r\nHost: {connection.host}:{connection.port}\r\n"
+        "Connection: close\r\n\r\n"
+    )
+    connection.writer.write(request.encode())
+    await connection.writer.drain()
+    response = await connection.reader.read()
+    await connection.close()
+    _, _, body = response.partition(b"\r\n\r\n")
+    return body.decode("utf-8", "replace")
+
+
+async def visitor(base_url, links, requests, think, rng, ssl_context, results):
+    connection = Connection(base_url, ssl_context)
+    try:
+        await fetch(connection, "/", results)
+        for path in links + requests:
+            await fetch(connection, "/" + path.lstrip("/"), results)
+            if think and asset_kind(path) == "audio":
+                await asyncio.sleep(rng.expovariate(1 / think))
+    finally:
+        await connection.close()
+
+
+async def run_visitors(base_url, visits, think=0.0, seed=0, ssl_context=None):
+    """
+    Run every visit, a list of request paths, as a concurrent visitor. Returns
+    the results of every request and how long it all took.
+    """
+    results = []
+    links = await page_links(base_url, ssl_context)
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(
+            visitor(
+                base_url,
+                links,
+                requests,
+                think,
+                random.Random(seed + i),
+                ssl_context,
+                results,
+            )
+            for i, requests in enumerate(visits)
+        )
+    )
+    return results, time.perf_counter() - started
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, round(p / 100 * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def summarize(results, seconds):
+    """Totals and per kind of asset counts, bytes and latency percentiles"""
+    kinds = {}
+    for result in results:
+        kinds.setdefault(result["kind"], []).append(result)
+
+    summary = {
+        "requests": len(results),
+        "errors": sum(r["error"] for r in results),
+        "bytes": sum(r["bytes"] for r in results),
+        "seconds": seconds,
+        "requestsPerSecond": len(results) / seconds if seconds else 0,
+        "bytesPerSecond": sum(r["bytes"] for r in results) / seconds if seconds else 0,
+        "kinds": {},
+    }
+    for kind, kind_results in sorted(kinds.items()):
+        latencies = sorted(r["seconds"] for r in kind_results)
+        summary["kinds"][kind] = {
+            "requests": len(kind_results),
+            "errors": sum(r["error"] for r in kind_results),
+            "bytes": sum(r["bytes"] for r in kind_results),
+            "latency": {f"p{p}": percentile(latencies, p) for p in PERCENTILES},
+        }
+    return summary
+
+
+def format_summary(summary):
+    lines = [
+        f"{summary['requests']} requests, {summary['errors']} errors, "
+        f"{summary['bytes'] / 1e6:.1f} MB in {summary['seconds']:.2f} s: "
+        f"{summary['requestsPerSecond']:.0f} requests/s, "
+        f"{summary['bytesPerSecond'] / 1e6:.1f} MB/s",
+        f"  {'kind':<8} {'requests':>8} {'errors':>6} {'MB':>8}"
+        + "".join(f" {f'p{p} ms':>9}" for p in PERCENTILES),
+    ]
+    for kind, entry in summary["kinds"].items():
+        latencies = "".join(
+            f" {entry['latency'][f'p{p}'] * 1000:9.1f}" for p in PERCENTILES
+        )
+        lines.append(
+            f"  {kind:<8} {entry['requests']:>8} {entry['errors']:>6} "
+            f"{entry['bytes'] / 1e6:8.1f}{latencies}"
+        )
+    return "\n".join(lines)
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def static_server(directory, host="127.0.0.1", port=0):
+    """Serve a directory in a background thread. Yields the base url."""
+    handler = functools.partial(QuietHandler, directory=str(directory))
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def insecure_ssl_context():
+    """For our own servers with self signed certificates"""
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
@@ -0,0 +1,156 @@
+"""
+Manifests of the files a phone should cache ahead of time, one per level.
+
+Games are split in level folders, level-0-start, level-1-mammon and so on. A
+station belongs to the level of its folder and an audio file to the lowest
+level of a station that plays it. Global audio, the gameconfig and stations
+outside a level folder go in the global part. Images in a level folder belong
+to that level.
+
+Every file is listed with a revision, a hash of its content, and its size, so
+the service worker can cache the current and the next level and only fetch
+again what changed. The index lists each level with a revision of its own,
+and a level manifest is only written again when something in it changed.
+"""
+import os
+import posixpath
+import re
+from hashlib import sha256
+from json import dumps
+from pathlib import Path
+
+from validation.references import audio_file
+
+from .files import cached_file_hashes
+
+PRECACHE_VERSION = 1
+
+PRECACHE_FILENAME = "precache-manifest.json"
+
+# The level manifests go in this folder next to the index
+PRECACHE_DIR = "precache"
+
+HASH_CACHE_FILE = "./.cache/precache-hashes.json"
+
+# Length of the revisions, plenty to tell versions of a file apart
+REVISION_LENGTH = 16
+
+IMAGE_SUFFIXES = {".gif", ".jpeg", ".jpg", ".png", ".svg", ".webp"}
+
+GLOBAL_LEVEL = "global"
+
+LEVEL_FOLDER = re.compile(r"^level-(\d+)-")
+
+
+def url_for(reference):
+    """A reference relative to the game folder, as the url of the file"""
+    return posixpath.normpath(reference.replace("\\", "/"))
+
+
+def level_of(reference):
+    """The level a path relative to the game folder is in, from its top folder"""
+    match = LEVEL_FOLDER.match(url_for(reference))
+    return match.group(1) if match else GLOBAL_LEVEL
+
+
+def lower_level(a, b):
+    """The level needed first, global counts as before every level"""
+    if a is None:
+        return b
+    if GLOBAL_LEVEL in (a, b):
+        return GLOBAL_LEVEL
+    return min(a, b, key=int)
+
+
+def file_levels(game):
+    """The level of every file of a GameModel that exists, as {url: level}"""
+    root = game.root
+    levels = {url_for(Path(game.filename).name): GLOBAL_LEVEL}
+
+    for reference in game.data.get("globalAudioFilenames", {}).values():
+        levels[url_for(audio_file(reference))] = GLOBAL_LEVEL
+
+    for station in game.stations.values():
+        station_url = url_for(os.path.relpath(station.file_path, root))
+        level = level_of(station_url)
+        levels[station_url] = lower_level(levels.get(station_url), level)
+        for reference in station.audio:
+            url = url_for(audio_file(reference))
+            levels[url] = lower_level(levels.get(url), level)
+
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            if Path(name).suffix.lower() in IMAGE_SUFFIXES:
+                url = url_for(os.path.relpath(Path(dirpath) / name, root))
+                levels.setdefault(url, level_of(url))
+
+    return {url: level for url, level in levels.items() if (root / url).is_file()}
+
+
+def level_key(level):
+    return (-1, 0) if level == GLOBAL_LEVEL else (0, int(level))
+
+
+def compile_precache(game, hash_cache_file=HASH_CACHE_FILE):
+    """
+    The index and the manifest of each level for a GameModel, as
+    (index, {level: manifest}).
+    """
+    levels = file_levels(game)
+    hashes = cached_file_hashes([game.root / url for url in levels], hash_cache_file)
+
+    manifests = {}
+    for url, level in sorted(levels.items()):
+        path = game.root / url
+        manifest = manifests.setdefault(
+            level, {"version": PRECACHE_VERSION, "level": level, "files": []}
+        )
+        manifest["files"].append(
+            {
+                "url": url,
+                "revision": hashes[path][:REVISION_LENGTH],
+                "bytes": path.stat().st_size,
+            }
+        )
+
+    index = {"version": PRECACHE_VERSION, "levels": {}}
+    for level in sorted(manifests, key=level_key):
+        files = manifests[level]["files"]
+        revision = sha256(dumps(files, sort_keys=True).encode()).hexdigest()
+        index["levels"][level] = {
+            "url": f"{PRECACHE_DIR}/{level_filename(level)}",
+            "revision": revision[:REVISION_LENGTH],
+            "files": len(files),
+            "bytes": sum(f["bytes"] for f in files),
+        }
+    return index, manifests
+
+
+def level_filename(level):
+    return f"{GLOBAL_LEVEL}.json" if level == GLOBAL_LEVEL else f"level-{level}.json"
+
+
+def write_precache(index, manifests, output_dir):
+    """
+    Write the index and the level manifests that changed to output_dir, and
+    remove manifests of levels that are gone. Returns the levels written.
+    """
+    output_dir = Path(output_dir)
+    level_dir = output_dir / PRECACHE_DIR
+    level_dir.mkdir(parents=True, exist_ok=True)
+
+    written = []
+    for level, manifest in manifests.items():
+        path = level_dir / level_filename(level)
+        content = dumps(manifest, separators=(",", ":"))
+        if not path.exists() or path.read_text() != content:
+            path.write_text(content)
+            written.append(level)
+
+    wanted = {level_filename(level) for level in manifests}
+    for path in level_dir.glob("*.json"):
+        if path.name not in wanted:
+            path.unlink()
+
+    (output_dir / PRECACHE_FILENAME).write_text(dumps(index, separators=(",", ":")))
+    return written
@@ -0,0 +1,82 @@
+"""
+Work out which audio each station is likely to need next.
+
+From every station we walk the station graph breadth first, up to `depth`
+transitions away, and collect the audio of the stations we reach. The station
+itself is at distance 0, so clips it plays after the first one are warmed too.
+Each file is listed once, at the shortest distance it is reached, nearest
+first and smallest first within a distance, since a small clip that is warm
+when it is needed is worth more than half of a big one.
+
+The manifest lets the client warm the next clips while the current one plays.
+"""
+from collections import deque
+
+from validation.references import audio_file
+
+PREFETCH_FILENAME = "prefetch-manifest.json"
+
+PREFETCH_VERSION = 1
+
+# Don't ask a phone to fetch more than this ahead of time, per station
+MAX_PREFETCH_BYTES = 10 * 1000 * 1000
+
+
+def audio_sizes(game):
+    """Byte size of every audio file of the game that exists"""
+    sizes = {}
+    for reference in dict.fromkeys(map(audio_file, game.audio_references())):
+        path = game.root / reference
+        if path.is_file():
+            sizes[reference] = path.stat().st_size
+    return sizes
+
+
+def station_distances(game, station_id, depth):
+    """Ids of the stations reachable from station_id in at most depth transitions, with their distance"""
+    distances = {station_id: 0}
+    queue = deque([station_id])
+    while queue:
+        current = queue.popleft()
+        if distances[current] == depth:
+            continue
+        for next_id in game.outgoing.get(current, ()):
+            if next_id not in distances and next_id in game.stations:
+                distances[next_id] = distances[current] + 1
+                queue.append(next_id)
+    return distances
+
+
+def prefetch_list(game, station_id, depth, sizes, max_bytes=MAX_PREFETCH_BYTES):
+    """The audio files to warm while at station_id, in the order to fetch them"""
+    nearest = {}
+    for other_id, distance in station_distances(game, station_id, depth).items():
+        for reference in map(audio_file, game.stations[other_id].audio):
+            if reference in sizes and distance < nearest.get(reference, depth + 1):
+                nearest[reference] = distance
+
+    ordered = sorted(nearest, key=lambda r: (nearest[r], sizes[r], r))
+    files = []
+    total = 0
+    for reference in ordered:
+        if total + sizes[reference] > max_bytes:
+            break
+        files.append(reference)
+        total += sizes[reference]
+    return files
+
+
+def compile_prefetch_manifest(game, depth=2, max_bytes=MAX_PREFETCH_BYTES, sizes=None):
+    """The prefetch manifest for a GameModel, as a dict"""
+    sizes = sizes if sizes is not None else audio_sizes(game)
+    stations = {}
+    for station_id in game.stations:
+        files = prefetch_list(game, station_id, depth, sizes, max_bytes)
+        if files:
+            stations[station_id] = files
+
+    return {
+        "version": PREFETCH_VERSION,
+        "depth": depth,
+        "stations": stations,
+    }
@@ -0,0 +1,164 @@
+"""
+Time the phases of a task.
+
+A task runs inside `profiling(name, enabled)`, and marks its phases with
+`phase(name)`. Phases nest, and a task called from another task becomes a
+phase of that task. When profiling is not enabled phases cost nothing.
+
+At the end the time spent in each phase is printed to stderr and written as a
+json report to .cache/profiles, optionally together with the functions
+cProfile found most time in and a .prof file for pstats or snakeviz.
+"""
+import cProfile
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from json import dumps
+from pathlib import Path
+
+PROFILE_DIR = "./.cache/profiles"
+
+# How many functions from cProfile to put in the report
+TOP_FUNCTIONS = 30
+
+# The profiler of the task that is running, if it is being profiled
+_active = None
+
+
+class Profiler:
+    """Records how long each phase of a task takes"""
+
+    def __init__(self, name, use_cprofile=False):
+        self.name = name
+        self.phases = []
+        # Phases run in threads nest separately in each thread
+        self.local = threading.local()
+        self.started = time.perf_counter()
+        self.total = None
+        self.cprofile = cProfile.Profile() if use_cprofile else None
+
+    @property
+    def stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    @contextmanager
+    def phase(self, name):
+        entry = {
+            "name": name,
+            "path": "/".join(self.stack + [name]),
+            "depth": len(self.stack),
+            "start": time.perf_counter() - self.started,
+            "seconds": None,
+        }
+        self.phases.append(entry)
+        self.stack.append(name)
+        try:
+            yield
+        finally:
+            self.stack.pop()
+            entry["seconds"] = time.perf_counter() - self.started - entry["start"]
+
+    def start(self):
+        if self.cprofile:
+            self.cprofile.enable()
+
+    def stop(self):
+        if self.cprofile:
+            self.cprofile.disable()
+        self.total = time.perf_counter() - self.started
+
+    def top_functions(self, count=TOP_FUNCTIONS):
+        """The functions with the most cumulative time, according to cProfile"""
+        if not self.cprofile:
+            return []
+
+        stats = pstats.Stats(self.cprofile)
+        rows = []
+        for key, (_, calls, tottime, cumtime, _) in stats.stats.items():
+            filename, line, function = key
+            rows.append(
+                {
+                    "function": function,
+                    "file": filename,
+                    "line": line,
+                    "calls": calls,
+                    "tottime": tottime,
+                    "cumtime": cumtime,
+                }
+            )
+        rows.sort(key=lambda row: row["cumtime"], reverse=True)
+        return rows[:count]
+
+    def report(self):
+        return {
+            "task": self.name,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "seconds": self.total,
+            "phases": self.phases,
+            "functions": self.top_functions(),
+        }
+
+    def format(self):
+        """The phases as an indented table with their share of the total"""
+        lines = [f"{self.name}: {self.total:.2f} s"]
+        for entry in self.phases:
+            indent = "  " * (entry["depth"] + 1)
+            share = entry["seconds"] / self.total if self.total else 0
+            lines.append(
+                f"{indent}{entry['name']:<{40 - len(indent)}} {entry['seconds']:9.3f} s {share:7.1%}"
+            )
+        return "\n".join(lines)
+
+    def save(self, profile_dir=PROFILE_DIR):
+        """Write the json report, and the cProfile stats if any. Returns the report path."""
+        profile_dir = Path(profile_dir)
+        profile_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"{self.name}-{datetime.now():%Y%m%d-%H%M%S}"
+
+        if self.cprofile:
+            self.cprofile.dump_stats(profile_dir / f"{stem}.prof")
+
+        report_path = profile_dir / f"{stem}.json"
+        report_path.write_text(dumps(self.report(), indent=2))
+        return report_path
+
+
+@contextmanager
+def profiling(name, enabled=False, use_cprofile=False):
+    """
+    Profile a task if enabled. Inside a task that is already being profiled
+    this is just a phase of that task.
+    """
+    global _active
+
+    if _active is not None:
+        with _active.phase(name):
+            yield _active
+        return
+
+    if not (enabled or use_cprofile):
+        yield None
+        return
+
+    profiler = Profiler(name, use_cprofile)
+    _active = profiler
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        _active = None
+        print(profiler.format(), file=sys.stderr)
+        print(f"Profile written to {profiler.save()}", file=sys.stderr)
+
+
+def phase(name):
+    """Time a phase of the task being profiled, if any"""
+    if _active is None:
+        return nullcontext()
+    return _active.phase(name)
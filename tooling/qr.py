@@ -0,0 +1,250 @@
+"""
+Generate the qr codes for the stations of a game.
+
+Codes are rendered in a pool of worker processes and written to the output
+folder the task is given. What was written is recorded in .qr-manifest.json in
+that folder, and codes whose url, label and format have not changed since then
+are not rendered again.
+
+svg codes and the printable sheet are drawn from the modules of the code as
+rectangles, so they stay sharp at any size. The sheet is a plain pdf that we
+write ourselves, which needs no fonts or libraries beyond qrcode.
+"""
+import xml.etree.ElementTree as ET
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from json import dumps, load
+from json.decoder import JSONDecodeError
+from pathlib import Path
+from urllib.parse import urljoin
+
+import qrcode
+from PIL import ImageDraw
+
+# Bump this when the way codes are rendered changes
+RENDER_VERSION = 2
+
+MANIFEST_FILENAME = ".qr-manifest.json"
+
+# A4 in points, 3 x 4 codes per page
+SHEET_PAGE_SIZE = (595.28, 841.89)
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+SHEET_MARGIN = 36
+SHEET_FONT_SIZE = 10
+
+
+def qr_code_jobs(game, output_dir, svg=False):
+    """One job per qr code to write for the entry stations of the game"""
+    jobs = []
+    for station_id in game.entry_station_ids():
+        full_url = urljoin(game.data["baseUrl"] + "/", station_id, allow_fragments=False)
+        for kind in ["svg", "png"] if svg else ["png"]:
+            filename = Path(output_dir) / f"{game.name}-{station_id}.{kind}"
+            jobs.append(
+                {
+                    "url": full_url,
+                    "label": station_id,
+                    "kind": kind,
+                    "filename": filename.as_posix(),
+                }
+            )
+    return jobs
+
+
+def job_hash(job):
+    """Hash of everything that goes into a rendered code"""
+    data = {k: job[k] for k in ["url", "label", "kind"]}
+    data["version"] = RENDER_VERSION
+    return sha256(dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def code_modules(url):
+    """The modules of the qr code for url, border included, as rows of booleans"""
+    code = qrcode.QRCode()
+    code.add_data(url)
+    code.make(fit=True)
+    return code.get_matrix()
+
+
+def module_runs(modules):
+    """Yield (x, y, width) of every horizontal run of dark modules"""
+    for y, row in enumerate(modules):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            yield start, y, x - start
+
+
+def code_svg(url, label):
+    """An svg of the qr code for url with the label in the top left corner"""
+    modules = code_modules(url)
+    size = len(modules)
+    svg = ET.Element(
+        "svg",
+        xmlns="http://www.w3.org/2000/svg",
+        width=f"{size}mm",
+        height=f"{size}mm",
+        viewBox=f"0 0 {size} {size}",
+    )
+    ET.SubElement(svg, "rect", width=str(size), height=str(size), fill="#fff")
+    path = "".join(f"M{x},{y}h{w}v1h-{w}z" for x, y, w in module_runs(modules))
+    ET.SubElement(svg, "path", d=path, fill="#000")
+
+    # Put the label in the top left corner, in the border, as for png
+    text = ET.SubElement(
+        svg, "text", x="1", y="3", style="font-size:3px;font-family:sans-serif"
+    )
+    text.text = label
+    return ET.tostring(svg, encoding="unicode")
+
+
+def render_qr_code(job):
+    """Render a single qr code with its label to disk"""
+    if job["kind"] == "svg":
+        Path(job["filename"]).write_text(code_svg(job["url"], job["label"]))
+    else:
+        qr_img = qrcode.make(job["url"])
+        ImageDraw.Draw(qr_img).text((0, 0), job["label"], 0)
+        qr_img.save(job["filename"])
+    return job["filename"]
+
+
+def load_manifest(output_dir):
+    try:
+        with open(Path(output_dir) / MANIFEST_FILENAME) as handle:
+            return load(handle)
+    except (FileNotFoundError, JSONDecodeError):
+        return {}
+
+
+def save_manifest(output_dir, manifest):
+    path = Path(output_dir) / MANIFEST_FILENAME
+    path.write_text(dumps(manifest, indent=2, sort_keys=True))
+
+
+def render_qr_codes(jobs, output_dir, workers=None, force=False):
+    """
+    Render the jobs that are not already on disk as described by the manifest.
+
+    Returns the filenames of the codes that were rendered.
+    """
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(output_dir)
+
+    todo = [
+        job
+        for job in jobs
+        if force
+        or manifest.get(job["filename"]) != job_hash(job)
+        or not Path(job["filename"]).exists()
+    ]
+
+    if workers == 1 or len(todo) < 2:
+        written = [render_qr_code(job) for job in todo]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            written = list(executor.map(render_qr_code, todo))
+
+    for job in todo:
+        manifest[job["filename"]] = job_hash(job)
+    save_manifest(output_dir, manifest)
+
+    return written
+
+
+def pdf_string(text):
+    """text as a pdf string literal, in the WinAnsi encoding of Helvetica"""
+    text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({text})".encode("cp1252", "replace")
+
+
+def sheet_page(codes):
+    """The content stream of one sheet page with (url, label) codes on it"""
+    page_width, page_height = SHEET_PAGE_SIZE
+    cell_width = (page_width - 2 * SHEET_MARGIN) / SHEET_COLUMNS
+    cell_height = (page_height - 2 * SHEET_MARGIN) / SHEET_ROWS
+    code_size = min(cell_width, cell_height - 2 * SHEET_FONT_SIZE)
+
+    lines = [b"0 g"]
+    for i, (url, label) in enumerate(codes):
+        column, row = i % SHEET_COLUMNS, i // SHEET_COLUMNS
+        # pdf counts y from the bottom of the page
+        x = SHEET_MARGIN + column * cell_width
+        top = page_height - SHEET_MARGIN - row * cell_height
+
+        modules = code_modules(url)
+        module = code_size / len(modules)
+        for mx, my, width in module_runs(modules):
+            lines.append(
+                f"{x + mx * module:.3f} {top - (my + 1) * module:.3f} "
+                f"{width * module:.3f} {module:.3f} re".encode()
+            )
+        lines.append(b"f")
+
+        baseline = top - code_size - SHEET_FONT_SIZE
+        lines.append(
+            f"BT /F1 {SHEET_FONT_SIZE} Tf {x:.3f} {baseline:.3f} Td ".encode()
+            + pdf_string(label)
+            + b" Tj ET"
+        )
+    return b"\n".join(lines)
+
+
+def write_pdf(filename, page_streams):
+    """Write a pdf with one A4 page per content stream, text in Helvetica"""
+    page_ids = [4 + 2 * i for i in range(len(page_streams))]
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode(),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        b"/Encoding /WinAnsiEncoding >>",
+    ]
+    width, height = SHEET_PAGE_SIZE
+    for page_id, stream in zip(page_ids, page_streams):
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {width} {height}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> "
+            f"/Contents {page_id + 1} 0 R >>".encode()
+        )
+        stream = zlib.compress(stream)
+        objects.append(
+            f"<< /Length {len(stream)} /Filter /FlateDecode >>\nstream\n".encode()
+            + stream
+            + b"\nendstream"
+        )
+
+    pdf = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode()
+    pdf += b"".join(f"{offset:010d} 00000 n \n".encode() for offset in offsets)
+    pdf += (
+        f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\n"
+        f"startxref\n{xref}\n%%EOF\n"
+    ).encode()
+    Path(filename).write_bytes(pdf)
+
+
+def render_sheet(jobs, filename):
+    """Lay out the codes of jobs on A4 pages in a single vector pdf, ready for print"""
+    codes = list(dict.fromkeys((job["url"], job["label"]) for job in jobs))
+    per_page = SHEET_COLUMNS * SHEET_ROWS
+    pages = [
+        sheet_page(codes[start : start + per_page])
+        for start in range(0, len(codes), per_page)
+    ]
+    if pages:
+        write_pdf(filename, pages)
+    return filename
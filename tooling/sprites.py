@@ -0,0 +1,220 @@
+"""
+Pack the short clips of a built game into audio sprites.
+
+A sprite is one MP3 file made of the frames of several clips, with a short
+gap of silent frames between them. Clips are grouped by level, or by station,
+and by format and bitrate, so a sprite is plain constant bitrate audio that
+players can seek in exactly. Nothing is decoded or encoded again.
+
+The station files of the build are rewritten to refer to a clip as a segment
+of its sprite, sprites/<hash>.mp3#t=start,end in seconds, and a table of
+every sprite and the clips in it is written next to the gameconfig. Clips
+that are no longer referenced from anywhere are removed from the build.
+
+Background audio is left alone since it loops, and so is global audio, which
+the client compares by name.
+"""
+import math
+import os
+from hashlib import sha256
+from json import dumps
+from pathlib import Path, PurePosixPath
+
+from validation.audio_metadata import game_audio_metadata
+from validation.events import walk_events
+from validation.loading import load_complete_game, write_complete_game
+from validation.mp3 import audio_frames, describe, parse_frame_header, silent_frame
+from validation.references import (
+    audio_path,
+    game_audio_references,
+    rewrite_audio_references,
+    station_audio_references,
+)
+
+from .precache import level_of, lower_level
+from .profiling import phase
+
+AUDIO_SPRITES_VERSION = 1
+
+AUDIO_SPRITES_FILENAME = "audio-sprites.json"
+
+SPRITE_DIR = "sprites"
+
+# Clips up to this long go in sprites
+MAX_CLIP_SECONDS = 10
+
+# A sprite holds up to this much audio, so one clip never waits for a huge file
+MAX_SPRITE_SECONDS = 120
+
+# Silence between clips, so a player that stops a bit late stops in silence
+GAP_SECONDS = 0.5
+
+
+def excluded_references(data):
+    """The audio_path of the audio we never put in a sprite"""
+    excluded = {audio_path(r) for r in data.get("globalAudioFilenames", {}).values()}
+    for station in data["stations"].values():
+        for event in walk_events(station.get("events", [])):
+            if event["action"] == "playBackgroundAudio":
+                excluded.add(audio_path(event["audioFilename"]))
+    return excluded
+
+
+def sprite_clips(data, filename, metadata, group="level", max_seconds=MAX_CLIP_SECONDS):
+    """
+    The clips of a complete game that can go in a sprite, as {audio_path:
+    group}. A clip used in several levels goes with the lowest one, and a clip
+    used at several stations with the first one.
+    """
+    root = Path(filename).parent
+    excluded = excluded_references(data)
+
+    clips = {}
+    for station in data["stations"].values():
+        if group == "level":
+            key = level_of(os.path.relpath(station["filePath"], root))
+        else:
+            key = station["id"]
+
+        for reference in station_audio_references(station):
+            path = audio_path(reference)
+            scanned = metadata.get(reference)
+            if path in excluded or scanned is None or scanned["problems"]:
+                continue
+            info = scanned["metadata"]
+            if info.get("vbr", True) or info.get("duration", math.inf) > max_seconds:
+                continue
+            if group == "level":
+                clips[path] = lower_level(clips.get(path), key)
+            else:
+                clips.setdefault(path, key)
+    return clips
+
+
+def count_frames(data, pos, end):
+    frames = 0
+    while pos < end:
+        header = parse_frame_header(data, pos)
+        if header is None:
+            break
+        frames += 1
+        pos += header["length"]
+    return frames
+
+
+def build_sprite(clips, gap=GAP_SECONDS):
+    """
+    One sprite from a list of (reference, data) of clips in the same format.
+    Returns the sprite data and {reference: (start, end)} in seconds.
+    """
+    parts = []
+    segments = {}
+    samples = 0
+    for reference, data in clips:
+        pos, end = audio_frames(data)
+        header = parse_frame_header(data, pos)
+        sample_rate = header["sample_rate"]
+
+        frames = count_frames(data, pos, end)
+        start = samples / sample_rate
+        samples += frames * header["samples"]
+        segments[reference] = (round(start, 3), round(samples / sample_rate, 3))
+        parts.append(bytes(data[pos:end]))
+
+        gap_frames = math.ceil(gap * sample_rate / header["samples"])
+        parts.append(silent_frame(data, pos) * gap_frames)
+        samples += gap_frames * header["samples"]
+    return b"".join(parts), segments
+
+
+def group_clips(root, clips, max_sprite_seconds=MAX_SPRITE_SECONDS):
+    """
+    Split clips into the lists that make one sprite each, as
+    [(group, [(reference, data), ...]), ...]
+    """
+    by_format = {}
+    for reference, group in clips.items():
+        data = (root / reference).read_bytes()
+        pos, _ = audio_frames(data)
+        header = parse_frame_header(data, pos)
+        key = (str(group), describe(header), header["bitrate"])
+        by_format.setdefault(key, []).append((reference, data))
+
+    sprites = []
+    for (group, _, bitrate), members in sorted(by_format.items()):
+        if len(members) < 2:
+            continue
+        current = []
+        seconds = 0
+        for reference, data in members:
+            # Every byte of a constant bitrate file is the same length of time
+            clip_seconds = len(data) * 8 / bitrate
+            if current and seconds + clip_seconds > max_sprite_seconds:
+                sprites.append((group, current))
+                current, seconds = [], 0
+            current.append((reference, data))
+            seconds += clip_seconds
+        if len(current) > 1:
+            sprites.append((group, current))
+    return sprites
+
+
+def sprite_reference(data):
+    return f"./{SPRITE_DIR}/{sha256(data).hexdigest()[:16]}.mp3"
+
+
+def segment_reference(sprite, start, end):
+    return f"{sprite}#t={start:.3f},{end:.3f}"
+
+
+def pack_game_sprites(
+    filename, group="level", max_seconds=MAX_CLIP_SECONDS, workers=None
+):
+    """
+    Pack the short clips of the built game with the gameconfig at filename
+    into sprites, in place. Returns the sprite table.
+    """
+    root = Path(filename).parent
+    with phase("load game"):
+        data = load_complete_game(filename)
+        metadata = game_audio_metadata(data, filename, workers=workers)
+
+    clips = sprite_clips(data, filename, metadata, group, max_seconds)
+
+    table = {"version": AUDIO_SPRITES_VERSION, "sprites": {}}
+    renames = {}
+    with phase("build sprites"):
+        for group_name, members in group_clips(root, clips):
+            sprite_data, segments = build_sprite(members)
+            sprite = sprite_reference(sprite_data)
+            sprite_path = root / sprite
+            sprite_path.parent.mkdir(parents=True, exist_ok=True)
+            sprite_path.write_bytes(sprite_data)
+
+            table["sprites"][str(PurePosixPath(sprite))] = {
+                "group": group_name,
+                "bytes": len(sprite_data),
+                "clips": {r: list(segment) for r, segment in segments.items()},
+            }
+            for reference, (start, end) in segments.items():
+                renames[reference] = segment_reference(sprite, start, end)
+
+    with phase("rewrite game"):
+        def rewrite(reference):
+            # A segment of a file is not the clip that is the whole file
+            if "#" in reference:
+                return reference
+            return renames.get(audio_path(reference), reference)
+
+        data = rewrite_audio_references(data, rewrite)
+        write_complete_game(data, filename, root)
+
+        # However they are spelled, clips that are still played stay
+        still_used = {audio_path(r) for r in game_audio_references(data)}
+        for path in renames:
+            if path not in still_used:
+                (root / path).unlink(missing_ok=True)
+
+        (root / AUDIO_SPRITES_FILENAME).write_text(dumps(table, separators=(",", ":")))
+
+    return table
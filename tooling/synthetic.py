@@ -0,0 +1,189 @@
+"""
+Generate synthetic games for benchmarking the tooling.
+
+A synthetic game has the same shape as a real one: a help station and a chain
+of story stations, each opening two choice stations that both open the next
+story station. Stations are spread over level folders of 100 stations and
+every audio file they reference is written as a few silent MP3 frames, so the
+game validates cleanly.
+
+Size is controlled by the number of stations, the length of the `then` chains
+in story stations, the number of entries in their audioFilenameMaps and the
+number of distinct audio files.
+"""
+import random
+from json import dump
+from pathlib import Path
+
+CHOICE_INFIX = "-choice-"
+CHOICE_NAMES = ["circle", "square"]
+
+STATIONS_PER_LEVEL = 100
+
+# One MPEG-1 Layer III frame, 128 kbit/s, 44.1 kHz, no padding
+MP3_FRAME = b"\xff\xfb\x90\x64" + bytes(413)
+MP3_FRAMES_PER_FILE = 4
+
+
+def story_id(index):
+    return f"story-{index:05d}"
+
+
+def choice_id(index, choice):
+    return f"{story_id(index)}{CHOICE_INFIX}{choice}"
+
+
+def level_for(station_number):
+    return f"./level-{station_number // STATIONS_PER_LEVEL:04d}"
+
+
+def then_chain(events):
+    """Link events so each is the `then` of the one before it"""
+    for event, next_event in zip(events, events[1:]):
+        event["then"] = next_event
+    return events[0]
+
+
+def story_station(index, depth, map_size, pick_audio):
+    events = [
+        {
+            "action": "playBackgroundAudio",
+            "audioFilename": pick_audio(),
+            "loop": True,
+            "cancelOnLeave": False,
+            "wait": 0,
+        }
+    ]
+
+    chain = [
+        {"action": "playAudio", "wait": 0, "audioFilenames": [pick_audio()]}
+        for _ in range(depth)
+    ]
+    if map_size:
+        chain.append(
+            {
+                "action": "playAudioBasedOnAdHocValue",
+                "key": f"key-{index}",
+                "audioFilenameMap": {
+                    f"value-{i}": pick_audio() for i in range(map_size)
+                },
+            }
+        )
+    if chain:
+        events.append(then_chain(chain))
+
+    events.append(
+        {
+            "action": "choiceBasedOnTags",
+            "tags": [f"tag-{index}"],
+            "eventIfPresent": {"action": "noop"},
+            "eventIfNotPresent": {
+                "action": "openStations",
+                "toStations": [choice_id(index, c) for c in CHOICE_NAMES],
+            },
+        }
+    )
+
+    return {
+        "id": story_id(index),
+        "type": "story",
+        "description": f"Synthetic story station {index}",
+        "tags": [f"tag-{index}"],
+        "opens": [choice_id(index, c) for c in CHOICE_NAMES],
+        "events": events,
+    }
+
+
+def choice_station(index, next_index, choice, pick_audio):
+    station = {
+        "id": choice_id(index, choice),
+        "type": "choice",
+        "description": f"Synthetic choice station {index} {choice}",
+        "helpAudioFilenames": [pick_audio(), pick_audio()],
+        "helpCost": 1,
+        "events": [
+            {"action": "playAudio", "wait": 0, "audioFilenames": [pick_audio()]}
+        ],
+    }
+    if next_index is not None:
+        station["opens"] = [story_id(next_index)]
+    return station
+
+
+def generate_game(
+    output_dir, stations=1000, depth=10, map_size=20, audio_files=500, seed=0
+):
+    """
+    Write a synthetic game with about `stations` stations to output_dir.
+    Returns the path of the gameconfig.
+    """
+    output_dir = Path(output_dir)
+    rng = random.Random(seed)
+
+    audio_pool = [
+        f"{level_for(i)}/audio-{i:05d}.mp3" for i in range(max(audio_files, 1))
+    ]
+    used_audio = set()
+
+    def pick_audio():
+        audiofile = rng.choice(audio_pool)
+        used_audio.add(audiofile)
+        return audiofile
+
+    # A story station and its choices make three stations
+    story_count = max((stations - 1) // 3, 1)
+
+    station_data = [{"id": "help", "type": "help", "startStationId": story_id(0)}]
+    for index in range(story_count):
+        next_index = index + 1 if index + 1 < story_count else None
+        station_data.append(story_station(index, depth, map_size, pick_audio))
+        for choice in CHOICE_NAMES:
+            station_data.append(choice_station(index, next_index, choice, pick_audio))
+
+    global_audio = {
+        key: f"./level-global/{key}.mp3"
+        for key in [
+            "allHelpLeftAudioFilename",
+            "twoHelpLeftAudioFilename",
+            "oneHelpLeftAudioFilename",
+            "noHelpLeftAudioFilename",
+            "noHelpAtThisPointAudioFilename",
+            "storyFallbackAudioFilename",
+            "helpPreroll",
+        ]
+    }
+    used_audio.update(global_audio.values())
+
+    station_paths = []
+    for number, station in enumerate(station_data):
+        station_path = f"{level_for(number)}/{station['id']}.json"
+        station_paths.append(station_path)
+        write_json(station, output_dir / station_path)
+
+    gameconfig = {
+        "name": f"synthetic-{len(station_data)}",
+        "baseUrl": "https://example.com",
+        "stationPaths": station_paths,
+        "choiceInfix": CHOICE_INFIX,
+        "choiceNames": CHOICE_NAMES,
+        "stations": {},
+        "openStationsAtStart": ["help", story_id(0)],
+        "globalAudioFilenames": global_audio,
+        "audioFileUrlBase": f"data/synthetic-{len(station_data)}/",
+    }
+    gameconfig_path = output_dir / "gameconfig.json"
+    write_json(gameconfig, gameconfig_path)
+
+    silence = MP3_FRAME * MP3_FRAMES_PER_FILE
+    for audiofile in used_audio:
+        path = output_dir / audiofile
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(silence)
+
+    return gameconfig_path
+
+
+def write_json(data, path):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, "w") as handle:
+        dump(data, handle, indent=2)
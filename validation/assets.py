@@ -0,0 +1,76 @@
+"""
+In memory index of the files in a game folder.
+
+The game folder is scanned once and all references to audio files are resolved
+against the index instead of asking the file system about each of them.
+"""
+import os
+import posixpath
+from functools import lru_cache
+from pathlib import Path
+
+from .references import audio_file, audio_path
+
+AUDIO_EXTENSIONS = (".mp3", ".m4a", ".aac", ".ogg", ".oga", ".opus", ".wav", ".flac")
+
+
+class AssetIndex:
+    """All files and folders below the root of a game"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.files = set()
+        self.dirs = {"."}
+
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            rel_dir = Path(dirpath).relative_to(self.root).as_posix()
+            for dirname in dirnames:
+                self.dirs.add(posixpath.normpath(posixpath.join(rel_dir, dirname)))
+            for name in filenames:
+                self.files.add(posixpath.normpath(posixpath.join(rel_dir, name)))
+
+    def normalize(self, reference):
+        """The key a reference relative to the game root has in the index"""
+        return posixpath.normpath(reference)
+
+    def exists(self, reference):
+        """Does a reference relative to the game root point at an existing file or folder"""
+        reference = audio_file(reference)
+        key = self.normalize(reference)
+
+        # Outside of what we have indexed, ask the file system
+        if key.startswith("../") or posixpath.isabs(key):
+            return self.root.joinpath(reference).exists()
+
+        return key in self.files or key in self.dirs
+
+    def add(self, reference, is_dir=False):
+        """Add a file or folder that has appeared since the scan, and its parents"""
+        key = self.normalize(reference)
+        (self.dirs if is_dir else self.files).add(key)
+        parent = posixpath.dirname(key)
+        while parent and parent not in self.dirs:
+            self.dirs.add(parent)
+            parent = posixpath.dirname(parent)
+
+    def discard(self, reference):
+        """Forget a file or folder that has been removed since the scan"""
+        key = self.normalize(reference)
+        self.files.discard(key)
+        if key != ".":
+            self.dirs.discard(key)
+
+    def audio_files(self):
+        """All audio files in the game folder"""
+        return {f for f in self.files if f.lower().endswith(AUDIO_EXTENSIONS)}
+
+    def unreferenced_audio_files(self, references):
+        """Audio files in the game folder that are not in references"""
+        referenced = {audio_path(r) for r in references}
+        return sorted(self.audio_files() - referenced)
+
+
+@lru_cache(maxsize=None)
+def asset_index_for(filename):
+    """The asset index of the game that the gameconfig at filename belongs to"""
+    return AssetIndex(Path(filename).parent)
@@ -0,0 +1,134 @@
+"""
+Metadata for the audio files of a game, and the checks we make with it.
+
+Every audio file a game refers to is scanned with scan_audio_file, in a pool
+of worker processes. Results are cached on disk keyed on the path, size and
+modification time of each file, so only new and changed files are scanned.
+
+The metadata is also written as an index the build and the client can use to
+know how long each file plays and how much there is to fetch.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from json import dumps, load
+from json.decoder import JSONDecodeError
+from pathlib import Path
+
+from .cache import CACHE_DIR
+from .mp3 import scan_audio_file
+from .references import audio_file, game_audio_references
+
+AUDIO_INDEX_VERSION = 1
+
+AUDIO_INDEX_FILENAME = "audio-index.json"
+
+METADATA_CACHE_FILE = Path(CACHE_DIR) / "audio-metadata.json"
+
+# What phones are known to play without trouble
+ALLOWED_SAMPLE_RATES = (44100, 48000)
+
+# Bigger or longer than this is probably a mistake, like an unedited recording
+MAX_AUDIO_BYTES = 20 * 1000 * 1000
+MAX_AUDIO_SECONDS = 20 * 60
+
+
+def _scanner_hash():
+    """Hash of the scanner code, so that cached results go away when it changes"""
+    return sha256(Path(__file__).with_name("mp3.py").read_bytes()).hexdigest()
+
+
+def _load_metadata_cache():
+    try:
+        with open(METADATA_CACHE_FILE) as handle:
+            cache = load(handle)
+    except (FileNotFoundError, JSONDecodeError):
+        return {}
+    if cache.get("scanner") != _scanner_hash():
+        return {}
+    return cache["entries"]
+
+
+def _save_metadata_cache(entries):
+    METADATA_CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = METADATA_CACHE_FILE.with_suffix(".tmp")
+    tmp_path.write_text(dumps({"scanner": _scanner_hash(), "entries": entries}))
+    tmp_path.replace(METADATA_CACHE_FILE)
+
+
+def _scan(path):
+    metadata, problems = scan_audio_file(path)
+    return {"metadata": metadata, "problems": problems}
+
+
+def scan_audio_files(paths, workers=None):
+    """
+    Scan audio files, reusing cached results for files that have not changed.
+    Returns a dict from path to {"metadata": ..., "problems": [...]}.
+    """
+    cache = _load_metadata_cache()
+
+    keys = {}
+    for path in dict.fromkeys(Path(p) for p in paths):
+        stat = path.stat()
+        keys[path] = f"{path.resolve()}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    results = {path: cache[key] for path, key in keys.items() if key in cache}
+    to_scan = [path for path in keys if path not in results]
+
+    if len(to_scan) > 1 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            scanned = executor.map(_scan, to_scan, chunksize=8)
+            results.update(zip(to_scan, scanned))
+    else:
+        results.update((path, _scan(path)) for path in to_scan)
+
+    # Drop what we had for earlier versions of the files we just looked at
+    current = {str(path.resolve()) for path in keys}
+    entries = {k: v for k, v in cache.items() if k.rsplit(":", 2)[0] not in current}
+    entries.update({keys[path]: results[path] for path in keys})
+    _save_metadata_cache(entries)
+
+    return {path: results[path] for path in keys}
+
+
+def game_audio_metadata(data, filename, workers=None, references=None):
+    """
+    Scan the audio files a complete game refers to that exist. Returns a dict
+    from reference to scan result, in the order the game refers to them.
+    Pass the references if you already have them, e.g. from the GameModel.
+    """
+    root = Path(filename).parent
+    if references is None:
+        references = game_audio_references(data)
+    references = dict.fromkeys(audio_file(r) for r in references)
+    references = [r for r in references if root.joinpath(r).is_file()]
+    scanned = scan_audio_files([root / r for r in references], workers)
+    return {r: scanned[root / r] for r in references}
+
+
+def audio_file_messages(reference, scanned, filename):
+    """Yield messages about a scanned audio file"""
+    metadata = scanned["metadata"]
+    location = f"'{reference}' in {Path(filename).parent}"
+
+    for problem in scanned["problems"]:
+        yield f"[018] The audiofile {location} {problem}."
+
+    sample_rate = metadata.get("sampleRate")
+    if sample_rate and sample_rate not in ALLOWED_SAMPLE_RATES:
+        yield f"[019] The audiofile {location} has a sample rate of {sample_rate} Hz, use one of {', '.join(str(r) for r in ALLOWED_SAMPLE_RATES)}."
+
+    if metadata["bytes"] > MAX_AUDIO_BYTES:
+        yield f"[020] The audiofile {location} is {metadata['bytes'] / 1e6:.1f} MB, more than the {MAX_AUDIO_BYTES / 1e6:.0f} MB we allow."
+    if metadata.get("duration", 0) > MAX_AUDIO_SECONDS:
+        yield f"[020] The audiofile {location} plays for {metadata['duration'] / 60:.1f} minutes, more than the {MAX_AUDIO_SECONDS / 60:.0f} minutes we allow."
+
+
+def compile_audio_index(metadata):
+    """The audio index for the result of game_audio_metadata"""
+    return {
+        "version": AUDIO_INDEX_VERSION,
+        "files": {
+            reference: scanned["metadata"] for reference, scanned in metadata.items()
+        },
+    }
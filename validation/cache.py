@@ -0,0 +1,90 @@
+"""
+On disk cache of per station validation results.
+
+A station's results are valid as long as nothing they were computed from has
+changed: the station data itself, our schemas and validation code, the bits of
+the game config the checks look at, and which of the files and stations the
+station refers to actually exist.
+"""
+from hashlib import sha256
+from json import dumps, load
+from json.decoder import JSONDecodeError
+from pathlib import Path
+
+from .registry import schema_hash, schema_names
+
+CACHE_DIR = "./.cache"
+
+CACHE_VERSION = 1
+
+
+def _hash(data):
+    return sha256(dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def validation_context_hash(gameconfig, filename):
+    """Hash of everything outside of a station that its validation depends on"""
+    code = [
+        sha256(p.read_bytes()).hexdigest()
+        for p in sorted(Path(__file__).parent.glob("*.py"))
+    ]
+    return _hash(
+        {
+            "version": CACHE_VERSION,
+            "code": code,
+            "schemas": [schema_hash(name) for name in schema_names()],
+            "choiceInfix": gameconfig["choiceInfix"],
+            "choiceNames": gameconfig["choiceNames"],
+            "gameconfig": Path(filename).as_posix(),
+        }
+    )
+
+
+def station_cache_key(context_hash, station, station_ids, asset_exists):
+    """
+    Cache key for the validation results of a Station of the GameModel.
+
+    asset_exists is a callable that tells if an audio filename referenced from
+    the game exists.
+    """
+    audio = sorted(set(station.audio))
+    opens = sorted(set(station.opens))
+    return _hash(
+        {
+            "context": context_hash,
+            "station": station.data,
+            "audio": [(a, asset_exists(a)) for a in audio],
+            "opens": [(s, s in station_ids) for s in opens],
+        }
+    )
+
+
+def cache_file_for(filename):
+    """Each game gets its own cache file"""
+    game_hash = sha256(Path(filename).resolve().as_posix().encode()).hexdigest()
+    return Path(CACHE_DIR) / f"validate-game-{game_hash[:16]}.json"
+
+
+def load_cache(filename):
+    """Load cached results for a game. Returns an empty cache if there is none or it is broken"""
+    cache_file = cache_file_for(filename)
+    try:
+        with open(cache_file) as handle:
+            cache = load(handle)
+    except (FileNotFoundError, JSONDecodeError):
+        return {}
+
+    if cache.get("version") != CACHE_VERSION:
+        return {}
+    return cache["entries"]
+
+
+def save_cache(filename, entries):
+    """Write cached results for a game to disk"""
+    path = cache_file_for(filename)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file first so that we never leave a half written cache
+    tmp_path = path.with_suffix(".tmp")
+    tmp_path.write_text(dumps({"version": CACHE_VERSION, "entries": entries}))
+    tmp_path.replace(path)
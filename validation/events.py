@@ -0,0 +1,152 @@
+"""
+Walking station events.
+
+Events nest: every event can have a `then` event and some actions branch into
+further events. walk_events visits all of them with an explicit stack, so long
+chains of events never hit the recursion limit.
+
+What each action refers to is described in the tables below. Adding a new
+action type means adding it here.
+"""
+
+# Keys of the events an action branches into, in the order they are visited
+BRANCHES = {
+    "choiceBasedOnTags": ("eventIfPresent", "eventIfNotPresent"),
+    "choiceBasedOnAbsenceOfTags": ("eventIfPresent", "eventIfNotPresent"),
+}
+
+POWER_NAME_AUDIO_KEYS = (
+    "onSuccessPlay",
+    "onFirstFailurePlay",
+    "onSecondFailurePlay",
+    "ghostOnSuccessPlay",
+    "ghostOnFirstFailurePlay",
+    "ghostOnSecondFailurePlay",
+)
+
+# Audio filenames referenced by an event, by action
+AUDIO_REFERENCES = {
+    "playAudio": lambda event: event["audioFilenames"],
+    "playBackgroundAudio": lambda event: [event["audioFilename"]],
+    "powerNameChoice": lambda event: [
+        event[key] for key in POWER_NAME_AUDIO_KEYS if key in event
+    ],
+    "playAudioBasedOnAdHocValue": lambda event: event["audioFilenameMap"].values(),
+}
+
+
+def _rewrite_power_name_audio(event, rewrite):
+    for key in POWER_NAME_AUDIO_KEYS:
+        if key in event:
+            event[key] = rewrite(event[key])
+
+
+# Replace the audio filenames of an event in place, by action
+AUDIO_REWRITERS = {
+    "playAudio": lambda event, rewrite: event.update(
+        audioFilenames=[rewrite(a) for a in event["audioFilenames"]]
+    ),
+    "playBackgroundAudio": lambda event, rewrite: event.update(
+        audioFilename=rewrite(event["audioFilename"])
+    ),
+    "powerNameChoice": _rewrite_power_name_audio,
+    "playAudioBasedOnAdHocValue": lambda event, rewrite: event.update(
+        audioFilenameMap={
+            k: rewrite(v) for k, v in event["audioFilenameMap"].items()
+        }
+    ),
+}
+
+
+# Ids of the stations an event can lead to, by action
+STATION_REFERENCES = {
+    "goToStation": lambda event: [event["toStation"]],
+    "openStation": lambda event: [event["toStation"]],
+    "openStations": lambda event: event["toStations"],
+    "switchGotoStation": lambda event: [
+        switch["parameters"]["toStation"] for switch in event["switch"]
+    ],
+    "powerNameChoice": lambda event: [
+        *event["onSuccessOpen"],
+        *event["ghostOnSuccessOpen"],
+        event["onSecondFailureGoTo"],
+        event["ghostOnSecondFailureGoTo"],
+    ],
+}
+
+
+def _rewrite_switch_stations(event, rewrite):
+    for switch in event["switch"]:
+        switch["parameters"]["toStation"] = rewrite(switch["parameters"]["toStation"])
+
+
+def _rewrite_power_name_stations(event, rewrite):
+    for key in ["onSuccessOpen", "ghostOnSuccessOpen"]:
+        event[key] = [rewrite(s) for s in event[key]]
+    for key in ["onSecondFailureGoTo", "ghostOnSecondFailureGoTo"]:
+        event[key] = rewrite(event[key])
+
+
+# Replace the station ids of an event in place, by action
+STATION_REWRITERS = {
+    "goToStation": lambda event, rewrite: event.update(
+        toStation=rewrite(event["toStation"])
+    ),
+    "openStation": lambda event, rewrite: event.update(
+        toStation=rewrite(event["toStation"])
+    ),
+    "openStations": lambda event, rewrite: event.update(
+        toStations=[rewrite(s) for s in event["toStations"]]
+    ),
+    "switchGotoStation": _rewrite_switch_stations,
+    "powerNameChoice": _rewrite_power_name_stations,
+}
+
+
+def sub_events(event):
+    """The events directly below an event, in the order they are visited"""
+    children = [event[key] for key in BRANCHES.get(event["action"], ()) if key in event]
+    if "then" in event:
+        children.append(event["then"])
+    return children
+
+
+def walk_events(events):
+    """Yield events and all their sub events, depth first in declaration order"""
+    stack = list(reversed(events))
+    while stack:
+        event = stack.pop()
+        yield event
+        stack.extend(reversed(sub_events(event)))
+
+
+def dispatch(table, event):
+    """Call the handler for the action of event in table, if there is one"""
+    handler = table.get(event["action"])
+    if handler is None:
+        return ()
+    return handler(event)
+
+
+def event_audio(event):
+    """Audio filenames referenced by a single event, not its sub events"""
+    return dispatch(AUDIO_REFERENCES, event)
+
+
+def event_stations(event):
+    """Ids of the stations a single event, not its sub events, can lead to"""
+    return dispatch(STATION_REFERENCES, event)
+
+
+def rewrite_event_audio(event, rewrite):
+    """Replace each audio filename of a single event with rewrite(filename)"""
+    rewriter = AUDIO_REWRITERS.get(event["action"])
+    if rewriter is not None:
+        rewriter(event, rewrite)
+
+
+def rewrite_event_stations(event, rewrite):
+    """Replace each station id of a single event with rewrite(station_id)"""
+    rewriter = STATION_REWRITERS.get(event["action"])
+    if rewriter is not None:
+        rewriter(event, rewrite)
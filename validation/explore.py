@@ -0,0 +1,882 @@
+"""
+Explore every way a game can be played.
+
+Validation checks that references go somewhere. Here we run the events of
+stations the way the client does, from the stations open at the start, and
+follow every scan a player can make and every timer that can fire, to find
+which stations can be reached at all, where a player can get stuck and where
+they can get caught in a loop with no way out.
+
+A game state is the current station, the open stations, the tags seen, the
+adHocData, the running timers and the help stations visited. Only what can
+change what happens later is kept: adHocData keys that no event reads back,
+and tags no choice looks at, are left out. Equivalent states are then equal,
+so each one is explored once.
+
+A value pickRandomSample picks stays one of the values it can be for as
+long as every event that looks at it does the same thing whatever the value
+is. Only when an outcome depends on the value does the run fork, once per
+value. Until the powerName of Sprickan is chosen every state is one state
+and not one per name.
+
+What a scan or a timer does only depends on the few tags and keys its events,
+and the stations they go to, look at. Outcomes are kept as what they change,
+keyed on just that part of the state, so most moves are never run again.
+
+Like the client, events after a playAudio run when the audio has ended, after
+the opens of the station. We assume the player listens to the end before
+scanning the next station.
+"""
+from collections import deque
+from functools import lru_cache
+from time import perf_counter
+from json import dumps, loads
+from typing import NamedTuple, Tuple
+
+from .events import event_stations, walk_events
+
+# Stations the client treats as open whatever the open stations are
+ALWAYS_OPEN = ("-key", "qr-assemble", "checkin-slutstriden")
+
+# adHocData keys that powerNameChoice reads and writes
+POWER_NAME_KEY = "powerName"
+POWER_NAME_SET_KEY = "userHasSetPowerName"
+USER_ATTEMPTS_KEY = "attemptsAtPickingTheRightPowerName"
+GHOST_ATTEMPTS_KEY = "attemptsAtPickingTheGhostsPowerName"
+POWER_NAME_KEYS = (
+    POWER_NAME_KEY,
+    POWER_NAME_SET_KEY,
+    USER_ATTEMPTS_KEY,
+    GHOST_ATTEMPTS_KEY,
+)
+
+# The power name of the ghost is fixed in the client
+GHOST_POWER_NAME = ("sorg", "mane")
+
+# Stop exploring after this many states or seconds, whichever comes first,
+# and report what was found so far. Sprickan has about 350000 states, explore
+# it all with --max-states 0 --max-seconds 0.
+MAX_STATES = 100000
+MAX_SECONDS = 10
+
+# Actions that run another station right away
+GOES_TO_STATIONS = {"goToStation", "switchGotoStation", "powerNameChoice"}
+
+CHOICE_ACTIONS = {"choiceBasedOnTags", "choiceBasedOnAbsenceOfTags"}
+
+# adHocData keys whose value decides what an event does, by action
+READS_KEYS = {
+    "powerNameChoice": lambda event: POWER_NAME_KEYS,
+    "switchGotoStation": lambda event: [
+        parameters[name]
+        for parameters in (case["parameters"] for case in event["switch"])
+        for name in ("key", "firstKey", "secondKey")
+        if name in parameters
+    ],
+    # Whether the then event runs depends on the value
+    "playAudioBasedOnAdHocValue": lambda event: [event["key"]] if "then" in event else [],
+}
+
+
+class OneOf(NamedTuple):
+    """A picked value nothing has looked at yet, as the json of each value it can be"""
+
+    values: Tuple[str, ...]
+
+
+def encoded(value):
+    return dumps(value, sort_keys=True)
+
+
+@lru_cache(maxsize=None)
+def decoded(text):
+    """A json value from its text. Shared, so never change what you get."""
+    return loads(text)
+
+
+class State(NamedTuple):
+    current: str
+    open: frozenset
+    tags: frozenset
+    # Values as json text, or OneOf, so states are quick to make and compare
+    ad_hoc: Tuple[Tuple[str, str], ...]
+    timers: Tuple[Tuple[str, int], ...]
+    helped: frozenset
+
+
+class Outcome(NamedTuple):
+    """What a move changed. None for what it left alone."""
+
+    current: str
+    open: frozenset
+    tags: frozenset
+    # (key, value) pairs, a value of None removes the key
+    ad_hoc: tuple
+    timers: tuple
+    helped: frozenset
+    stations: frozenset
+    errors: tuple
+
+
+def _updated(pairs, changes):
+    if not changes:
+        return pairs
+    values = dict(pairs)
+    for key, value in changes:
+        if value is None:
+            values.pop(key, None)
+        else:
+            values[key] = value
+    return tuple(sorted(values.items()))
+
+
+def apply_outcome(state, outcome):
+    """The state after a move with outcome"""
+    return State(
+        current=outcome.current or state.current,
+        open=state.open if outcome.open is None else outcome.open,
+        tags=state.tags | outcome.tags if outcome.tags else state.tags,
+        ad_hoc=_updated(state.ad_hoc, outcome.ad_hoc),
+        timers=_updated(state.timers, outcome.timers),
+        helped=state.helped | outcome.helped if outcome.helped else state.helped,
+    )
+
+
+def js_string(value):
+    """String(value) in the client, for json values"""
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, list):
+        return ",".join("" if v is None else js_string(v) for v in value)
+    if isinstance(value, dict):
+        return "[object Object]"
+    return str(value)
+
+
+def js_equals_string(value, text):
+    """value == text in the client, for a json value and a string"""
+    if value is None:
+        return False
+    if isinstance(value, str):
+        return value == text
+    if isinstance(value, (bool, int, float)):
+        try:
+            return float(text.strip() or 0) == float(value)
+        except ValueError:
+            return False
+    return js_string(value) == text
+
+
+def relevant_keys(game):
+    """adHocData keys that events read back, the others never change what happens"""
+    keys = set()
+    for station in game.stations.values():
+        for event in station.events:
+            reads = READS_KEYS.get(event["action"])
+            if reads is not None:
+                keys.update(reads(event))
+    return keys
+
+
+def relevant_tags(game):
+    """Tags that choices look at"""
+    tags = set()
+    for station in game.stations.values():
+        for event in station.events:
+            if event["action"] in CHOICE_ACTIONS:
+                tags.update(event["tags"])
+    return tags
+
+
+class Run:
+    """What happens after one scan or timer, until nothing more does"""
+
+    def __init__(self, state):
+        self.current = state.current
+        self.open = state.open
+        self.tags = state.tags
+        self.ad_hoc = dict(state.ad_hoc)
+        self.timers = dict(state.timers)
+        self.helped = state.helped
+
+        # What the run changed, for its outcome
+        self.wrote_current = False
+        self.wrote_open = False
+        self.new_tags = set()
+        self.ad_hoc_writes = {}
+        self.timer_writes = {}
+        self.new_helped = set()
+
+        # Work to do right away, last in first out
+        self.stack = []
+        # Work to do when the audio playing now has ended, in order
+        self.deferred = deque()
+        self.stations = set()
+        self.errors = []
+
+    def fork(self):
+        run = Run.__new__(Run)
+        run.__dict__.update(self.__dict__)
+        for name in ("ad_hoc", "timers", "ad_hoc_writes", "timer_writes"):
+            setattr(run, name, dict(getattr(self, name)))
+        for name in ("new_tags", "new_helped", "stations"):
+            setattr(run, name, set(getattr(self, name)))
+        run.stack = list(self.stack)
+        run.deferred = deque(self.deferred)
+        run.errors = list(self.errors)
+        return run
+
+    def outcome(self):
+        return Outcome(
+            current=self.current if self.wrote_current else None,
+            open=frozenset(self.open) if self.wrote_open else None,
+            tags=frozenset(self.new_tags),
+            ad_hoc=tuple(self.ad_hoc_writes.items()),
+            timers=tuple(self.timer_writes.items()),
+            helped=frozenset(self.new_helped),
+            stations=frozenset(self.stations),
+            errors=tuple(self.errors),
+        )
+
+    def visit(self, station_id):
+        self.current = station_id
+        self.wrote_current = True
+        self.stations.add(station_id)
+
+    def set_open(self, station_ids):
+        self.open = frozenset(station_ids)
+        self.wrote_open = True
+
+    def add_tags(self, tags):
+        self.tags = self.tags.union(tags)
+        self.new_tags.update(tags)
+
+    def add_helped(self, station_id):
+        self.helped = self.helped | {station_id}
+        self.new_helped.add(station_id)
+
+    def set_value(self, key, text):
+        """Set an adHocData key to json text, or remove it with None"""
+        if text is None:
+            self.ad_hoc.pop(key, None)
+        else:
+            self.ad_hoc[key] = text
+        self.ad_hoc_writes[key] = text
+
+    def set_timer(self, name, index):
+        """Start the timer name running the event at index, or stop it with None"""
+        if index is None:
+            self.timers.pop(name, None)
+        else:
+            self.timers[name] = index
+        self.timer_writes[name] = index
+
+    def look(self, key, test, event):
+        """
+        What test says about the value of an adHocData key, None when it is not
+        set. Where the value is one of several and test does not say the same
+        for all of them, this run goes on with the first and forks that run
+        event again are made for the others. Returns the answer and the forks.
+        """
+        value = self.ad_hoc.get(key)
+        if value is None:
+            return test(None), []
+        if not isinstance(value, OneOf):
+            return test(decoded(value)), []
+
+        answers = {test(decoded(v)) for v in value.values}
+        if len(answers) == 1:
+            return answers.pop(), []
+
+        first, *others = value.values
+        forks = []
+        for other in others:
+            fork = self.fork()
+            fork.set_value(key, other)
+            fork.stack.append(("event", event))
+            forks.append(fork)
+        self.set_value(key, first)
+        return test(decoded(first)), forks
+
+    def go_to(self, station_id):
+        """Open only station_id and run it, like goToStation"""
+        self.set_open([station_id])
+        self.stack.append(("station", station_id))
+
+
+def _play_audio(explorer, run, event):
+    if "then" in event:
+        run.deferred.append(("event", event["then"]))
+
+
+def _play_audio_based_on_ad_hoc_value(explorer, run, event):
+    if "then" not in event:
+        return []
+    audio = event["audioFilenameMap"]
+    if event["key"] in run.ad_hoc:
+        plays, forks = run.look(event["key"], lambda v: bool(audio.get(js_string(v))), event)
+    else:
+        plays, forks = bool(audio.get("undefined")), []
+    # Nothing plays, and nothing more happens, without audio for the value
+    if plays:
+        run.deferred.append(("event", event["then"]))
+    return forks
+
+
+def _play_background_audio(explorer, run, event):
+    if "then" in event:
+        run.stack.append(("event", event["then"]))
+
+
+def _pick_random_sample(explorer, run, event):
+    key = event["key"]
+    if key not in explorer.keys:
+        return
+    values = list(dict.fromkeys(encoded(v) for v in event["population"]))
+    if values:
+        run.set_value(key, OneOf(tuple(values)) if len(values) > 1 else values[0])
+
+
+def _set_ad_hoc_data(explorer, run, event):
+    if event["key"] in explorer.keys:
+        run.set_value(event["key"], encoded(event["value"]))
+
+
+def _push_to_ad_hoc_array(explorer, run, event):
+    key = event["key"]
+    if key not in explorer.keys:
+        return []
+    text, forks = run.look(key, encoded, event)
+    run.set_value(key, encoded([*(decoded(text) or []), event["value"]]))
+    return forks
+
+
+def _start_timer(explorer, run, event):
+    if "then" in event:
+        run.set_timer(event["name"], explorer.indexes[id(event["then"])])
+
+
+def _cancel_timer(explorer, run, event):
+    run.set_timer(event.get("name"), None)
+
+
+def _choice_based_on_tags(explorer, run, event):
+    if all(tag in run.tags for tag in event["tags"]):
+        run.stack.append(("event", event["eventIfPresent"]))
+    else:
+        run.stack.append(("event", event["eventIfNotPresent"]))
+
+
+def _choice_based_on_absence_of_tags(explorer, run, event):
+    if any(tag in run.tags for tag in event["tags"]):
+        run.stack.append(("event", event["eventIfPresent"]))
+    else:
+        run.stack.append(("event", event["eventIfNotPresent"]))
+
+
+def _go_to_station(explorer, run, event):
+    run.go_to(event["toStation"])
+
+
+def _open_station(explorer, run, event):
+    run.set_open([event["toStation"]])
+
+
+def _open_stations(explorer, run, event):
+    run.set_open(event["toStations"])
+
+
+def _to_string(value):
+    """value?.toString() in the client"""
+    return None if value is None else js_string(value)
+
+
+def _switch_matches(run, case, event):
+    parameters = case["parameters"]
+    condition = case["condition"]
+    if condition in ("adHocKeysAreEqual", "adHocKeysAreNotEqual"):
+        first, forks = run.look(parameters["firstKey"], _to_string, event)
+        second, more = run.look(parameters["secondKey"], _to_string, event)
+        equal = first == second
+        return equal if condition == "adHocKeysAreEqual" else not equal, forks + more
+    if condition == "adHocKeyEquals":
+        key = parameters["key"]
+        # Like the client, which compares the value with the key
+        return run.look(key, lambda v: js_equals_string(v, key), event)
+    return False, []
+
+
+def _switch_goto_station(explorer, run, event):
+    forks = []
+    for case in event["switch"]:
+        matches, more = _switch_matches(run, case, event)
+        forks += more
+        if matches:
+            run.go_to(case["parameters"]["toStation"])
+            break
+    return forks
+
+
+def _picked_part(power_name, part):
+    """power_name[part] in the client"""
+    if isinstance(power_name, (list, str)) and 0 <= part < len(power_name):
+        return power_name[part]
+    return None
+
+
+def _power_name_choice(explorer, run, event):
+    part = event["part"]
+    ghost, forks = run.look(POWER_NAME_SET_KEY, lambda v: v is True, event)
+    attempts_key = GHOST_ATTEMPTS_KEY if ghost else USER_ATTEMPTS_KEY
+    # `tries === 0` with `tries = ... || 0` in the client
+    first_try, more = run.look(attempts_key, lambda v: v in (None, False, 0, ""), event)
+    forks += more
+
+    if ghost:
+        success = GHOST_POWER_NAME[part] == event["value"]
+    else:
+        success, more = run.look(
+            POWER_NAME_KEY,
+            lambda v: None if v is None else _picked_part(v, part) == event["value"],
+            event,
+        )
+        forks += more
+        if success is None:
+            # The client fails here and nothing more of this runs
+            run.errors.append(
+                f"[024] powerNameChoice at '{explorer.owners[id(event)]}' can run "
+                "before a powerName has been picked, which fails in the client."
+            )
+            run.stack.clear()
+            return forks
+
+    if success:
+        run.deferred.append(("powerName", (event, ghost, True)))
+    elif first_try:
+        run.set_value(attempts_key, encoded(1))
+    else:
+        run.deferred.append(("powerName", (event, ghost, False)))
+    return forks
+
+
+# What each action does to a run, by action. A handler can return forks of
+# the run for the other ways it can go.
+HANDLERS = {
+    "playAudio": _play_audio,
+    "playAudioBasedOnAdHocValue": _play_audio_based_on_ad_hoc_value,
+    "playBackgroundAudio": _play_background_audio,
+    "pickRandomSample": _pick_random_sample,
+    "setAdHocData": _set_ad_hoc_data,
+    "pushToAdHocArray": _push_to_ad_hoc_array,
+    "startTimer": _start_timer,
+    "cancelTimer": _cancel_timer,
+    "choiceBasedOnTags": _choice_based_on_tags,
+    "choiceBasedOnAbsenceOfTags": _choice_based_on_absence_of_tags,
+    "goToStation": _go_to_station,
+    "openStation": _open_station,
+    "openStations": _open_stations,
+    "switchGotoStation": _switch_goto_station,
+    "powerNameChoice": _power_name_choice,
+}
+
+
+class Exploration(NamedTuple):
+    states: list
+    # Indexes of the other states each state leads to
+    edges: list
+    # (index of the state before, what the player did) for each state
+    parents: list
+    reached: set
+    # (message, index of the state, what the player did) for each error
+    errors: list
+    # Why exploring stopped before every state was visited, empty if it did not
+    truncated: str
+
+
+class Explorer:
+    """Runs the events of a GameModel like the client does"""
+
+    def __init__(self, game, closed_scans=False):
+        self.game = game
+        self.closed_scans = closed_scans
+        self.keys = relevant_keys(game)
+        self.tags = relevant_tags(game)
+
+        # Timers refer to their events by index, so states stay hashable
+        self.events = []
+        self.indexes = {}
+        self.owners = {}
+        for station in game.stations.values():
+            for event in station.events:
+                self.indexes[id(event)] = len(self.events)
+                self.owners[id(event)] = station.id
+                self.events.append(event)
+
+        self.always_open = {s for s in ALWAYS_OPEN if s in game.stations}
+        self.reads = {}
+        self.outcomes = {}
+        self.open_moves = {}
+
+    def initial_state(self):
+        return State(
+            current=None,
+            open=frozenset(self.game.data.get("openStationsAtStart", [])),
+            tags=frozenset(),
+            ad_hoc=(),
+            timers=(),
+            helped=frozenset(),
+        )
+
+    def run_station(self, run, station_id):
+        station = self.game.stations.get(station_id)
+        if station is None:
+            return
+
+        first_open_visit = False
+        if station.type == "help" and station_id in run.open:
+            first_open_visit = station_id not in run.helped
+            run.add_helped(station_id)
+
+        # Tags count even when the station is closed
+        tags = self.tags.intersection(station.data.get("tags", ()))
+        if tags:
+            run.add_tags(tags)
+
+        if station_id not in run.open and station_id not in self.always_open:
+            return
+
+        run.visit(station_id)
+
+        if station.type == "help":
+            start_id = station.data.get("startStationId")
+            if first_open_visit and start_id:
+                run.go_to(start_id)
+        elif station.type in ("choice", "story"):
+            run.stack.append(("opens", station_id))
+            for event in reversed(station.data.get("events", [])):
+                run.stack.append(("event", event))
+
+    def apply_opens(self, run, station_id):
+        """Open what a station opens, unless its events took the player elsewhere"""
+        opens = self.game.stations[station_id].data.get("opens")
+        if (
+            run.current == station_id
+            and opens is not None
+            and not station_id.startswith("pick-")
+        ):
+            run.set_open(opens)
+
+    def power_name_outcome(self, run, event, ghost, success):
+        # 0 and not set are the same to the client
+        run.set_value(GHOST_ATTEMPTS_KEY if ghost else USER_ATTEMPTS_KEY, None)
+        if success:
+            opens = event["ghostOnSuccessOpen" if ghost else "onSuccessOpen"]
+            run.set_open(opens)
+            if event["part"] == 1:
+                if not ghost:
+                    run.set_value(POWER_NAME_SET_KEY, encoded(True))
+                if opens:
+                    run.stack.append(("station", opens[0]))
+        else:
+            run.go_to(
+                event["ghostOnSecondFailureGoTo" if ghost else "onSecondFailureGoTo"]
+            )
+
+    def finish(self, run):
+        """Do all the work of a run. Returns the finished run and its forks."""
+        finished = []
+        pending = [run]
+        while pending:
+            run = pending.pop()
+            while run.stack or run.deferred:
+                kind, item = run.stack.pop() if run.stack else run.deferred.popleft()
+                if kind == "event":
+                    handler = HANDLERS.get(item["action"])
+                    if handler is not None:
+                        pending.extend(handler(self, run, item) or ())
+                elif kind == "station":
+                    self.run_station(run, item)
+                elif kind == "opens":
+                    self.apply_opens(run, item)
+                elif kind == "powerName":
+                    self.power_name_outcome(run, *item)
+            finished.append(run)
+        return finished
+
+    def reads_of(self, move):
+        """
+        What the outcome of a move can depend on, as (tags, adHocData keys,
+        help stations), from the events and stations it can run.
+        """
+        if move in self.reads:
+            return self.reads[move]
+
+        kind, name, index = move
+        stations = [name] if kind == "scan" else []
+        events = [self.events[index]] if kind == "timer" else []
+        tags, keys, help_stations = set(), set(), set()
+        seen = set()
+        while stations or events:
+            if events:
+                for event in walk_events([events.pop()]):
+                    action = event["action"]
+                    if action in CHOICE_ACTIONS:
+                        tags.update(event["tags"])
+                    if action in READS_KEYS:
+                        keys.update(READS_KEYS[action](event))
+                    elif action == "pushToAdHocArray":
+                        keys.add(event["key"])
+                    if action in GOES_TO_STATIONS:
+                        stations.extend(event_stations(event))
+                continue
+
+            station = self.game.stations.get(stations.pop())
+            if station is None or station.id in seen:
+                continue
+            seen.add(station.id)
+            if station.type == "help":
+                help_stations.add(station.id)
+                if station.data.get("startStationId"):
+                    stations.append(station.data["startStationId"])
+            events.extend(station.data.get("events", []))
+
+        reads = (
+            frozenset(tags & self.tags),
+            tuple(sorted(keys & self.keys)),
+            frozenset(help_stations),
+        )
+        self.reads[move] = reads
+        return reads
+
+    def move_outcomes(self, state, move, ad_hoc, seen_outcomes=None):
+        """
+        The outcomes of a move from state, run once for each part of state it
+        reads. Outcomes run for the first time are also added to seen_outcomes.
+        """
+        tags, keys, help_stations = self.reads_of(move)
+        kind, name, index = move
+        key = (
+            move,
+            kind == "scan" and name in state.open,
+            tags & state.tags,
+            tuple(ad_hoc.get(k) for k in keys),
+            help_stations & state.helped,
+        )
+        outcomes = self.outcomes.get(key)
+        if outcomes is None:
+            run = Run(state)
+            if kind == "scan":
+                self.run_station(run, name)
+            else:
+                run.set_timer(name, None)
+                run.stack.append(("event", self.events[index]))
+            outcomes = [finished.outcome() for finished in self.finish(run)]
+            self.outcomes[key] = outcomes
+            if seen_outcomes is not None:
+                seen_outcomes.extend(outcomes)
+        return outcomes
+
+    def moves(self, state):
+        """What a player can do in state, as (kind, station or timer name, event index)"""
+        moves = self.open_moves.get((state.open, state.timers))
+        if moves is None:
+            scannable = (state.open & self.game.stations.keys()) | self.always_open
+            moves = [("scan", station_id, None) for station_id in sorted(scannable)]
+            moves += [("timer", name, index) for name, index in state.timers]
+            self.open_moves[(state.open, state.timers)] = moves
+
+        if self.closed_scans:
+            scannable = (state.open & self.game.stations.keys()) | self.always_open
+            moves = list(moves)
+            for station in self.game.stations.values():
+                if station.id in scannable:
+                    continue
+                # Only worth it for tags a choice looks at and the player lacks
+                if self.tags.intersection(station.data.get("tags", ())) - state.tags:
+                    moves.append(("scan", station.id, None))
+        return moves
+
+    def explore(self, max_states=MAX_STATES, max_seconds=MAX_SECONDS):
+        """
+        Visit every state a player can get to, breadth first, until there are
+        more than max_states or max_seconds have passed. 0 is no limit.
+        """
+        deadline = perf_counter() + max_seconds if max_seconds else None
+        initial = self.initial_state()
+        states = [initial]
+        seen = {initial: 0}
+        edges = []
+        parents = [(None, None)]
+        reached = set()
+        errors = {}
+        truncated = ""
+
+        while len(edges) < len(states):
+            index = len(edges)
+            if max_states and len(states) > max_states:
+                truncated = f"--max-states {max_states}"
+                break
+            if deadline and index % 1000 == 0 and perf_counter() > deadline:
+                truncated = f"--max-seconds {max_seconds}"
+                break
+            state = states[index]
+            ad_hoc = dict(state.ad_hoc)
+            following = set()
+            for move in self.moves(state):
+                # What an outcome reaches and breaks is the same every time,
+                # so it only needs looking at the first time it is run
+                new_outcomes = []
+                outcomes = self.move_outcomes(state, move, ad_hoc, new_outcomes)
+                for outcome in new_outcomes:
+                    reached.update(outcome.stations)
+                    for error in outcome.errors:
+                        errors.setdefault(error, (index, move))
+
+                for outcome in outcomes:
+                    new_state = apply_outcome(state, outcome)
+                    other = seen.get(new_state)
+                    if other is None:
+                        other = seen[new_state] = len(states)
+                        states.append(new_state)
+                        parents.append((index, move))
+                    if other != index:
+                        following.add(other)
+            edges.append(following)
+
+        return Exploration(
+            states=states,
+            edges=edges,
+            parents=parents,
+            reached=reached,
+            errors=[(message, *where) for message, where in errors.items()],
+            truncated=truncated,
+        )
+
+
+def explore_game(
+    game, closed_scans=False, max_states=MAX_STATES, max_seconds=MAX_SECONDS
+):
+    """Explore every playthrough of a GameModel"""
+    return Explorer(game, closed_scans).explore(max_states, max_seconds)
+
+
+def terminal_components(edges):
+    """
+    The strongly connected components of the state graph that no edge leaves,
+    as lists of state indexes. Tarjan's algorithm with an explicit stack.
+    """
+    index_of = {}
+    low = {}
+    on_stack = set()
+    stack = []
+    components = []
+
+    for root in range(len(edges)):
+        if root in index_of:
+            continue
+        work = [(root, iter(edges[root]))]
+        index_of[root] = low[root] = len(index_of)
+        stack.append(root)
+        on_stack.add(root)
+        while work:
+            node, following = work[-1]
+            for other in following:
+                if other >= len(edges):
+                    # Not explored, when exploring was cut short
+                    continue
+                if other not in index_of:
+                    index_of[other] = low[other] = len(index_of)
+                    stack.append(other)
+                    on_stack.add(other)
+                    work.append((other, iter(edges[other])))
+                    break
+                if other in on_stack:
+                    low[node] = min(low[node], index_of[other])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index_of[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+
+    terminal = []
+    for component in components:
+        members = set(component)
+        if all(other in members for node in component for other in edges[node]):
+            terminal.append(sorted(component))
+    return terminal
+
+
+def format_move(move):
+    kind, name, _ = move
+    return f"{kind} {name}"
+
+
+def path_to(exploration, index, move=None):
+    """What the player did to get to a state, and then move if given, as text"""
+    moves = [format_move(move)] if move else []
+    while exploration.parents[index][0] is not None:
+        index, earlier = exploration.parents[index]
+        moves.append(format_move(earlier))
+    return " > ".join(reversed(moves)) or "nothing"
+
+
+def default_endings(game):
+    """Stations that lead nowhere, where a game is meant to end"""
+    return {
+        station.id
+        for station in game.stations.values()
+        if station.type != "help" and not game.outgoing.get(station.id)
+    }
+
+
+def check_exploration(game, exploration, endings=None):
+    """
+    Yield messages about stations no playthrough reaches, events that fail
+    and places a player can get stuck or caught in a loop. Ending up at one of
+    endings is fine, by default those are the stations that lead nowhere.
+    """
+    endings = default_endings(game) if endings is None else set(endings)
+
+    if exploration.truncated:
+        yield (
+            f"[025] Stopped exploring at {exploration.truncated}, after {len(exploration.edges)} of at least {len(exploration.states)} game states. "
+            "The results are partial: what is reported is real, but unreached stations are not checked and more stuck places and loops may go unreported."
+        )
+
+    for message, index, move in exploration.errors:
+        yield f"{message} Playthrough: {path_to(exploration, index, move)}"
+
+    if not exploration.truncated:
+        for station in game.stations.values():
+            # Help stations do their job when scanned closed
+            if station.id not in exploration.reached and station.type != "help":
+                yield f"[021] The station '{station.id}' is not reached in any playthrough."
+
+    reported = set()
+    for component in terminal_components(exploration.edges):
+        stations = sorted(
+            {exploration.states[i].current or "the start" for i in component}
+        )
+        if endings.intersection(stations) or tuple(stations) in reported:
+            continue
+        reported.add(tuple(stations))
+
+        path = path_to(exploration, component[0])
+        if len(component) == 1:
+            yield f"[022] A player can get stuck at '{stations[0]}' with nothing to scan that changes anything. Playthrough: {path}"
+        else:
+            names = ", ".join(f"'{s}'" for s in stations)
+            yield f"[023] A player can get caught going between {names} without reaching an ending. Playthrough: {path}"
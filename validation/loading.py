@@ -0,0 +1,81 @@
+import os
+from json import dump, load
+from json.decoder import JSONDecodeError
+from pathlib import Path
+
+
+class GameLoadError(Exception):
+    """A game that can not be loaded, with a message like "[006] ..." """
+
+    def __init__(self, message, filename):
+        super().__init__(message)
+        self.filename = filename
+
+
+def load_json_file(path, invalid, missing):
+    """The json in the file at path, or GameLoadError with one of the messages"""
+    try:
+        with open(path, encoding="utf-8") as handle:
+            return load(handle)
+    except FileNotFoundError:
+        raise GameLoadError(missing, path)
+    except JSONDecodeError:
+        raise GameLoadError(invalid, path)
+
+
+def load_complete_game(filename):
+    """
+    load a gameconfig from file name + stations files
+
+    return complete gameconfig (with stations data added)
+
+    Raises GameLoadError when a file is missing or not valid JSON.
+    """
+    data = load_json_file(
+        filename,
+        f"[007] Game config file at path {filename} is not valid JSON.",
+        f"[030] Game config file at path {filename} does not exist.",
+    )
+
+    for station_path in data["stationPaths"]:
+        path = Path(filename).parent.joinpath(station_path)
+        station_data = load_json_file(
+            path,
+            f"[006] Station file at path '{path}' is not valid JSON.",
+            f"[028] Station file at path '{path}' does not exist.",
+        )
+        if not isinstance(station_data, dict) or "id" not in station_data:
+            raise GameLoadError(
+                f"[029] Station file at path '{path}' has no station id.", path
+            )
+
+        station_id = station_data["id"]
+        data["stations"][station_id] = station_data
+        data["stations"][station_id]["filePath"] = path.as_posix()
+    return data
+
+
+def write_complete_game(data, filename, output_dir):
+    """
+    Write a complete game, as returned by load_complete_game for the gameconfig
+    at filename, to output_dir as a gameconfig and station files laid out the
+    same way as the original.
+    """
+    output_dir = Path(output_dir)
+    root = Path(filename).parent
+
+    gameconfig = {k: v for k, v in data.items() if k != "stations"}
+    gameconfig["stations"] = {}
+
+    output_dir.mkdir(parents=True, exist_ok=True)
+    with open(output_dir / Path(filename).name, "w", encoding="utf-8") as handle:
+        dump(gameconfig, handle, indent=2, ensure_ascii=False)
+
+    for station in data["stations"].values():
+        station = dict(station)
+        station_path = output_dir / os.path.relpath(station.pop("filePath"), root)
+        station_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(station_path, "w", encoding="utf-8") as handle:
+            dump(station, handle, indent=2, ensure_ascii=False)
+
+    return output_dir / Path(filename).name
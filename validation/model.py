@@ -0,0 +1,139 @@
+"""
+An in memory model of a complete game.
+
+load_complete_game gives us nested dicts straight from the json files. The
+GameModel is built from that once per invocation and has the indexes that our
+tasks keep asking for: stations by id and by type, every event of a station in
+a flat list, the edges between stations and the audio each station refers to.
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+from .events import event_stations, walk_events
+from .references import station_audio_references
+from .loading import load_complete_game
+
+
+@dataclass
+class Station:
+    id: str
+    type: str
+    file_path: str
+    data: dict
+    events: List[dict]
+    opens: Tuple[str, ...]
+    edges: Tuple[str, ...]
+    audio: Tuple[str, ...]
+
+
+@dataclass
+class GameModel:
+    filename: str
+    data: dict
+    stations: Dict[str, Station]
+    stations_by_type: Dict[str, List[Station]] = field(default_factory=dict)
+    outgoing: Dict[str, Tuple[str, ...]] = field(default_factory=dict)
+
+    @property
+    def name(self):
+        return self.data["name"]
+
+    @property
+    def root(self):
+        """The folder all paths in the game are relative to"""
+        return Path(self.filename).parent
+
+    @property
+    def choice_infix(self):
+        return self.data["choiceInfix"]
+
+    @property
+    def choice_stations(self):
+        return self.stations_by_type.get("choice", [])
+
+    @property
+    def edges(self):
+        """All (from, to) pairs of station ids"""
+        return [(src, dst) for src, dsts in self.outgoing.items() for dst in dsts]
+
+    def audio_references(self):
+        """Every audio filename referenced from the game, each one once"""
+        references = dict.fromkeys(self.data.get("globalAudioFilenames", {}).values())
+        for station in self.stations.values():
+            references.update(dict.fromkeys(station.audio))
+        return list(references)
+
+    def entry_station_ids(self):
+        """
+        Ids of the stations a player can scan. Per station choice stations are
+        replaced by the global choice stations.
+        """
+        station_ids = [s for s in self.stations if self.choice_infix not in s]
+
+        # Add global choice stations
+        for choice in self.data["choiceNames"]:
+            station_ids.append(f"{self.choice_infix}{choice}")
+        return station_ids
+
+
+def build_station(data):
+    """Build a Station from the raw station data"""
+    events = list(walk_events(data.get("events", [])))
+
+    edges = list(data.get("opens", []))
+    if data["type"] == "help":
+        edges.append(data["startStationId"])
+    for event in events:
+        edges.extend(event_stations(event))
+
+    return Station(
+        id=data["id"],
+        type=data["type"],
+        file_path=data.get("filePath", ""),
+        data=data,
+        events=events,
+        opens=tuple(data.get("opens", [])),
+        edges=tuple(edges),
+        audio=tuple(station_audio_references(data)),
+    )
+
+
+def build_game_model(filename, data):
+    """Build a GameModel from what load_complete_game returned"""
+    stations = {
+        station_id: build_station(station_data)
+        for station_id, station_data in data["stations"].items()
+    }
+
+    stations_by_type = defaultdict(list)
+    for station in stations.values():
+        stations_by_type[station.type].append(station)
+
+    return GameModel(
+        filename=filename,
+        data=data,
+        stations=stations,
+        stations_by_type=dict(stations_by_type),
+        outgoing={station_id: s.edges for station_id, s in stations.items()},
+    )
+
+
+@lru_cache(maxsize=None)
+def _cached_game_model(path):
+    return build_game_model(path, load_complete_game(path))
+
+
+def get_game_model(filename):
+    """
+    The GameModel for the gameconfig at filename. It is loaded once and shared
+    by everyone who asks for it during this invocation.
+    """
+    return _cached_game_model(Path(filename).as_posix())
+
+
+def forget_game_models():
+    """Throw away loaded models, e.g. when the game files have changed"""
+    _cached_game_model.cache_clear()
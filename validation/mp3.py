@@ -0,0 +1,274 @@
+"""
+Read what we need to know about an MP3 file from its headers.
+
+Files are memory mapped and only the ID3 tags, the four byte header of each
+frame and the Xing/Info or VBRI header in the first frame are looked at. The
+audio itself is never decoded. From that we get the duration, bitrate and
+sample rate, and we can tell if a file is not an MP3 at all, is cut off in
+the middle of a frame, or changes format half way through.
+"""
+import mmap
+import os
+from hashlib import sha256
+
+# Indexed by the version bits of a frame header, None is reserved
+VERSIONS = ["2.5", None, "2", "1"]
+
+# Indexed by the layer bits of a frame header, None is reserved
+LAYERS = [None, 3, 2, 1]
+
+SAMPLE_RATES = {
+    "1": [44100, 48000, 32000],
+    "2": [22050, 24000, 16000],
+    "2.5": [11025, 12000, 8000],
+}
+
+# kbit/s, indexed by the bitrate bits. 0 is free format, which we do not support.
+BITRATES = {
+    ("1", 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    ("1", 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    ("1", 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    ("2", 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    ("2", 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    ("2", 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+
+# How far into a file we look for the first frame
+MAX_LEADING_JUNK = 64 * 1024
+
+
+def parse_frame_header(data, pos):
+    """
+    The frame header at pos as a dict, or None if there is no valid header
+    there.
+    """
+    if pos + 4 > len(data):
+        return None
+    b0, b1, b2, b3 = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+    if b0 != 0xFF or b1 & 0xE0 != 0xE0:
+        return None
+
+    version = VERSIONS[(b1 >> 3) & 3]
+    layer = LAYERS[(b1 >> 1) & 3]
+    bitrate_index = (b2 >> 4) & 0xF
+    sample_rate_index = (b2 >> 2) & 3
+    if version is None or layer is None:
+        return None
+    if bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    table_version = "1" if version == "1" else "2"
+    bitrate = BITRATES[(table_version, layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][sample_rate_index]
+    padding = (b2 >> 1) & 1
+
+    if layer == 1:
+        samples = 384
+        length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 3 and version != "1":
+        samples = 576
+        length = 72 * bitrate // sample_rate + padding
+    else:
+        samples = 1152
+        length = 144 * bitrate // sample_rate + padding
+
+    return {
+        "version": version,
+        "layer": layer,
+        "crc": not b1 & 1,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "mono": (b3 >> 6) & 3 == 3,
+        "samples": samples,
+        "length": length,
+    }
+
+
+def id3v2_end(data, pos=0):
+    """Where the audio starts, after any ID3v2 tags at pos"""
+    while data[pos : pos + 3] == b"ID3" and pos + 10 <= len(data):
+        flags = data[pos + 5]
+        size = 0
+        for byte in data[pos + 6 : pos + 10]:
+            size = (size << 7) | (byte & 0x7F)
+        pos += 10 + size + (10 if flags & 0x10 else 0)
+    return pos
+
+
+def trailing_tags_start(data):
+    """Where the audio ends, before any ID3v1 and APEv2 tags at the end"""
+    end = len(data)
+    if end >= 128 and data[end - 128 : end - 125] == b"TAG":
+        end -= 128
+    if end >= 32 and data[end - 32 : end - 24] == b"APETAGEX":
+        size = int.from_bytes(data[end - 20 : end - 16], "little")
+        flags = int.from_bytes(data[end - 12 : end - 8], "little")
+        end -= size + (32 if flags & 0x80000000 else 0)
+    return max(end, 0)
+
+
+def find_frame(data, pos, end):
+    """The position of the first frame at or after pos that is followed by another frame"""
+    limit = min(end, pos + MAX_LEADING_JUNK)
+    while pos < limit:
+        pos = data.find(b"\xff", pos, limit)
+        if pos == -1:
+            return None
+        header = parse_frame_header(data, pos)
+        if header:
+            next_pos = pos + header["length"]
+            if next_pos >= end or parse_frame_header(data, next_pos):
+                return pos
+        pos += 1
+    return None
+
+
+def vbr_frame_count(data, pos, header):
+    """The number of frames from a Xing/Info or VBRI header in the first frame, if any"""
+    if header["version"] == "1":
+        side_info = 17 if header["mono"] else 32
+    else:
+        side_info = 9 if header["mono"] else 17
+    xing = pos + 4 + (2 if header["crc"] else 0) + side_info
+
+    if data[xing : xing + 4] in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing + 4 : xing + 8], "big")
+        if flags & 1:
+            return int.from_bytes(data[xing + 8 : xing + 12], "big")
+    if data[pos + 36 : pos + 40] == b"VBRI":
+        return int.from_bytes(data[pos + 50 : pos + 54], "big")
+    return None
+
+
+def read_mp3(data):
+    """
+    Walk the frames of an MP3 file. Returns a dict with what we found and a
+    list of problems.
+    """
+    problems = []
+    start = id3v2_end(data)
+    end = trailing_tags_start(data)
+
+    pos = find_frame(data, start, end)
+    if pos is None:
+        return None, ["is not an MP3 file, it has no MPEG audio frames"]
+
+    first = parse_frame_header(data, pos)
+    tagged_frames = vbr_frame_count(data, pos, first)
+    if tagged_frames is not None:
+        # The Xing/Info frame is silent and not counted
+        pos += first["length"]
+
+    frames = 0
+    samples = 0
+    audio_bytes = 0
+    bitrates = set()
+    junk = 0
+    while pos < end:
+        header = parse_frame_header(data, pos)
+        if header is None:
+            resynced = find_frame(data, pos + 1, end)
+            if resynced is None:
+                junk += end - pos
+                break
+            junk += resynced - pos
+            pos = resynced
+            continue
+
+        if (
+            header["version"] != first["version"]
+            or header["layer"] != first["layer"]
+            or header["sample_rate"] != first["sample_rate"]
+            or header["mono"] != first["mono"]
+        ):
+            problems.append(
+                f"changes format at byte {pos}, from {describe(first)} to {describe(header)}"
+            )
+            break
+
+        if pos + header["length"] > end:
+            problems.append(
+                f"is cut off, the last frame is missing {pos + header['length'] - end} bytes"
+            )
+            break
+
+        frames += 1
+        samples += header["samples"]
+        audio_bytes += header["length"]
+        bitrates.add(header["bitrate"])
+        pos += header["length"]
+
+    if junk:
+        problems.append(f"has {junk} bytes between frames that are not audio")
+    if tagged_frames is not None and tagged_frames != frames and not problems:
+        problems.append(f"has {frames} frames but its header says {tagged_frames}")
+    if frames == 0:
+        problems.append("has no complete audio frames")
+
+    duration = samples / first["sample_rate"]
+    if len(bitrates) == 1:
+        # What it was encoded at, some encoders never pad so the average is lower
+        (bitrate,) = bitrates
+    else:
+        bitrate = round(audio_bytes * 8 / duration) if duration else 0
+    info = {
+        "format": describe(first),
+        "sampleRate": first["sample_rate"],
+        "channels": 1 if first["mono"] else 2,
+        "frames": frames,
+        "duration": round(duration, 3),
+        "bitrate": bitrate,
+        "vbr": len(bitrates) > 1,
+    }
+    return info, problems
+
+
+def audio_frames(data):
+    """
+    The position of the first audio frame of an MP3 file, after any tags and
+    Xing/Info frame, and where the audio ends. None if there are no frames.
+    """
+    start = id3v2_end(data)
+    end = trailing_tags_start(data)
+    pos = find_frame(data, start, end)
+    if pos is None:
+        return None
+    first = parse_frame_header(data, pos)
+    if vbr_frame_count(data, pos, first) is not None:
+        pos += first["length"]
+    return pos, end
+
+
+def silent_frame(data, pos):
+    """A frame of silence in the format and bitrate of the frame at pos"""
+    # No CRC and no padding, and all zero side info and audio data is silence
+    header = bytes([0xFF, data[pos + 1] | 1, data[pos + 2] & ~2 & 0xFF, data[pos + 3]])
+    length = parse_frame_header(header, 0)["length"]
+    return header + bytes(length - 4)
+
+
+def describe(header):
+    channels = "mono" if header["mono"] else "stereo"
+    return f"MPEG-{header['version']} layer {header['layer']} {header['sample_rate']} Hz {channels}"
+
+
+def scan_audio_file(path):
+    """
+    Metadata for an audio file: byte size and sha256 for any file, and what
+    read_mp3 finds for MP3 files. Returns (metadata, problems).
+    """
+    size = os.path.getsize(path)
+    metadata = {"bytes": size}
+    if size == 0:
+        metadata["hash"] = sha256().hexdigest()
+        return metadata, ["is empty"]
+
+    with open(path, "rb") as handle:
+        with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            metadata["hash"] = sha256(data).hexdigest()
+            if not str(path).lower().endswith(".mp3"):
+                return metadata, []
+
+            info, problems = read_mp3(data)
+    metadata.update(info or {})
+    return metadata, problems
@@ -0,0 +1,140 @@
+"""
+Compile station events into flat programs.
+
+Each station's nested events are lowered into a list of ops. Sub events become
+numeric jumps into that list: `next` for `then` and one key per branch, e.g.
+`eventIfPresent`. Station ids and audio filenames are interned into tables
+shared by the whole game, so ops refer to them by index.
+
+Indexes into "stations" from definedStations and up are ids that are referred
+to but not defined by any station. A compiled game looks like this:
+
+    {
+        "version": 1,
+        "definedStations": 56,
+        "stations": ["checkin-start", ...],
+        "audio": ["./level-0-start/checkin-start.mp3", ...],
+        "programs": {
+            "checkin-start": {"entry": [0, 2], "opens": [3], "ops": [...]},
+            ...
+        }
+    }
+"""
+from copy import deepcopy
+
+from .events import (
+    BRANCHES,
+    rewrite_event_audio,
+    rewrite_event_stations,
+    walk_events,
+)
+
+PROGRAM_VERSION = 1
+
+PROGRAM_FILENAME = "game-program.json"
+
+# Jump target meaning "nothing more to do"
+END = -1
+
+
+class Interner:
+    """Hands out a stable index for each distinct value"""
+
+    def __init__(self, values=()):
+        self.values = []
+        self.indexes = {}
+        for value in values:
+            self(value)
+
+    def __call__(self, value):
+        if value not in self.indexes:
+            self.indexes[value] = len(self.values)
+            self.values.append(value)
+        return self.indexes[value]
+
+
+def compile_station(station, stations, audio):
+    """Compile the events of a station into a program"""
+    events = station.get("events", [])
+
+    # Ops are numbered in the order walk_events visits the events
+    indexes = {id(event): i for i, event in enumerate(walk_events(events))}
+
+    ops = []
+    for event in walk_events(events):
+        branch_keys = BRANCHES.get(event["action"], ())
+        op = deepcopy(
+            {k: v for k, v in event.items() if k != "then" and k not in branch_keys}
+        )
+        for key in branch_keys:
+            if key in event:
+                op[key] = indexes[id(event[key])]
+        op["next"] = indexes[id(event["then"])] if "then" in event else END
+
+        rewrite_event_audio(op, audio)
+        rewrite_event_stations(op, stations)
+        ops.append(op)
+
+    program = {
+        "entry": [indexes[id(event)] for event in events],
+        "opens": [stations(s) for s in station.get("opens", [])],
+        "ops": ops,
+    }
+    if "startStationId" in station:
+        program["startStationId"] = stations(station["startStationId"])
+    return program
+
+
+def compile_game(data):
+    """Compile the events of every station of a complete game"""
+    # Defined stations come first so that an index >= len(data["stations"]) is dangling
+    stations = Interner(data["stations"])
+    audio = Interner()
+
+    programs = {
+        station_id: compile_station(station, stations, audio)
+        for station_id, station in data["stations"].items()
+    }
+    return {
+        "version": PROGRAM_VERSION,
+        "definedStations": len(data["stations"]),
+        "stations": stations.values,
+        "audio": audio.values,
+        "programs": programs,
+    }
+
+
+def _station_indexes(op):
+    """Station indexes an op refers to"""
+    found = []
+    rewrite_event_stations(deepcopy(op), lambda s: found.append(s) or s)
+    return found
+
+
+def check_compiled_game(compiled):
+    """Yield messages about jumps and references that go nowhere"""
+    defined = compiled["definedStations"]
+    stations = compiled["stations"]
+
+    for station_id, program in compiled["programs"].items():
+        ops = program["ops"]
+
+        for index in program["entry"]:
+            if not 0 <= index < len(ops):
+                yield f"[014] Entry {index} of the program of station '{station_id}' is not an op."
+
+        for i, op in enumerate(ops):
+            jumps = [op["next"]] + [
+                op[k] for k in BRANCHES.get(op["action"], ()) if k in op
+            ]
+            for target in jumps:
+                if target != END and not 0 <= target < len(ops):
+                    yield f"[014] Op {i} of the program of station '{station_id}' jumps to {target}, which is not an op."
+
+            for index in _station_indexes(op):
+                if index >= defined:
+                    yield f"[015] Op {i} of the program of station '{station_id}' refers to the station '{stations[index]}', which does not exist."
+
+        for index in program["opens"]:
+            if index >= defined:
+                yield f"[015] The station '{station_id}' opens the station '{stations[index]}', which does not exist."
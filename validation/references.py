@@ -0,0 +1,66 @@
+"""
+Find the files and stations that a game, a station or an event refers to.
+"""
+import posixpath
+from copy import deepcopy
+
+from .events import event_audio, rewrite_event_audio, walk_events
+
+
+def audio_file(reference):
+    """
+    The file an audio reference plays from. Audio sprites refer to a segment
+    of a file as file#t=start,end.
+    """
+    return reference.split("#", 1)[0]
+
+
+def audio_path(reference):
+    """
+    The file an audio reference plays from, relative to the game folder and
+    spelled the same way however the reference spells it, like ./a.mp3 and
+    a.mp3. Compare references to the same file with this.
+    """
+    return posixpath.normpath(audio_file(reference))
+
+
+def event_audio_references(event):
+    """Yield the audio filenames referenced by an event and its sub events"""
+    for sub_event in walk_events([event]):
+        yield from event_audio(sub_event)
+
+
+def station_audio_references(station):
+    """Yield the audio filenames referenced by a station"""
+    yield from station.get("helpAudioFilenames", [])
+    for event in station.get("events", []):
+        yield from event_audio_references(event)
+
+
+def game_audio_references(game):
+    """Yield the audio filenames referenced anywhere in a complete game"""
+    yield from game.get("globalAudioFilenames", {}).values()
+    for station in game["stations"].values():
+        yield from station_audio_references(station)
+
+
+def rewrite_audio_references(game, rewrite):
+    """
+    Return a copy of a complete game where every audio filename is replaced
+    with rewrite(filename)
+    """
+    game = deepcopy(game)
+
+    global_audio = game.get("globalAudioFilenames", {})
+    for key, audiofile_base in global_audio.items():
+        global_audio[key] = rewrite(audiofile_base)
+
+    for station in game["stations"].values():
+        if "helpAudioFilenames" in station:
+            station["helpAudioFilenames"] = [
+                rewrite(a) for a in station["helpAudioFilenames"]
+            ]
+        for event in walk_events(station.get("events", [])):
+            rewrite_event_audio(event, rewrite)
+
+    return game
@@ -0,0 +1,138 @@
+"""
+Process wide registry of compiled json schema validators.
+
+Every schema in ./schemas is read from disk once, all of them are put in a
+shared RefResolver store so that references between schema files never hit the
+file system again, and each Draft7Validator is built once and then reused.
+
+If fastjsonschema is installed we also generate python code for each schema.
+That code only answers "is this valid?" but it does so a lot faster than
+jsonschema, so we only fall back to jsonschema to collect the actual errors.
+"""
+from functools import lru_cache
+from hashlib import sha256
+from json import loads
+from pathlib import Path
+
+from jsonschema import Draft7Validator, RefResolver
+
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
+
+
+SCHEMA_DIR = Path(__file__).parent / "schemas"
+
+# Our schemas reference each other with uris relative to the validation folder
+BASE_URI = f"file://{Path(__file__).parent.as_posix()}/"
+
+
+@lru_cache(maxsize=None)
+def _schema_bytes(name):
+    """Raw bytes of a schema file"""
+    return (SCHEMA_DIR / name).read_bytes()
+
+
+@lru_cache(maxsize=None)
+def load_schema(name):
+    """Load a schema from the schemas folder, e.g. 'station.json'"""
+    return loads(_schema_bytes(name))
+
+
+def schema_names():
+    """Names of all schema files we ship"""
+    return sorted(p.name for p in SCHEMA_DIR.glob("*.json"))
+
+
+@lru_cache(maxsize=None)
+def schema_hash(name):
+    """Content hash of a schema file"""
+    return sha256(_schema_bytes(name)).hexdigest()
+
+
+@lru_cache(maxsize=None)
+def _resolver_store():
+    """All our schemas keyed on every uri they can be referenced by"""
+    store = {}
+    for name in schema_names():
+        schema = load_schema(name)
+        store[f"{BASE_URI}schemas/{name}"] = schema
+        store[(SCHEMA_DIR / name).as_uri()] = schema
+    return store
+
+
+@lru_cache(maxsize=None)
+def get_validator(name):
+    """A reusable Draft7Validator for the given schema"""
+    schema = load_schema(name)
+    resolver = RefResolver(BASE_URI, schema, store=_resolver_store())
+    return Draft7Validator(schema, resolver=resolver)
+
+
+def _inline_refs(node, name):
+    """
+    Return a copy of a schema where every reference to another schema file is
+    replaced with a local reference. The definitions of the other files are
+    collected in `definitions`.
+    """
+    definitions = {}
+
+    def walk(node):
+        if isinstance(node, list):
+            return [walk(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+
+        result = {}
+        for key, value in node.items():
+            if key == "$ref" and str(value).startswith("file:"):
+                other, _, pointer = value[len("file:") :].partition("#")
+                other_name = Path(other).name
+                if other_name != name:
+                    for def_name, definition in load_schema(other_name)[
+                        "definitions"
+                    ].items():
+                        definitions.setdefault(def_name, definition)
+                result[key] = f"#{pointer}"
+            else:
+                result[key] = walk(value)
+        return result
+
+    inlined = walk(node)
+    for def_name, definition in definitions.items():
+        inlined.setdefault("definitions", {}).setdefault(def_name, definition)
+    return inlined
+
+
+@lru_cache(maxsize=None)
+def get_fast_validator(name):
+    """
+    A code generated validator for the given schema, or None if fastjsonschema
+    is not available or can not compile the schema.
+    """
+    if fastjsonschema is None:
+        return None
+
+    schema = _inline_refs(load_schema(name), name)
+    # The $id would make fastjsonschema try to resolve local refs remotely
+    schema.pop("$id", None)
+
+    try:
+        # use_default=False, we never want validation to modify the data
+        return fastjsonschema.compile(schema, use_default=False)
+    except fastjsonschema.JsonSchemaDefinitionException:
+        return None
+
+
+def iter_errors(name, instance):
+    """Iterate over the validation errors of instance against the named schema"""
+    fast_validator = get_fast_validator(name)
+    if fast_validator is not None:
+        try:
+            fast_validator(instance)
+            return iter(())
+        except fastjsonschema.JsonSchemaException:
+            pass
+
+    return get_validator(name).iter_errors(instance)
@@ -0,0 +1,186 @@
+"""
+Reporting validation messages.
+
+Validation yields messages like "[005] The audiofile ... does not exist." as it
+finds them. A reporter writes each one out right away, as text for humans or
+as json lines or SARIF for CI and editors, and stops validation by raising
+TooManyErrors once --max-errors has been reached.
+"""
+import re
+import sys
+from json import dumps
+
+# Messages with these codes are warnings, everything else is an error
+WARNING_CODES = {"013", "025"}
+
+CODE_PATTERN = re.compile(r"^\[(\d{3})\]\s*")
+
+# What each code means, for SARIF rules
+CODE_DESCRIPTIONS = {
+    "001": "Invalid choice station name in opens",
+    "002": "Missing help audio file",
+    "003": "Missing audio file in audioFilenameMap",
+    "004": "Missing background audio file",
+    "005": "Missing audio file",
+    "006": "Station file is not valid JSON",
+    "007": "Game config file is not valid JSON",
+    "008": "Schema validation error",
+    "009": "Station id does not match file name",
+    "010": "Inconsistent help options",
+    "011": "Missing powerNameChoice audio file",
+    "012": "Missing powerNameChoice keys",
+    "013": "Audio file is never referenced",
+    "014": "Event program jumps to a missing op",
+    "015": "Event program refers to a missing station",
+    "016": "Opened station does not exist",
+    "017": "Invalid choice station id",
+    "018": "Audio file is corrupt or not an MP3",
+    "019": "Audio file has an unsupported sample rate",
+    "020": "Audio file is unexpectedly large or long",
+    "021": "Station is not reached in any playthrough",
+    "022": "Playthrough gets stuck",
+    "023": "Playthrough loops without reaching an ending",
+    "024": "Event fails at runtime in some playthrough",
+    "025": "Playthrough exploration stopped at the state or time limit",
+    "026": "Missing global help audio file",
+    "027": "Station could not be checked any further",
+    "028": "Station file does not exist",
+    "029": "Station file has no station id",
+    "030": "Game config file does not exist",
+}
+
+
+class TooManyErrors(Exception):
+    """Raised by a reporter when max_errors errors have been reported"""
+
+
+def split_code(message):
+    """Split "[005] The audiofile ..." into ("005", "The audiofile ...")"""
+    match = CODE_PATTERN.match(message)
+    if match is None:
+        return None, message
+    return match.group(1), message[match.end() :]
+
+
+class Reporter:
+    """Writes messages to a stream and keeps count"""
+
+    def __init__(self, stream=None, max_errors=None):
+        self.stream = stream or sys.stdout
+        self.max_errors = max_errors
+        self.error_count = 0
+        self.warning_count = 0
+
+    def report(self, message, filename=None):
+        code, text = split_code(message)
+        level = "warning" if code in WARNING_CODES else "error"
+        if level == "error":
+            self.error_count += 1
+        else:
+            self.warning_count += 1
+
+        self.write(message, code, text, level, filename)
+
+        if self.max_errors and self.error_count >= self.max_errors:
+            raise TooManyErrors()
+
+    def report_all(self, messages, filename=None):
+        for message in messages:
+            self.report(message, filename)
+
+    def write(self, message, code, text, level, filename):
+        raise NotImplementedError
+
+    def close(self):
+        self.stream.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+
+class TextReporter(Reporter):
+    """Messages as they are, one per line"""
+
+    def write(self, message, code, text, level, filename):
+        print(message, file=self.stream, flush=True)
+
+
+class JsonLinesReporter(Reporter):
+    """One json object per message and line"""
+
+    def write(self, message, code, text, level, filename):
+        entry = {
+            "code": code,
+            "level": level,
+            "file": str(filename) if filename else None,
+            "message": text,
+        }
+        print(dumps(entry, ensure_ascii=False), file=self.stream, flush=True)
+
+
+class SarifReporter(Reporter):
+    """A SARIF 2.1.0 log, written when validation is done"""
+
+    def __init__(self, stream=None, max_errors=None):
+        super().__init__(stream, max_errors)
+        self.results = []
+
+    def write(self, message, code, text, level, filename):
+        result = {
+            "ruleId": code or "000",
+            "level": level,
+            "message": {"text": text},
+        }
+        if filename:
+            result["locations"] = [
+                {"physicalLocation": {"artifactLocation": {"uri": str(filename)}}}
+            ]
+        self.results.append(result)
+
+    def close(self):
+        rule_ids = sorted({r["ruleId"] for r in self.results})
+        log = {
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "version": "2.1.0",
+            "runs": [
+                {
+                    "tool": {
+                        "driver": {
+                            "name": "saga-validation",
+                            "rules": [
+                                {
+                                    "id": rule_id,
+                                    "shortDescription": {
+                                        "text": CODE_DESCRIPTIONS.get(rule_id, "")
+                                    },
+                                }
+                                for rule_id in rule_ids
+                            ],
+                        }
+                    },
+                    "results": self.results,
+                }
+            ],
+        }
+        self.stream.write(dumps(log, indent=2, ensure_ascii=False))
+        self.stream.write("\n")
+        super().close()
+
+
+REPORTERS = {
+    "text": TextReporter,
+    "jsonl": JsonLinesReporter,
+    "sarif": SarifReporter,
+}
+
+
+def make_reporter(format="text", output=None, max_errors=None):
+    """
+    A reporter for the given format writing to output, a filename, or stdout.
+    Raises ValueError for a format we do not know.
+    """
+    if format not in REPORTERS:
+        raise ValueError(
+            f"Unknown format '{format}', use one of {', '.join(REPORTERS)}."
+        )
+    stream = open(output, "w", encoding="utf-8") if output else None
+    return REPORTERS[format](stream=stream, max_errors=max_errors)
@@ -1,64 +1,33 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
-from jsonschema import Draft7Validator, RefResolver
 from json import load
 
-from json.decoder import JSONDecodeError
-
 # from json.decode import JSONDecodeError
 from pprint import pprint
 
+from .assets import asset_index_for
+from .audio_metadata import audio_file_messages, game_audio_metadata
+from .events import POWER_NAME_AUDIO_KEYS, event_audio, walk_events
+from .model import get_game_model
+from .cache import load_cache, save_cache, station_cache_key, validation_context_hash
+from .registry import iter_errors
+from .reporting import TextReporter
 
-def load_complete_game(filename):
-    """
-    load a gameconfig from file name + stations files
-
-    return complete gameconfig (with stations data added)
 
-    """
-    with open(filename) as handle:
-        try:
-            data = load(handle)
-            # except JSONDecodeError as err:
-        except JSONDecodeError:
-            print(
-                f"[007] Game config file at path {filename} is not valid JSON. Terminating validation."
-            )
-            exit()
-
-    for station_path in data["stationPaths"]:
-        path = Path(filename).parent.joinpath(station_path)
-
-        try:
-            with open(path) as handle:
-                try:
-                    station_data = load(handle)
-                # except JSONDecodeError as err:
-                except JSONDecodeError:
-                    print(
-                        f"[006] Station file at path '{path}' is not valid JSON. Terminating validation."
-                    )
-                    exit()
-        except FileNotFoundError:
-            print(f"Station file at path '{path}' does not exists.")
-
-        station_id = station_data["id"]
-        data["stations"][station_id] = station_data
-        data["stations"][station_id]["filePath"] = path.as_posix()
-    return data
-
-
-def validate_stations_in_folder_helper(folder, exit_on_errors=False):
+def validate_stations_in_folder_helper(folder, exit_on_errors=False, reporter=None):
     """
     Validate all json files in given folder
 
     If exit_on_error only print errors of first file that does not validate, then exit
     """
+    reporter = reporter or TextReporter()
 
     filenames = [fn for fn in Path(folder).iterdir() if fn.as_posix().endswith(".json")]
     for filename in filenames:
         errors = validate_station_file(filename)
         if errors:
-            output_validation_errors(errors, filename)
+            reporter.report_all(format_validation_errors(errors, filename), filename)
             if exit_on_errors:
                 exit()
             errors = None
@@ -66,14 +35,10 @@ def validate_stations_in_folder_helper(folder, exit_on_errors=False):
 
 def validate_schema_helper(filename):
     """Validate a json schema itself."""
-    with open("./validation/schemas/jsonschema-draft-v7.json") as handle:
-        schema = load(handle)
-
     with open(filename) as handle:
         json_to_check = load(handle)
 
-    validator = Draft7Validator(schema)
-    errors = [e for e in validator.iter_errors(json_to_check)]
+    errors = [e for e in iter_errors("jsonschema-draft-v7.json", json_to_check)]
     output_validation_errors(errors, filename)
 
 
@@ -90,13 +55,19 @@ def _output_validation_errors(errors, filename):
         print()
 
 
+def format_validation_errors(errors, filename):
+    """Format validation errors and filename as output lines"""
+    count = len(errors)
+    return [
+        f"[008] {filename} has {count} errors.|{error.validator}|{error.path}|{error.message}"
+        for error in errors
+    ]
+
+
 def output_validation_errors(errors, filename):
     """Output validation errors and filename for human consumption"""
-    if errors:
-        for error in errors:
-            print(
-                f"[008] {filename} has {len(errors)} errors.|{error.validator}|{error.path}|{error.message}"
-            )
+    for line in format_validation_errors(errors, filename):
+        print(line)
 
 
 def validate_station_file(filename):
@@ -116,93 +87,63 @@ def validate_station_file_and_output_errors(filename):
 
 def validate_station(station):
     """Validate a station against our schema a return a list of errors"""
+    return [e for e in iter_errors("station.json", station)]
 
-    schemafile = "./validation/schemas/station.json"
-    with open(schemafile) as handle:
-        schema = load(handle)
-
-    # Get the project folder
-    base_uri = f"file://{Path(__file__).parents[0].as_posix()}/"
 
-    # So that we can correctly resolve references to local files in our schema
-    resolver = RefResolver(base_uri, schema)
-    validator = Draft7Validator(schema, resolver=resolver)
+# Code of the message for a missing audio file, by action of the referencing event
+MISSING_AUDIO_CODES = {
+    "playAudio": "005",
+    "playBackgroundAudio": "004",
+    "powerNameChoice": "011",
+    "playAudioBasedOnAdHocValue": "003",
+}
 
-    return [e for e in validator.iter_errors(station)]
 
+def deep_validation_of_events(station, events, filename, assets=None):
+    """
+    Yield messages about events that json schema can not give us. events is a
+    flat list of events and sub events, like Station.events of the GameModel.
+    """
 
-def deep_validation_of_event(station, event, filename):
-
+    assets = assets or asset_index_for(filename)
     station_id = station["id"]
     station_filepath = station["filePath"]
 
-    # Check that station_id is same as in file name
-    if station_id not in station_filepath:
-        print(
-            f"[009] Station id '{station_id}' of station defined in '{station_filepath}' does not match file name.  "
-        )
+    for sub_event in events:
 
-    # Check for existance of main audio
-    if event["action"] == "playAudio":
-        for audiofile_base in event["audioFilenames"]:
-            audiofile_path = Path(filename).parent.joinpath(audiofile_base)
+        # Check that station_id is same as in file name
+        if station_id not in station_filepath:
+            yield f"[009] Station id '{station_id}' of station defined in '{station_filepath}' does not match file name.  "
 
-            if not audiofile_path.exists():
-                print(
-                    f"[005] The audiofile '{audiofile_base}' referenced from station '{station_id}' defined in {station_filepath}, does not exist."
-                )
-    # Check for existance of background audio
-    if event["action"] == "playBackgroundAudio":
-        audiofile_base = event["audioFilename"]
+        # powerNameChoice needs all of its audio
+        if sub_event["action"] == "powerNameChoice" and not all(
+            key in sub_event for key in POWER_NAME_AUDIO_KEYS
+        ):
+            yield f"[012] missing keys in {station_filepath}  "
 
-        audiofile_path = Path(filename).parent.joinpath(audiofile_base)
+        # Check for existance of audio
+        code = MISSING_AUDIO_CODES.get(sub_event["action"], "005")
+        for audiofile_base in event_audio(sub_event):
+            if not assets.exists(audiofile_base):
+                yield f"[{code}] The audiofile '{audiofile_base}' referenced from station '{station_id}' defined in {station_filepath}, does not exist."
 
-        if not audiofile_path.exists():
-            print(
-                f"[004] The audiofile '{audiofile_base}' referenced from station '{station_id}' defined in {station_filepath}, does not exist."
-            )
 
-    # Check for existance of audioFiles specific to powerNameChoice
-    if event["action"] == "powerNameChoice":
-        try:
-            for audiofile_base in [
-                event["onSuccessPlay"],
-                event["onFirstFailurePlay"],
-                event["onSecondFailurePlay"],
-                event["ghostOnSuccessPlay"],
-                event["ghostOnFirstFailurePlay"],
-                event["ghostOnSecondFailurePlay"],
-            ]:
-                audiofile_path = Path(filename).parent.joinpath(audiofile_base)
-                if not audiofile_path.exists():
-                    print(
-                        f"[011] The audiofile '{audiofile_base}' referenced from station '{station_id}' defined in {station_filepath}, does not exist."
-                    )
-        except KeyError as error:
-            print(f"[012] missing keys in {station_filepath}  ")
-    # Check that this files exist
-    if event["action"] == "playAudioBasedOnAdHocValue":
-        for audiofile_base in event["audioFilenameMap"].values():
-            audiofile_path = Path(filename).parent.joinpath(audiofile_base)
-            if not audiofile_path.exists():
-                print(
-                    f"[003] The audiofile '{audiofile_base}' referenced from station '{station_id}' defined in {station_filepath}, does not exist."
-                )
-
-    # Recurse into choiceBasedOnTags
-    if event["action"] == "choiceBasedOnTags":
-        deep_validation_of_event(station, event["eventIfPresent"], filename)
-        deep_validation_of_event(station, event["eventIfNotPresent"], filename)
-
-    # Check the next level events
-    if "then" in event:
-        next_level_event = event["then"]
-        deep_validation_of_event(station, next_level_event, filename)
-
-
-def deep_validation_of_station(gameconfig, station, station_ids, filename):
-    """Validate stuff about a station that json schema can not give us"""
+def deep_validation_of_event(station, event, filename, assets=None):
+    """Yield messages about an event and its sub events that json schema can not give us"""
+    yield from deep_validation_of_events(
+        station, walk_events([event]), filename, assets
+    )
 
+
+def deep_validation_of_station(
+    gameconfig, station, station_ids, filename, assets=None, events=None
+):
+    """
+    Yield messages about a station that json schema can not give us. Pass the
+    flattened events if you have them, otherwise the station is walked here.
+    """
+
+    assets = assets or asset_index_for(filename)
     choice_infix = gameconfig["choiceInfix"]
     station_id = station["id"]
     station_filepath = station["filePath"]
@@ -210,11 +151,8 @@ def deep_validation_of_station(gameconfig, station, station_ids, filename):
     # Check for existance of help audio
     if "helpAudioFilenames" in station:
         for audiofile_base in station["helpAudioFilenames"]:
-            audiofile_path = Path(filename).parent.joinpath(audiofile_base)
-            if not audiofile_path.exists():
-                print(
-                    f"[002] The help audiofile '{audiofile_base}' referenced from station '{station_id}' defined in {station_filepath}, does not exist."
-                )
+            if not assets.exists(audiofile_base):
+                yield f"[002] The help audiofile '{audiofile_base}' referenced from station '{station_id}' defined in {station_filepath}, does not exist."
 
     # If a stations opens choice files make sure they have valid names.
     if "opens" in station:
@@ -224,105 +162,244 @@ def deep_validation_of_station(gameconfig, station, station_ids, filename):
         ]
         for choice_station in [s for s in station["opens"] if choice_infix in s]:
             if choice_station not in valid_choice_station_names:
-
-                print(
-                    f"[001] '{choice_station}' referenced from {station_id} is not a valid choice station name"
-                )
+                yield f"[001] '{choice_station}' referenced from {station_id} is not a valid choice station name"
 
     if station["type"] in ["story", "choice"]:
-        for event in station["events"]:
-            deep_validation_of_event(station, event, filename)
+        if events is None:
+            events = walk_events(station["events"])
+        yield from deep_validation_of_events(station, events, filename, assets)
 
         # check that all references stations exist
 
         if "opens" in station:
             for station_open_id in station["opens"]:
                 if station_open_id not in station_ids:
-                    print(
-                        f"The station  '{station_open_id}' referenced from station '{station_id}' defined in {station['filePath']}, does not exist."
-                    )
+                    yield f"[016] The station  '{station_open_id}' referenced from station '{station_id}' defined in {station['filePath']}, does not exist."
+
+
+def validate_station_in_game(station):
+    """
+    Validate a station against our schema and check that it has consistent help
+    options. Yield messages.
+    """
+    station_filename = station["filePath"]
+    yield from format_validation_errors(validate_station(station), station_filename)
+
+    # Validate that any station that has helpAudioFilenames also have helpCost and vice versa.
+    # I could not figure out how to do this in JSON schema. But it should be possible.
+    has_help_cost = "helpCost" in station
+    has_help_audio_files = "helpAudioFilenames" in station
+
+    if has_help_cost != has_help_audio_files:
+        yield f"[010] The station in '{station_filename}'  has inconsistent help options. If helpAudioFilenames is defined helpCost must be defined too."
+
+
+def validate_choice_station_id(gameconfig, station):
+    """Yield a message if a choice station does not have a valid id"""
+    if station["type"] != "choice":
+        return
+
+    station_id = station["id"]
+    station_filepath = station["filePath"]
+    choice_infix = gameconfig["choiceInfix"]
+
+    choice = station_id.split("-")[-1]
+
+    invalid_choice_name = choice not in gameconfig["choiceNames"]
+
+    last_part_should_be = choice_infix + choice
+
+    last_part_is_not_correct = not station_id.endswith(last_part_should_be)
+
+    if choice_infix not in station_id or invalid_choice_name or last_part_is_not_correct:
+        yield f"[017] The station id '{station_id}' defined in {station_filepath}, is not valid for a choice station."
 
 
 def validate_gameconfig_helper(filename):
     """Validate a given game config file. Not the entire game"""
 
-    schemafile = "./validation/schemas/game.json"
-    with open(schemafile) as handle:
-        schema = load(handle)
-
     with open(filename) as handle:
         json_to_check = load(handle)
 
-    validator = Draft7Validator(schema)
+    return [e for e in iter_errors("game.json", json_to_check)]
+
+
+def validate_global_audio(gameconfig, filename, assets):
+    """Yield a message for each global audio file that does not exist"""
+    for key, audiofile_base in gameconfig["globalAudioFilenames"].items():
+        if not assets.exists(audiofile_base):
+            yield f"[026] The audiofile '{audiofile_base}' referenced from 'globalHelpAudio.{key}' in {filename}  does not exist. "
+
+
+def unreferenced_audio_message(filename, audiofile_base):
+    return f"[013] The audiofile '{audiofile_base}' in {Path(filename).parent} is not referenced from the game."
+
+
+# Set in each worker process by _init_station_worker
+_worker_context = None
+
+
+def _init_station_worker(gameconfig, station_ids, filename, assets):
+    """Give a worker process what it needs to validate stations"""
+    global _worker_context
+    _worker_context = (gameconfig, station_ids, filename, assets)
+
+
+def _validate_station_pass(pass_index, station):
+    """
+    Run one of the per station passes that validate_game_helper makes on a
+    Station of the GameModel. Returns a list of messages.
+    """
+    gameconfig, station_ids, filename, assets = _worker_context
+    return validate_station_pass(
+        pass_index,
+        gameconfig,
+        station.data,
+        station_ids,
+        filename,
+        assets,
+        events=station.events,
+    )
+
+
+def validate_station_pass(
+    pass_index, gameconfig, station, station_ids, filename, assets, events=None
+):
+    """
+    Run one of the per station passes on a station. Returns a list of messages.
+    events are the flattened events of the station, if they are at hand.
+    """
+    if pass_index == 0:
+        messages = validate_station_in_game(station)
+    elif pass_index == 1:
+        messages = validate_choice_station_id(gameconfig, station)
+    else:
+        messages = deep_validation_of_station(
+            gameconfig, station, station_ids, filename, assets, events
+        )
+    return list(messages)
+
 
-    return [e for e in validator.iter_errors(json_to_check)]
+STATION_PASSES = 3
 
 
-def validate_game_helper(filename):
+def validate_game_helper(
+    filename, jobs=1, use_cache=True, reporter=None, check_audio=True
+):
     """
     Validate a complete game consisting of a gameconfig, multiple station files and multiple audio files.
 
     Also do some checks that are hard to do with json schema
-    """
 
-    # load all game data
-    data = load_complete_game(filename)
-    gameconfig = data
+    Messages are handed to the reporter as soon as they are found, by default
+    they are printed. When the reporter raises TooManyErrors validation stops
+    right away.
 
-    # validate game config
-    errors = validate_gameconfig_helper(filename)
-    output_validation_errors(errors, filename)
+    With jobs > 1 the stations are validated in that many worker processes.
+    Output is the same, and in the same order, as when validating serially.
 
-    stations = data["stations"]
-    station_ids = data["stations"].keys()
+    With use_cache results for stations whose inputs have not changed since the
+    last run are taken from the validation cache.
 
-    # check that globalHelpAudio files exist
-    for key, audiofile_base in data["globalAudioFilenames"].items():
-        audiofile_path = Path(filename).parent.joinpath(audiofile_base)
-        if not audiofile_path.exists():
-            print(
-                f"[009] The audiofile '{audiofile_base}' referenced from 'globalHelpAudio.{key}' in {filename}  does not exist. "
-            )
+    With check_audio the headers of every referenced audio file are read to
+    find files that are corrupt, have the wrong sample rate or are too big.
 
-    # validate all individual stations against the station schema
-    for station_id in station_ids:
-        station = stations[station_id]
-        errors = validate_station(station)
-        station_filename = station["filePath"]
-        output_validation_errors(errors, station_filename)
-
-        # Validate that any station that has helpAudioFilenames also have helpCost and vice versa.
-        # I could not figure out how to do this in JSON schema. But it should be possible.
-        has_help_cost = "helpCost" in station
-        has_help_audio_files = "helpAudioFilenames" in station
-
-        if has_help_cost != has_help_audio_files:
-            print(
-                f"[010] The station in '{station_filename}'  has inconsistent help options. If helpAudioFilenames is defined helpCost must be defined too."
-            )
+    Finally audio files in the game folder that are never referenced are reported.
+    """
+    reporter = reporter or TextReporter()
 
-    # check that any choice stations have valid ids
-    for station in [s for s in stations.values() if s["type"] == "choice"]:
-        station_id = station["id"]
-        station_filepath = station["filePath"]
-        choice_infix = data["choiceInfix"]
+    # load all game data. The model has walked every event once, everything
+    # below uses its flattened events and audio references.
+    game = get_game_model(filename)
+    data = game.data
 
-        choice = station_id.split("-")[-1]
+    # One scan of the game folder to resolve all audio references against
+    assets = asset_index_for(filename)
 
-        invalid_choice_name = choice not in data["choiceNames"]
+    # validate game config
+    errors = validate_gameconfig_helper(filename)
+    reporter.report_all(format_validation_errors(errors, filename), filename)
 
-        last_part_should_be = choice_infix + choice
+    stations = data["stations"]
+    station_ids = set(stations.keys())
 
-        last_part_is_not_correct = not station_id.endswith(last_part_should_be)
+    # check that globalHelpAudio files exist
+    reporter.report_all(validate_global_audio(data, filename, assets), filename)
+
+    # Workers only need the game config, not the stations
+    gameconfig = {k: v for k, v in data.items() if k != "stations"}
+    initargs = (gameconfig, station_ids, filename, assets)
+
+    # Look up stations whose results we already have
+    cache = load_cache(filename) if use_cache else {}
+    context_hash = validation_context_hash(gameconfig, filename)
+
+    keys = {
+        station_id: station_cache_key(context_hash, station, station_ids, assets.exists)
+        for station_id, station in game.stations.items()
+    }
+    results = {}
+    for station_id, key in keys.items():
+        entry = cache.get(stations[station_id]["filePath"])
+        if entry is not None and entry["key"] == key:
+            results[station_id] = entry["passes"]
+
+    to_validate = [s for s in game.stations.values() if s.id not in results]
+    for station in to_validate:
+        results[station.id] = []
+
+    executor = None
+    if jobs > 1 and len(to_validate) > 1:
+        executor = ProcessPoolExecutor(
+            max_workers=jobs, initializer=_init_station_worker, initargs=initargs
+        )
+    else:
+        _init_station_worker(*initargs)
+
+    try:
+        # One pass at a time, in station order.
+        for pass_index in range(STATION_PASSES):
+            validate_pass = partial(_validate_station_pass, pass_index)
+            if executor:
+                chunksize = max(1, len(to_validate) // (jobs * 4))
+                validated = executor.map(validate_pass, to_validate, chunksize=chunksize)
+            else:
+                validated = map(validate_pass, to_validate)
+            validated = iter(validated)
+
+            for station_id, station in stations.items():
+                if len(results[station_id]) == pass_index:
+                    results[station_id].append(next(validated))
+                reporter.report_all(results[station_id][pass_index], station["filePath"])
+    finally:
+        if executor:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    if use_cache:
+        save_cache(
+            filename,
+            {
+                station["filePath"]: {
+                    "key": keys[station_id],
+                    "passes": results[station_id],
+                }
+                for station_id, station in stations.items()
+            },
+        )
 
-        if (
-            choice_infix not in station_id
-            or invalid_choice_name
-            or last_part_is_not_correct
-        ):
-            print(
-                f"The station id '{station_id}' defined in {station_filepath}, is not valid for a choice station."
+    if check_audio:
+        root = Path(filename).parent
+        metadata = game_audio_metadata(
+            data, filename, workers=jobs, references=game.audio_references()
+        )
+        for reference, scanned in metadata.items():
+            reporter.report_all(
+                audio_file_messages(reference, scanned, filename), root / reference
             )
 
-    for station in stations.values():
-        deep_validation_of_station(gameconfig, station, station_ids, filename)
+    # Report audio files that no one will ever hear
+    for audiofile_base in assets.unreferenced_audio_files(game.audio_references()):
+        reporter.report(
+            unreferenced_audio_message(filename, audiofile_base),
+            Path(filename).parent / audiofile_base,
+        )
@@ -0,0 +1,320 @@
+"""
+Keep a game validated while it is being edited.
+
+A GameWatcher loads a game and validates it once, then keeps the station data,
+the asset index and the messages of every station in memory. The game folder
+is polled for files that were added, changed or removed, and only what they
+affect is validated again:
+
+- a changed station file is reloaded and validated
+- stations that refer to an audio file that appeared or disappeared
+- stations that open a station whose id appeared or disappeared
+- the headers of audio files that were added or changed, or that a station
+  refers to now, are read again, like validate-game does
+- everything, if the gameconfig itself changed
+
+Schemas are compiled once by the registry and stay compiled between updates.
+"""
+import os
+import posixpath
+import time
+from pathlib import Path
+
+from .assets import AssetIndex
+from .audio_metadata import audio_file_messages, scan_audio_files
+from .loading import GameLoadError, load_json_file
+from .references import audio_file, station_audio_references
+from .validation import (
+    STATION_PASSES,
+    format_validation_errors,
+    unreferenced_audio_message,
+    validate_gameconfig_helper,
+    validate_global_audio,
+    validate_station_pass,
+)
+
+
+def scan(root):
+    """Modification time and size of every file below root, and None for every folder"""
+    snapshot = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        rel_dir = Path(dirpath).relative_to(root).as_posix()
+        for dirname in dirnames:
+            snapshot[posixpath.normpath(posixpath.join(rel_dir, dirname))] = None
+        for name in filenames:
+            try:
+                stat = os.stat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue
+            key = posixpath.normpath(posixpath.join(rel_dir, name))
+            snapshot[key] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def load_station_file(path):
+    """Load a station file. Returns the station, or None and a message."""
+    try:
+        station = load_json_file(
+            path,
+            f"[006] Station file at path '{path}' is not valid JSON.",
+            f"[028] Station file at path '{path}' does not exist.",
+        )
+    except GameLoadError as err:
+        return None, str(err)
+
+    if not isinstance(station, dict) or "id" not in station:
+        return None, f"[029] Station file at path '{path}' has no station id."
+
+    station["filePath"] = Path(path).as_posix()
+    return station, None
+
+
+class GameWatcher:
+    """The validation state of a game, kept up to date with the files on disk"""
+
+    def __init__(self, filename):
+        self.filename = Path(filename)
+        self.root = self.filename.parent
+        self.config_key = self.filename.name
+        self.reload()
+
+    def reload(self):
+        """Load and validate everything"""
+        self.snapshot = scan(self.root)
+        self.assets = AssetIndex(self.root)
+
+        # Messages about the gameconfig, and per station file
+        self.config_messages = []
+        self.station_messages = {}
+        self.stations = {}
+        self.audio = {}
+        self.audio_references = {}
+
+        # Messages about the headers of each audio file the game refers to
+        self.audio_messages = {}
+
+        try:
+            data = load_json_file(
+                self.filename,
+                f"[007] Game config file at path {self.filename} is not valid JSON.",
+                f"[030] Game config file at path {self.filename} does not exist.",
+            )
+        except GameLoadError as err:
+            self.gameconfig = None
+            self.station_paths = []
+            self.config_messages = [str(err)]
+            return
+
+        self.gameconfig = {k: v for k, v in data.items() if k != "stations"}
+        self.station_paths = [
+            posixpath.normpath(p) for p in self.gameconfig.get("stationPaths", [])
+        ]
+        self.config_messages = self.validate_config()
+
+        for path in self.station_paths:
+            self.load_station(path)
+        for path in self.station_paths:
+            self.validate_station(path)
+        self.check_audio(self.game_audio(), workers=None)
+
+    def validate_config(self):
+        errors = validate_gameconfig_helper(self.filename)
+        messages = format_validation_errors(errors, self.filename)
+        if "globalAudioFilenames" in self.gameconfig:
+            messages += validate_global_audio(self.gameconfig, self.filename, self.assets)
+        return messages
+
+    def load_station(self, path):
+        station, message = load_station_file(self.root / path)
+        self.stations[path] = station
+        self.audio_references[path] = list(station_audio_references(station or {}))
+        self.audio[path] = set(
+            self.assets.normalize(a) for a in self.audio_references[path]
+        )
+        if message:
+            self.station_messages[path] = [message]
+
+    def game_audio(self):
+        """The audio files the game refers to, named and ordered as by validate-game"""
+        references = list(
+            (self.gameconfig or {}).get("globalAudioFilenames", {}).values()
+        )
+        for path in self.station_paths:
+            references += self.audio_references.get(path, [])
+        return list(dict.fromkeys(audio_file(r) for r in references))
+
+    def check_audio(self, references, workers=1):
+        """Read the headers of audio files again and keep the messages about them"""
+        existing = [r for r in references if (self.root / r).is_file()]
+        scanned = scan_audio_files([self.root / r for r in existing], workers)
+        for reference in references:
+            self.audio_messages[reference] = []
+        for reference in existing:
+            scan = scanned[self.root / reference]
+            self.audio_messages[reference] = list(
+                audio_file_messages(reference, scan, self.filename)
+            )
+
+    def station_ids(self):
+        return {s["id"] for s in self.stations.values() if s is not None}
+
+    def validate_station(self, path, station_ids=None):
+        station = self.stations[path]
+        if station is None:
+            return
+
+        station_ids = station_ids if station_ids is not None else self.station_ids()
+        messages = []
+        try:
+            for pass_index in range(STATION_PASSES):
+                messages += validate_station_pass(
+                    pass_index,
+                    self.gameconfig,
+                    station,
+                    station_ids,
+                    self.filename,
+                    self.assets,
+                )
+        except (KeyError, TypeError, AttributeError) as err:
+            # A station that does not even have the shape the checks expect
+            messages.append(
+                f"[027] {station['filePath']} could not be checked any further: {err!r}"
+            )
+        self.station_messages[path] = messages
+
+    def messages(self):
+        """All current messages, gameconfig first, then stations in game order"""
+        messages = list(self.config_messages)
+        for path in self.station_paths:
+            messages += self.station_messages.get(path, [])
+        for reference in self.game_audio():
+            messages += self.audio_messages.get(reference, [])
+
+        if self.gameconfig is not None:
+            references = set(
+                self.assets.normalize(a)
+                for a in self.gameconfig.get("globalAudioFilenames", {}).values()
+            )
+            for audio in self.audio.values():
+                references |= audio
+            messages += [
+                unreferenced_audio_message(self.filename, a)
+                for a in self.assets.unreferenced_audio_files(references)
+            ]
+        return messages
+
+    def changes(self):
+        """Paths that were added, changed or removed since the last scan"""
+        snapshot = scan(self.root)
+        added = snapshot.keys() - self.snapshot.keys()
+        removed = self.snapshot.keys() - snapshot.keys()
+        changed = {
+            path
+            for path in snapshot.keys() & self.snapshot.keys()
+            if snapshot[path] != self.snapshot[path]
+        }
+        self.snapshot = snapshot
+        return added, changed, removed
+
+    def update(self):
+        """
+        Bring the state up to date with the files on disk. Returns the set of
+        paths that changed, empty if nothing did.
+        """
+        added, changed, removed = self.changes()
+        touched = added | changed | removed
+        if not touched:
+            return touched
+
+        if self.config_key in touched:
+            self.reload()
+            return touched
+
+        # Keep the asset index in line with the files
+        for path in added:
+            self.assets.add(path, is_dir=self.snapshot[path] is None)
+        for path in removed:
+            self.assets.discard(path)
+
+        # Files that appeared or disappeared change what references resolve to
+        appeared_or_gone = added | removed
+
+        old_ids = self.station_ids()
+        station_paths = set(self.station_paths)
+        reloaded = touched & station_paths
+        for path in reloaded:
+            self.station_messages.pop(path, None)
+            self.load_station(path)
+        station_ids = self.station_ids()
+        changed_ids = old_ids ^ station_ids
+
+        affected = set(reloaded)
+        for path, station in self.stations.items():
+            if station is None:
+                continue
+            if self.audio[path] & appeared_or_gone:
+                affected.add(path)
+            elif changed_ids & set(station.get("opens", [])):
+                affected.add(path)
+
+        for path in self.station_paths:
+            if path in affected:
+                self.validate_station(path, station_ids)
+
+        global_audio = {
+            self.assets.normalize(a)
+            for a in (self.gameconfig or {}).get("globalAudioFilenames", {}).values()
+        }
+        if global_audio & appeared_or_gone:
+            self.config_messages = self.validate_config()
+
+        # Audio that changed on disk, and audio a station refers to now
+        references = self.game_audio()
+        self.check_audio(
+            [
+                r
+                for r in references
+                if r not in self.audio_messages or self.assets.normalize(r) in touched
+            ]
+        )
+        for reference in set(self.audio_messages) - set(references):
+            del self.audio_messages[reference]
+
+        return touched
+
+
+def diff_messages(before, after):
+    """Messages that went away and messages that are new, in order"""
+    before_set = set(before)
+    after_set = set(after)
+    fixed = [m for m in before if m not in after_set]
+    new = [m for m in after if m not in before_set]
+    return fixed, new
+
+
+def watch(filename, interval=0.2, output=print):
+    """Validate a game, then keep printing what changes in its messages until interrupted"""
+    started = time.perf_counter()
+    watcher = GameWatcher(filename)
+    messages = watcher.messages()
+    for message in messages:
+        output(message)
+    output(
+        f"{len(messages)} messages in {(time.perf_counter() - started) * 1000:.0f} ms. Watching {watcher.root} for changes."
+    )
+
+    while True:
+        time.sleep(interval)
+        started = time.perf_counter()
+        if not watcher.update():
+            continue
+
+        previous, messages = messages, watcher.messages()
+        fixed, new = diff_messages(previous, messages)
+        for message in fixed:
+            output(f"- {message}")
+        for message in new:
+            output(f"+ {message}")
+        output(
+            f"{len(messages)} messages, {len(fixed)} fixed, {len(new)} new, in {(time.perf_counter() - started) * 1000:.0f} ms."
+        )